@@ -1,9 +1,20 @@
+import asyncio
+import hashlib
 import json
-from typing import Any, Dict, List, Optional, Tuple
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
 
 from .config import settings
+from .http_client import iter_completion_deltas
+from .llm_limiter import PRIORITY_BACKGROUND, PRIORITY_NOTES, estimate_message_tokens, llm_limiter
+from .notes_cache import TranscriptKey, notes_cache
+from .single_flight import SingleFlight
+from .transcript_chunking import split_transcript
+
+logger = logging.getLogger(__name__)
 
 
 SYSTEM_NOTES = (
@@ -80,7 +91,99 @@ SYSTEM_PRESCRIPTION = (
 )
 
 
+SYSTEM_COMBINED = (
+    "You are an expert clinical scribe AI. From a doctor-patient consultation transcript you produce BOTH "
+    "comprehensive medical notes and structured prescription information in a single JSON object.\n\n"
+    "GUIDELINES:\n"
+    "• Extract information ONLY from what is explicitly stated in the transcript\n"
+    "• Do not infer, assume, or hallucinate any medical information\n"
+    "• Use null for missing prescription fields, not empty strings\n\n"
+    "REQUIRED JSON STRUCTURE:\n"
+    "{\n"
+    '  "notes_markdown": "markdown notes with the sections listed below",\n'
+    '  "diagnoses": ["condition1", "condition2"],\n'
+    '  "medications": [{"name": "", "dose": "", "route": "", "frequency": "", "duration": "", "notes": ""}],\n'
+    '  "advice": "brief lifestyle or care instructions",\n'
+    '  "follow_up": "follow-up instructions or next appointment"\n'
+    "}\n\n"
+    "notes_markdown MUST use these headings, writing 'Not mentioned' for empty sections:\n"
+    "## 1. CHIEF COMPLAINT\n## 2. HISTORY OF PRESENT ILLNESS\n## 3. PAST MEDICAL HISTORY\n## 4. MEDICATIONS\n"
+    "## 5. PHYSICAL EXAMINATION FINDINGS\n## 6. ASSESSMENT AND PLAN\n## 7. PATIENT EDUCATION\n## 8. SUMMARY\n\n"
+    "Return ONLY the JSON object, no additional text or explanations."
+)
+
+
+SYSTEM_CHUNK_FINDINGS = (
+    "You are an expert clinical scribe AI. You receive ONE segment of a longer doctor-patient consultation transcript. "
+    "Extract every clinically relevant fact stated in this segment as concise bullet points under these headings: "
+    "CHIEF COMPLAINT, HISTORY OF PRESENT ILLNESS, PAST MEDICAL HISTORY, MEDICATIONS (with dose, route, frequency, duration), "
+    "PHYSICAL EXAMINATION FINDINGS, ASSESSMENT AND PLAN, PATIENT EDUCATION, DIAGNOSES, ADVICE, FOLLOW-UP.\n\n"
+    "• Extract information ONLY from what is explicitly stated in the segment\n"
+    "• Omit headings with nothing to report\n"
+    "• Do not write prose, summaries or disclaimers"
+)
+
+# Header for the merged findings that replace a long transcript in the reduce step
+MERGED_FINDINGS_HEADER = (
+    "The following are clinical findings extracted, in order, from consecutive segments of ONE long "
+    "doctor-patient consultation. Segments overlap slightly, so merge duplicate findings.\n\n"
+)
+
+SYSTEM_ROLLING_FINDINGS = (
+    "You are an expert clinical scribe AI maintaining a running list of clinical findings for a consultation "
+    "that is still in progress. You receive the findings recorded so far and the newest transcript lines. "
+    "Return the complete updated findings as concise bullet points under these headings: "
+    "CHIEF COMPLAINT, HISTORY OF PRESENT ILLNESS, PAST MEDICAL HISTORY, MEDICATIONS (with dose, route, frequency, duration), "
+    "PHYSICAL EXAMINATION FINDINGS, ASSESSMENT AND PLAN, PATIENT EDUCATION, DIAGNOSES, ADVICE, FOLLOW-UP.\n\n"
+    "• Keep every existing finding unless the new lines explicitly correct it\n"
+    "• Add only what is explicitly stated in the new lines\n"
+    "• Omit headings with nothing to report\n"
+    "• Do not write prose, summaries or disclaimers"
+)
+
+# Header for a rolling draft plus the transcript tail it has not absorbed yet, used in the final pass
+ROLLING_DRAFT_HEADER = (
+    "The following are clinical findings recorded during ONE doctor-patient consultation, followed by the "
+    "final part of the transcript that is not yet reflected in them. Use both.\n\n"
+)
+
+# Transcripts longer than this are rejected by the single-pass prompts
+MAX_TRANSCRIPT_CHARS = 50000
+
+
+class MalformedOutputError(ValueError):
+    """Raised when a structured completion does not have the expected shape."""
+
+
+def _normalize_prescription(prescription_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill in missing prescription keys and make sure medications is a list."""
+    required_keys = ["diagnoses", "medications", "advice", "follow_up"]
+    for key in required_keys:
+        if key not in prescription_data:
+            prescription_data[key] = None
+    
+    # Ensure medications is a list
+    if not isinstance(prescription_data.get("medications"), list):
+        prescription_data["medications"] = []
+    
+    return prescription_data
+
+
+# Part of the notes cache key, so cached output is dropped whenever the prompts change
+PROMPT_VERSION = hashlib.sha256(
+    (
+        SYSTEM_NOTES + SYSTEM_PRESCRIPTION + SYSTEM_COMBINED
+        # Map-reduce and rolling-draft prompts shape cached output too
+        + SYSTEM_CHUNK_FINDINGS + SYSTEM_ROLLING_FINDINGS + ROLLING_DRAFT_HEADER
+        + settings.notes_generation_mode
+    ).encode("utf-8")
+).hexdigest()[:12]
+
+
 class CerebrasClient:
+    # Doctor-facing notes are served ahead of patient chat when the limiter queues
+    priority = PRIORITY_NOTES
+
     def __init__(self) -> None:
         self.base_url = settings.cerebras_base_url.rstrip("/")
         self.api_key = settings.cerebras_api_key
@@ -91,7 +194,7 @@ class CerebrasClient:
             "User-Agent": "AarogyaAI-Backend/1.0.0",
         }
 
-    async def _chat(self, messages: List[Dict[str, str]], *, response_format: Optional[Dict[str, Any]] = None, max_output_tokens: int = 1024) -> str:
+    async def _chat(self, messages: List[Dict[str, str]], *, response_format: Optional[Dict[str, Any]] = None, max_output_tokens: int = 1024, priority: Optional[int] = None) -> str:
         """Make a chat completion request to Cerebras API with proper error handling."""
         if not self.api_key:
             raise ValueError("Cerebras API key is required")
@@ -112,41 +215,88 @@ class CerebrasClient:
             payload["response_format"] = response_format
         
         try:
-            async with httpx.AsyncClient(timeout=120) as client:  # Increased timeout for medical processing
-                resp = await client.post(url, headers=self._headers, json=payload)
-                
+            # Queued behind the shared limiter; rate-limited responses are retried there
+            resp = await llm_limiter.post(
+                url, priority=self.priority if priority is None else priority, tokens=estimate_message_tokens(messages, max_output_tokens),
+                headers=self._headers, json=payload,
+            )
+            
+            if resp.status_code == 401:
+                raise ValueError("Invalid Cerebras API key")
+            elif resp.status_code == 429:
+                raise ValueError("Rate limit exceeded after retries. Please try again later.")
+            elif resp.status_code == 500:
+                raise ValueError("Cerebras API server error. Please try again later.")
+            
+            resp.raise_for_status()
+            data = resp.json()
+            
+            if "choices" not in data or not data["choices"]:
+                raise ValueError("Invalid response format from Cerebras API")
+            
+            content = data["choices"][0]["message"]["content"]
+            if not content:
+                raise ValueError("Empty response from Cerebras API")
+            
+            return content.strip()
+            
+        except httpx.TimeoutException:
+            raise ValueError("Request timeout. The transcript may be too long or the API is slow.")
+        except httpx.RequestError as e:
+            raise ValueError(f"Network error connecting to Cerebras API: {e}")
+        except json.JSONDecodeError:
+            raise ValueError("Invalid JSON response from Cerebras API")
+        except KeyError as e:
+            raise ValueError(f"Unexpected response format from Cerebras API: missing {e}")
+        except Exception as e:
+            raise ValueError(f"Unexpected error with Cerebras API: {e}")
+
+    async def _chat_stream(self, messages: List[Dict[str, str]], *, max_output_tokens: int = 1024) -> AsyncIterator[str]:
+        """Stream a chat completion from Cerebras API, yielding content deltas as they arrive."""
+        if not self.api_key:
+            raise ValueError("Cerebras API key is required")
+        
+        url = f"{self.base_url}/chat/completions"
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.1,
+            "max_tokens": max_output_tokens,
+            "top_p": 0.9,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0,
+            "stream": True,
+        }
+        
+        try:
+            async with llm_limiter.stream(
+                "POST", url, priority=self.priority, tokens=estimate_message_tokens(messages, max_output_tokens),
+                headers=self._headers, json=payload,
+            ) as resp:
                 if resp.status_code == 401:
                     raise ValueError("Invalid Cerebras API key")
                 elif resp.status_code == 429:
-                    raise ValueError("Rate limit exceeded. Please try again later.")
+                    raise ValueError("Rate limit exceeded after retries. Please try again later.")
                 elif resp.status_code == 500:
                     raise ValueError("Cerebras API server error. Please try again later.")
                 
                 resp.raise_for_status()
-                data = resp.json()
-                
-                if "choices" not in data or not data["choices"]:
-                    raise ValueError("Invalid response format from Cerebras API")
-                
-                content = data["choices"][0]["message"]["content"]
-                if not content:
-                    raise ValueError("Empty response from Cerebras API")
-                
-                return content.strip()
+                async for delta in iter_completion_deltas(resp):
+                    yield delta
                 
         except httpx.TimeoutException:
             raise ValueError("Request timeout. The transcript may be too long or the API is slow.")
         except httpx.RequestError as e:
             raise ValueError(f"Network error connecting to Cerebras API: {e}")
         except json.JSONDecodeError:
-            raise ValueError("Invalid JSON response from Cerebras API")
-        except KeyError as e:
-            raise ValueError(f"Unexpected response format from Cerebras API: missing {e}")
+            raise ValueError("Invalid JSON in Cerebras API stream")
+        except ValueError:
+            raise
         except Exception as e:
             raise ValueError(f"Unexpected error with Cerebras API: {e}")
 
-    async def generate_notes(self, transcript: str) -> str:
-        """Generate comprehensive medical notes from consultation transcript."""
+    def _notes_messages(self, transcript: str) -> List[Dict[str, str]]:
+        """Validate a transcript and build the notes generation messages."""
         if not transcript or not transcript.strip():
             raise ValueError("Transcript cannot be empty")
         
@@ -154,19 +304,33 @@ class CerebrasClient:
         clean_transcript = transcript.strip()
         
         # Check transcript length (Cerebras has token limits)
-        if len(clean_transcript) > 50000:  # Rough estimate for token limit
+        if len(clean_transcript) > MAX_TRANSCRIPT_CHARS:  # Rough estimate for token limit
             raise ValueError("Transcript is too long. Please provide a shorter transcript.")
         
-        messages = [
+        return [
             {"role": "system", "content": SYSTEM_NOTES},
             {"role": "user", "content": f"Please analyze this doctor-patient consultation transcript and generate comprehensive medical notes:\n\n{clean_transcript}"},
         ]
+
+    async def generate_notes(self, transcript: str) -> str:
+        """Generate comprehensive medical notes from consultation transcript."""
+        messages = self._notes_messages(transcript)
         
         try:
             return await self._chat(messages, max_output_tokens=2000)  # Increased for comprehensive notes
         except Exception as e:
             raise ValueError(f"Failed to generate medical notes: {e}")
 
+    async def stream_notes(self, transcript: str) -> AsyncIterator[str]:
+        """Stream medical notes markdown from consultation transcript as it is generated."""
+        messages = self._notes_messages(transcript)
+        
+        try:
+            async for delta in self._chat_stream(messages, max_output_tokens=2000):
+                yield delta
+        except Exception as e:
+            raise ValueError(f"Failed to generate medical notes: {e}")
+
     async def generate_prescription_json(self, transcript: str) -> Dict[str, Any]:
         """Generate structured prescription data from consultation transcript."""
         if not transcript or not transcript.strip():
@@ -176,7 +340,7 @@ class CerebrasClient:
         clean_transcript = transcript.strip()
         
         # Check transcript length
-        if len(clean_transcript) > 50000:
+        if len(clean_transcript) > MAX_TRANSCRIPT_CHARS:
             raise ValueError("Transcript is too long. Please provide a shorter transcript.")
         
         messages = [
@@ -195,16 +359,7 @@ class CerebrasClient:
                 prescription_data = json.loads(content)
                 
                 # Validate required structure
-                required_keys = ["diagnoses", "medications", "advice", "follow_up"]
-                for key in required_keys:
-                    if key not in prescription_data:
-                        prescription_data[key] = None
-                
-                # Ensure medications is a list
-                if not isinstance(prescription_data.get("medications"), list):
-                    prescription_data["medications"] = []
-                
-                return prescription_data
+                return _normalize_prescription(prescription_data)
                 
             except json.JSONDecodeError:
                 # Fallback: attempt to extract JSON from response
@@ -215,15 +370,7 @@ class CerebrasClient:
                     prescription_data = json.loads(json_str)
                     
                     # Validate structure
-                    required_keys = ["diagnoses", "medications", "advice", "follow_up"]
-                    for key in required_keys:
-                        if key not in prescription_data:
-                            prescription_data[key] = None
-                    
-                    if not isinstance(prescription_data.get("medications"), list):
-                        prescription_data["medications"] = []
-                    
-                    return prescription_data
+                    return _normalize_prescription(prescription_data)
                 
                 # If JSON extraction fails, return empty structure
                 return {
@@ -236,16 +383,153 @@ class CerebrasClient:
         except Exception as e:
             raise ValueError(f"Failed to generate prescription data: {e}")
 
+    async def extract_chunk_findings(self, chunk: str, index: int, total: int) -> str:
+        """Map step: extract clinical findings from one segment of a long transcript."""
+        messages = [
+            {"role": "system", "content": SYSTEM_CHUNK_FINDINGS},
+            {"role": "user", "content": f"Transcript segment {index} of {total}:\n\n{chunk.strip()}"},
+        ]
+        
+        try:
+            return await self._chat(messages, max_output_tokens=800)
+        except Exception as e:
+            raise ValueError(f"Failed to extract findings from segment {index}: {e}")
+
+    async def update_rolling_findings(self, findings: str, new_lines: str) -> str:
+        """Fold new transcript lines of a live consultation into the running findings."""
+        messages = [
+            {"role": "system", "content": SYSTEM_ROLLING_FINDINGS},
+            {"role": "user", "content": (
+                f"FINDINGS SO FAR:\n{findings.strip() or '(none yet)'}\n\n"
+                f"NEW TRANSCRIPT LINES:\n{new_lines.strip()}"
+            )},
+        ]
+        
+        try:
+            # Background work: never delay notes or chatbot requests waiting in the limiter
+            return await self._chat(messages, max_output_tokens=1500, priority=PRIORITY_BACKGROUND)
+        except Exception as e:
+            raise ValueError(f"Failed to update rolling findings: {e}")
+
+    async def generate_combined(self, transcript: str) -> Tuple[str, Dict[str, Any]]:
+        """Generate notes and prescription from one structured completion.
+        
+        Raises MalformedOutputError if the combined output is malformed, ValueError if the call fails.
+        """
+        messages = self._notes_messages(transcript)
+        messages[0] = {"role": "system", "content": SYSTEM_COMBINED}
+        
+        content = await self._chat(messages, response_format={"type": "json_object"}, max_output_tokens=3000)
+        
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            raise MalformedOutputError("Combined output is not valid JSON")
+        if not isinstance(data, dict):
+            raise MalformedOutputError("Combined output is not a JSON object")
+        
+        notes = data.pop("notes_markdown", None)
+        if not isinstance(notes, str) or "## " not in notes:
+            raise MalformedOutputError("Combined output is missing notes_markdown")
+        
+        return notes.strip(), _normalize_prescription(data)
+
 
 cerebras_client = CerebrasClient()
 
+# Coalesces concurrent generate_notes_and_prescription calls for the same transcript
+notes_flight = SingleFlight("notes")
+
+
+# Timings of the most recent map-reduce run, exposed for monitoring
+last_pipeline_timings: Dict[str, Any] = {}
+
+
+def _is_long_transcript(transcript: str) -> bool:
+    return len(transcript.strip()) > settings.notes_map_reduce_threshold_chars
+
 
-async def generate_notes_and_prescription(transcript: str) -> Tuple[str, Dict[str, Any]]:
+async def _iter_condense(transcript: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Map stage for long transcripts: split into overlapping chunks and extract findings concurrently.
+    
+    Yields ("progress", {...}) as each chunk finishes and finally ("condensed", {"text", "timings"}),
+    where text is the merged findings to feed into the reduce step. Repeats on the merged
+    findings (at most three rounds) if they are still above the map-reduce threshold.
+    """
+    text = transcript.strip()
+    rounds: List[Dict[str, Any]] = []
+    semaphore = asyncio.Semaphore(max(1, settings.notes_map_concurrency))
+    
+    while _is_long_transcript(text) and len(rounds) < 3:
+        started = time.perf_counter()
+        chunks = split_transcript(text, settings.notes_chunk_chars, settings.notes_chunk_overlap_chars)
+        split_ms = (time.perf_counter() - started) * 1000
+        
+        async def _extract(index: int, chunk: str) -> Tuple[int, str, float]:
+            async with semaphore:
+                chunk_started = time.perf_counter()
+                findings = await cerebras_client.extract_chunk_findings(chunk, index + 1, len(chunks))
+                return index, findings, (time.perf_counter() - chunk_started) * 1000
+        
+        map_started = time.perf_counter()
+        tasks = [asyncio.create_task(_extract(i, chunk)) for i, chunk in enumerate(chunks)]
+        findings: List[str] = [""] * len(chunks)
+        chunk_ms: List[float] = [0.0] * len(chunks)
+        try:
+            for completed, next_done in enumerate(asyncio.as_completed(tasks), 1):
+                index, result, elapsed_ms = await next_done
+                findings[index] = result
+                chunk_ms[index] = round(elapsed_ms, 1)
+                yield "progress", {"stage": "map", "round": len(rounds) + 1, "completed": completed, "total": len(chunks)}
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        
+        text = MERGED_FINDINGS_HEADER + "\n\n".join(
+            f"### Segment {i + 1} of {len(chunks)}\n{result.strip()}" for i, result in enumerate(findings)
+        )
+        rounds.append({
+            "chunks": len(chunks),
+            "split_ms": round(split_ms, 1),
+            "map_ms": round((time.perf_counter() - map_started) * 1000, 1),
+            "slowest_chunk_ms": max(chunk_ms) if chunk_ms else 0.0,
+            "chunk_ms": chunk_ms,
+            "merged_chars": len(text),
+        })
+    
+    yield "condensed", {"text": text, "timings": {"input_chars": len(transcript), "rounds": rounds}}
+
+
+def _record_pipeline_timings(timings: Dict[str, Any], reduce_started: float) -> None:
+    timings["reduce_ms"] = round((time.perf_counter() - reduce_started) * 1000, 1)
+    last_pipeline_timings.clear()
+    last_pipeline_timings.update(timings)
+    logger.info(f"Map-reduce notes pipeline timings: {timings}")
+
+
+def notes_cache_key(transcript: str) -> str:
+    """Content address of a transcript for the notes cache."""
+    return notes_cache.make_key(transcript, cerebras_client.model, PROMPT_VERSION)
+
+
+def notes_cache_transcript_key() -> TranscriptKey:
+    """Incremental notes_cache_key for a transcript that arrives line by line."""
+    return TranscriptKey(cerebras_client.model, PROMPT_VERSION)
+
+
+async def generate_notes_and_prescription(transcript: str, use_cache: bool = True) -> Tuple[str, Dict[str, Any]]:
     """
     Generate both medical notes and prescription data from consultation transcript.
     
     Args:
         transcript: The doctor-patient consultation transcript
+        use_cache: Serve a previously generated result for the same transcript if available;
+            when False the result is regenerated and the cached entry refreshed
+        
+    Transcripts above the map-reduce threshold are condensed chunk by chunk first
+    (see _iter_condense) instead of being rejected as too long.
         
     Returns:
         Tuple of (medical_notes, prescription_data)
@@ -256,11 +540,77 @@ async def generate_notes_and_prescription(transcript: str) -> Tuple[str, Dict[st
     if not transcript or not transcript.strip():
         raise ValueError("Transcript cannot be empty")
     
+    key = notes_cache_key(transcript)
+    # Concurrent identical requests (double clicks, client retries) share one generation
+    flight_key = key if use_cache else f"{key}:refresh"
+    return await notes_flight.do(flight_key, lambda: _generate_and_cache(transcript, key, use_cache))
+
+
+async def _generate_and_cache(transcript: str, key: str, use_cache: bool) -> Tuple[str, Dict[str, Any]]:
+    """Serve a transcript's notes from the cache or generate and store them."""
+    if use_cache:
+        cached = await notes_cache.get(key)
+        if cached is not None:
+            return cached
+    else:
+        notes_cache.record_bypass()
+    
+    if _is_long_transcript(transcript):
+        # Too long for one pass: condense chunk by chunk, then reduce the merged findings
+        async for event, data in _iter_condense(transcript):
+            if event == "condensed":
+                condensed, timings = data["text"], data["timings"]
+        reduce_started = time.perf_counter()
+        notes, prescription = await _generate_notes_and_prescription(condensed)
+        _record_pipeline_timings(timings, reduce_started)
+    else:
+        notes, prescription = await _generate_notes_and_prescription(transcript)
+    
+    await notes_cache.put(key, notes, prescription)
+    return notes, prescription
+
+
+async def generate_notes_from_draft(findings: str, tail: str, cache_key: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Final reconciliation pass for a live consultation summarized while it was running.
+    
+    Generates notes from the rolling findings plus the transcript tail they do not cover yet,
+    instead of reprocessing the whole transcript. Without a draft the tail is the whole
+    transcript and goes through the full pipeline; a draft too long for a single pass goes
+    through the map-reduce pipeline. The result is cached under ``cache_key`` (the full
+    transcript's notes_cache_key), so a later /ai/notes call for the same transcript is
+    served from cache.
+    """
+    if not findings.strip():
+        if not tail.strip():
+            raise ValueError("Transcript cannot be empty")
+        return await generate_notes_and_prescription(tail)
+    
+    condensed = ROLLING_DRAFT_HEADER + f"## Findings so far\n{findings.strip()}"
+    if tail.strip():
+        condensed += f"\n\n## Latest transcript\n{tail.strip()}"
+    if len(condensed) > MAX_TRANSCRIPT_CHARS:
+        notes, prescription = await generate_notes_and_prescription(condensed)
+    else:
+        notes, prescription = await _generate_notes_and_prescription(condensed)
+    await notes_cache.put(cache_key, notes, prescription)
+    return notes, prescription
+
+
+async def _generate_notes_and_prescription(transcript: str) -> Tuple[str, Dict[str, Any]]:
+    """Generate notes and prescription in the configured mode.
+    
+    "combined" asks for both in one completion and falls back to the two-call
+    "split" mode only when the combined output is malformed.
+    """
+    if settings.notes_generation_mode == "combined":
+        try:
+            return await cerebras_client.generate_combined(transcript)
+        except MalformedOutputError as e:
+            logger.warning(f"Combined notes generation failed, falling back to two calls: {e}")
+    
     try:
         # Generate both notes and prescription in parallel for efficiency
-        import asyncio
-        
-        # Run both operations concurrently
         notes_task = cerebras_client.generate_notes(transcript)
         prescription_task = cerebras_client.generate_prescription_json(transcript)
         
@@ -278,3 +628,93 @@ async def generate_notes_and_prescription(transcript: str) -> Tuple[str, Dict[st
             raise ValueError(f"Failed to generate medical documentation: {inner_e}")
 
 
+def _split_sections(buffer: str) -> Tuple[List[str], str]:
+    """Split completed "## " sections off the front of a markdown buffer.
+    
+    A section is complete once the next "## " heading has started. Returns the
+    completed sections and the still-open remainder.
+    """
+    sections = []
+    while True:
+        start = buffer.find("\n## ", 1)
+        if start == -1:
+            return sections, buffer
+        sections.append(buffer[:start + 1].strip())
+        buffer = buffer[start + 1:]
+
+
+async def stream_notes_and_prescription(transcript: str, use_cache: bool = True) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Stream medical notes section by section while the prescription is generated concurrently.
+    
+    Args:
+        transcript: The doctor-patient consultation transcript
+        use_cache: Replay a cached result for the same transcript if available
+        
+    Yields:
+        ("progress", {...}) per condensed chunk for long transcripts (see _iter_condense),
+        ("section", {"index", "markdown"}) for each completed notes section, then
+        ("prescription", prescription_data) and finally ("done", {"notes": full_notes, "cached": bool})
+        
+    Raises:
+        ValueError: If transcript is invalid or API calls fail
+    """
+    if not transcript or not transcript.strip():
+        raise ValueError("Transcript cannot be empty")
+    
+    key = notes_cache_key(transcript)
+    if use_cache:
+        cached = await notes_cache.get(key)
+        if cached is not None:
+            notes, prescription = cached
+            sections, rest = _split_sections(notes)
+            if rest.strip():
+                sections.append(rest.strip())
+            for index, section in enumerate(sections, 1):
+                yield "section", {"index": index, "markdown": section}
+            yield "prescription", prescription
+            yield "done", {"notes": notes, "cached": True}
+            return
+    else:
+        notes_cache.record_bypass()
+    
+    source = transcript
+    timings: Optional[Dict[str, Any]] = None
+    if _is_long_transcript(transcript):
+        # Too long for one pass: report map progress, then stream the reduce over merged findings
+        async for event, data in _iter_condense(transcript):
+            if event == "progress":
+                yield "progress", data
+            else:
+                source, timings = data["text"], data["timings"]
+    reduce_started = time.perf_counter()
+    
+    prescription_task = asyncio.create_task(cerebras_client.generate_prescription_json(source))
+    try:
+        buffer = ""
+        notes_parts = []
+        index = 0
+        async for delta in cerebras_client.stream_notes(source):
+            notes_parts.append(delta)
+            sections, buffer = _split_sections(buffer + delta)
+            for section in sections:
+                index += 1
+                yield "section", {"index": index, "markdown": section}
+        if buffer.strip():
+            index += 1
+            yield "section", {"index": index, "markdown": buffer.strip()}
+        
+        prescription = await prescription_task
+        notes = "".join(notes_parts).strip()
+        if timings is not None:
+            _record_pipeline_timings(timings, reduce_started)
+        await notes_cache.put(key, notes, prescription)
+        yield "prescription", prescription
+        yield "done", {"notes": notes, "cached": False}
+    finally:
+        # Client went away or notes failed: do not leave the prescription call running
+        if not prescription_task.done():
+            prescription_task.cancel()
+        elif not prescription_task.cancelled():
+            # A prescription failure nobody awaited would be logged as "never retrieved"
+            prescription_task.exception()
@@ -0,0 +1,491 @@
+"""
+Streaming speech-to-text pipeline for Meet audio.
+
+Browser chunks (a continuous WebM/Opus MediaRecorder stream, or raw 16 kHz
+mono s16le PCM) are decoded by one long-lived ffmpeg process per session, so
+decoding never runs on the event loop. Decoded PCM lands in a fixed-size ring
+buffer; a pusher slices it into 20 ms frames for the STT stream, and a results
+task collects interim and final transcripts as they arrive. Each stage records
+its latency.
+
+For offline runs set MEET_STT_BACKEND=fake (or pass ``stt=FakeSTT()``) and
+replay a WAV file::
+
+    python -m app.audio_pipeline consultation.wav [script.txt]
+"""
+
+import asyncio
+import logging
+import sys
+import time
+import wave
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import aiohttp
+import numpy as np
+from livekit import rtc
+from livekit.agents import stt as agents_stt
+
+from .config import settings
+from .stt_manager import create_stt
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = SAMPLE_RATE // 50  # 20 ms frames
+FRAME_BYTES = FRAME_SAMPLES * 2
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+
+TranscriptCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class _LatencyStats:
+    """Rolling window of latency samples in milliseconds."""
+
+    def __init__(self, window: int = 500):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, ms: float) -> None:
+        self.samples.append(max(0.0, ms))
+
+    def summary(self) -> Dict[str, float]:
+        if not self.samples:
+            return {"count": 0, "avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "count": len(ordered),
+            "avg_ms": round(sum(ordered) / len(ordered), 1),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            "max_ms": round(ordered[-1], 1),
+        }
+
+
+class PCMRingBuffer:
+    """Fixed-capacity byte ring; when full, the oldest audio is overwritten."""
+
+    def __init__(self, capacity_bytes: int):
+        # Keep whole samples so an overwrite never splits one
+        self.capacity = max(FRAME_BYTES, capacity_bytes - capacity_bytes % 2)
+        self._buf = bytearray(self.capacity)
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self._ready = asyncio.Event()
+        self.overflow_bytes = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def buffered_ms(self) -> float:
+        return self._size * 1000 / BYTES_PER_SECOND
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        if len(data) >= self.capacity:
+            self.overflow_bytes += self._size + len(data) - self.capacity
+            data = data[-self.capacity:]
+            self._start, self._size = 0, 0
+        free = self.capacity - self._size
+        if len(data) > free:
+            drop = len(data) - free
+            self._start = (self._start + drop) % self.capacity
+            self._size -= drop
+            self.overflow_bytes += drop
+        end = (self._start + self._size) % self.capacity
+        first = min(len(data), self.capacity - end)
+        self._buf[end:end + first] = data[:first]
+        self._buf[:len(data) - first] = data[first:]
+        self._size += len(data)
+        self._ready.set()
+
+    def read(self, n: int) -> bytes:
+        n = min(n, self._size)
+        first = min(n, self.capacity - self._start)
+        out = bytes(self._buf[self._start:self._start + first]) + bytes(self._buf[:n - first])
+        self._start = (self._start + n) % self.capacity
+        self._size -= n
+        return out
+
+    async def read_exactly(self, n: int) -> Optional[bytes]:
+        """Wait for ``n`` bytes; after close returns what is left, or None when empty."""
+        while True:
+            if self._size >= n:
+                return self.read(n)
+            if self._closed:
+                return self.read(self._size) or None
+            self._ready.clear()
+            await self._ready.wait()
+
+    def close(self) -> None:
+        self._closed = True
+        self._ready.set()
+
+
+class FFmpegDecoder:
+    """Decodes a continuous WebM/Opus stream to 16 kHz mono s16le PCM in an ffmpeg subprocess."""
+
+    def __init__(self, ffmpeg_path: Optional[str] = None):
+        self.ffmpeg_path = ffmpeg_path or settings.ffmpeg_path
+        self._process: Optional[asyncio.subprocess.Process] = None
+
+    async def start(self) -> None:
+        self._process = await asyncio.create_subprocess_exec(
+            self.ffmpeg_path, "-hide_banner", "-loglevel", "error",
+            "-fflags", "nobuffer", "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+    async def feed(self, data: bytes) -> None:
+        self._process.stdin.write(data)
+        await self._process.stdin.drain()
+
+    async def read(self) -> bytes:
+        """Next block of decoded PCM; empty at end of stream."""
+        return await self._process.stdout.read(BYTES_PER_SECOND // 10)
+
+    async def close_input(self) -> None:
+        if self._process and self._process.stdin and not self._process.stdin.is_closing():
+            self._process.stdin.close()
+
+    async def close(self) -> None:
+        if self._process is None:
+            return
+        await self.close_input()
+        try:
+            await asyncio.wait_for(self._process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            self._process.kill()
+            await self._process.wait()
+
+
+class StreamingTranscriber:
+    """Feeds audio chunks through decode -> ring buffer -> STT stream and reports transcripts."""
+
+    def __init__(self, on_final: TranscriptCallback, on_interim: Optional[TranscriptCallback] = None,
+                 stt: Any = None, input_format: Optional[str] = None, ring_seconds: Optional[float] = None):
+        self.on_final = on_final
+        self.on_interim = on_interim
+        self.input_format = (input_format or settings.meet_audio_input_format).lower()
+        self._stt = stt
+        self.ring = PCMRingBuffer(int((ring_seconds or settings.meet_audio_ring_seconds) * BYTES_PER_SECOND))
+        self._decoder: Optional[FFmpegDecoder] = None
+        self._stream: Any = None
+        self._http_session: Any = None
+        self._tasks: List[asyncio.Task] = []
+        self._pending_feeds: Deque[float] = deque()
+        # (seconds of audio pushed, wall time pushed), used to time STT results
+        self._push_log: Deque[Tuple[float, float]] = deque()
+        self._pushed_samples = 0
+        self._closed = False
+        self.chunks = 0
+        self.finals = 0
+        self.interims = 0
+        self.errors = 0
+        self.latency = {name: _LatencyStats() for name in ("queue_wait", "decode", "ring", "stt", "flush")}
+
+    def _create_stt(self) -> Any:
+        if settings.meet_stt_backend == "fake":
+            return FakeSTT.from_file(settings.meet_fake_stt_script) if settings.meet_fake_stt_script else FakeSTT()
+        # Outside an agent job there is no shared HTTP context, so the stream gets its own session
+        self._http_session = aiohttp.ClientSession()
+        return create_stt(http_session=self._http_session)
+
+    async def start(self) -> None:
+        if self._stt is None:
+            self._stt = self._create_stt()
+        self._stream = self._stt.stream()
+        if self.input_format != "pcm16":
+            self._decoder = FFmpegDecoder()
+            await self._decoder.start()
+        loop = asyncio.get_running_loop()
+        if self._decoder is not None:
+            self._tasks.append(loop.create_task(self._decode_loop()))
+        self._tasks.append(loop.create_task(self._push_loop()))
+        self._tasks.append(loop.create_task(self._results_loop()))
+
+    async def feed(self, chunk: bytes, enqueued_at: Optional[float] = None) -> None:
+        """Hand one received chunk to the decoder (or straight to the ring for raw PCM)."""
+        if self._closed or not chunk:
+            return
+        now = time.monotonic()
+        self.chunks += 1
+        if enqueued_at is not None:
+            self.latency["queue_wait"].record((now - enqueued_at) * 1000)
+        if self._decoder is None:
+            # Drop a trailing odd byte rather than misalign every later sample
+            self.ring.write(chunk[:len(chunk) - len(chunk) % 2])
+            self.latency["decode"].record(0.0)
+            return
+        self._pending_feeds.append(now)
+        await self._decoder.feed(chunk)
+
+    async def _decode_loop(self) -> None:
+        try:
+            while True:
+                pcm = await self._decoder.read()
+                if not pcm:
+                    break
+                if self._pending_feeds:
+                    # Output is not 1:1 with input chunks; time from the oldest chunk still waiting
+                    self.latency["decode"].record((time.monotonic() - self._pending_feeds[0]) * 1000)
+                    self._pending_feeds.clear()
+                self.ring.write(pcm)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Audio decoder failed: {e}")
+        finally:
+            self.ring.close()
+
+    async def _push_loop(self) -> None:
+        try:
+            while True:
+                buffered_ms = self.ring.buffered_ms
+                pcm = await self.ring.read_exactly(FRAME_BYTES)
+                if pcm is None:
+                    break
+                self.latency["ring"].record(buffered_ms)
+                if len(pcm) < FRAME_BYTES:
+                    pcm += bytes(FRAME_BYTES - len(pcm))
+                self._stream.push_frame(rtc.AudioFrame(
+                    data=pcm, sample_rate=SAMPLE_RATE, num_channels=1, samples_per_channel=FRAME_SAMPLES,
+                ))
+                self._pushed_samples += FRAME_SAMPLES
+                self._push_log.append((self._pushed_samples / SAMPLE_RATE, time.monotonic()))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Pushing audio to the STT stream failed: {e}")
+
+    def _pushed_at(self, end_time: float) -> Optional[float]:
+        """Wall time at which audio up to ``end_time`` (stream seconds) was pushed."""
+        wall = None
+        while self._push_log and self._push_log[0][0] < end_time:
+            wall = self._push_log.popleft()[1]
+        if self._push_log and end_time > 0:
+            wall = self._push_log[0][1]
+        return wall
+
+    async def _results_loop(self) -> None:
+        try:
+            async for event in self._stream:
+                if not event.alternatives:
+                    continue
+                alternative = event.alternatives[0]
+                text = (alternative.text or "").strip()
+                if not text:
+                    continue
+                info = {
+                    "start_time": alternative.start_time,
+                    "end_time": alternative.end_time,
+                    "confidence": alternative.confidence,
+                }
+                if event.type == agents_stt.SpeechEventType.FINAL_TRANSCRIPT:
+                    pushed_at = self._pushed_at(alternative.end_time)
+                    if pushed_at is not None:
+                        info["latency_ms"] = round((time.monotonic() - pushed_at) * 1000, 1)
+                        self.latency["stt"].record(info["latency_ms"])
+                    self.finals += 1
+                    self.on_final(text, info)
+                elif event.type == agents_stt.SpeechEventType.INTERIM_TRANSCRIPT:
+                    self.interims += 1
+                    if self.on_interim:
+                        self.on_interim(text, info)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"STT stream failed: {e}")
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Flush buffered audio, wait for the last final transcripts and release the stream."""
+        if self._closed:
+            return
+        self._closed = True
+        started = time.monotonic()
+        try:
+            if self._decoder is not None:
+                await self._decoder.close_input()
+            else:
+                self.ring.close()
+            # Decoder and pusher drain first, then ending the input lets the STT emit its last finals
+            await asyncio.wait_for(asyncio.gather(*self._tasks[:-1], return_exceptions=True), timeout)
+            if self._stream is not None:
+                self._stream.end_input()
+            if self._tasks:
+                await asyncio.wait_for(self._tasks[-1], timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out flushing the STT stream; dropping pending results")
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            if self._stream is not None:
+                await self._stream.aclose()
+            if self._decoder is not None:
+                await self._decoder.close()
+            if self._http_session is not None:
+                await self._http_session.close()
+            self.latency["flush"].record((time.monotonic() - started) * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pipeline counters and per-stage latency."""
+        return {
+            "input_format": self.input_format,
+            "chunks": self.chunks,
+            "audio_seconds_pushed": round(self._pushed_samples / SAMPLE_RATE, 2),
+            "ring_buffered_ms": round(self.ring.buffered_ms, 1),
+            "ring_overflow_ms": round(self.ring.overflow_bytes * 1000 / BYTES_PER_SECOND, 1),
+            "interim_results": self.interims,
+            "final_results": self.finals,
+            "errors": self.errors,
+            "latency": {
+                "queue_wait": self.latency["queue_wait"].summary(),
+                "decode": self.latency["decode"].summary(),
+                "ring_buffered": self.latency["ring"].summary(),
+                "stt": self.latency["stt"].summary(),
+                "flush_on_close": self.latency["flush"].summary(),
+            },
+        }
+
+
+class FakeSTT:
+    """Offline STT: splits pushed audio into utterances by energy and emits scripted transcripts.
+
+    Each utterance produces interim results while it lasts and one final result when
+    ``silence_ms`` of quiet ends it. Text comes from ``script`` in order, falling back to a
+    placeholder naming the utterance's time span.
+    """
+
+    def __init__(self, script: Optional[List[str]] = None, threshold: float = 500.0,
+                 silence_ms: int = 400, interim_every_ms: int = 1000, delay: float = 0.0):
+        self.script = list(script or [])
+        self.threshold = threshold
+        self.silence_ms = silence_ms
+        self.interim_every_ms = interim_every_ms
+        self.delay = delay
+
+    @classmethod
+    def from_file(cls, path: str) -> "FakeSTT":
+        with open(path, encoding="utf-8") as f:
+            return cls([line.strip() for line in f if line.strip()])
+
+    def stream(self, **kwargs: Any) -> "_FakeSpeechStream":
+        return _FakeSpeechStream(self)
+
+
+class _FakeSpeechStream:
+    def __init__(self, stt: FakeSTT):
+        self._stt = stt
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._script = iter(stt.script)
+        self._seconds = 0.0
+        self._speech_start: Optional[float] = None
+        self._last_voice = 0.0
+        self._last_interim = 0.0
+        self._utterances = 0
+
+    def _text(self, start: float, end: float) -> str:
+        return next(self._script, None) or f"[speech {start:.1f}s-{end:.1f}s]"
+
+    def _emit(self, kind: Any, text: str, start: float, end: float) -> None:
+        data = agents_stt.SpeechData(language="en", text=text, start_time=start, end_time=end, confidence=1.0)
+        event = agents_stt.SpeechEvent(type=kind, alternatives=[data])
+        if self._stt.delay:
+            asyncio.get_running_loop().call_later(self._stt.delay, self._events.put_nowait, event)
+        else:
+            self._events.put_nowait(event)
+
+    def _end_utterance(self) -> None:
+        start, end = self._speech_start, self._last_voice
+        self._speech_start = None
+        self._utterances += 1
+        self._emit(agents_stt.SpeechEventType.FINAL_TRANSCRIPT, self._text(start, end), start, end)
+
+    def push_frame(self, frame: rtc.AudioFrame) -> None:
+        samples = np.frombuffer(bytes(frame.data), dtype=np.int16).astype(np.float32)
+        self._seconds += frame.samples_per_channel / frame.sample_rate
+        voiced = samples.size and float(np.sqrt(np.mean(samples ** 2))) >= self._stt.threshold
+        if voiced:
+            if self._speech_start is None:
+                self._speech_start = self._last_interim = self._seconds
+            self._last_voice = self._seconds
+            if (self._seconds - self._last_interim) * 1000 >= self._stt.interim_every_ms:
+                self._last_interim = self._seconds
+                self._emit(agents_stt.SpeechEventType.INTERIM_TRANSCRIPT, f"[speaking since {self._speech_start:.1f}s]",
+                           self._speech_start, self._seconds)
+        elif self._speech_start is not None and (self._seconds - self._last_voice) * 1000 >= self._stt.silence_ms:
+            self._end_utterance()
+
+    def flush(self) -> None:
+        pass
+
+    def end_input(self) -> None:
+        if self._speech_start is not None:
+            self._end_utterance()
+        loop = asyncio.get_running_loop()
+        if self._stt.delay:
+            loop.call_later(self._stt.delay * 1.01, self._events.put_nowait, None)
+        else:
+            self._events.put_nowait(None)
+
+    async def aclose(self) -> None:
+        pass
+
+    def __aiter__(self) -> "_FakeSpeechStream":
+        return self
+
+    async def __anext__(self) -> agents_stt.SpeechEvent:
+        event = await self._events.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+def read_wav_pcm16(path: str) -> bytes:
+    """Load a WAV file as 16 kHz mono s16le PCM (downmixed and linearly resampled)."""
+    with wave.open(path, "rb") as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+    if width != 2:
+        raise ValueError("Only 16-bit PCM WAV files are supported")
+    samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE and samples.size:
+        positions = np.arange(0, samples.size, rate / SAMPLE_RATE)
+        samples = np.interp(positions, np.arange(samples.size), samples)
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+async def replay_wav(path: str, feed: Callable[[bytes], Awaitable[Any]], chunk_ms: int = 250,
+                     realtime: bool = False) -> float:
+    """Feed a WAV file as raw PCM chunks, like a browser sending ``chunk_ms`` slices. Returns seconds of audio."""
+    pcm = await asyncio.to_thread(read_wav_pcm16, path)
+    step = BYTES_PER_SECOND * chunk_ms // 1000
+    step -= step % 2
+    for offset in range(0, len(pcm), step):
+        await feed(pcm[offset:offset + step])
+        await asyncio.sleep(chunk_ms / 1000 if realtime else 0)
+    return len(pcm) / BYTES_PER_SECOND
+
+
+async def _replay_main(path: str, script_path: Optional[str]) -> None:
+    stt = FakeSTT.from_file(script_path) if script_path else FakeSTT()
+    transcriber = StreamingTranscriber(
+        on_final=lambda text, info: print(f"[{info['start_time']:.1f}-{info['end_time']:.1f}s] {text}"),
+        stt=stt,
+        input_format="pcm16",
+    )
+    await transcriber.start()
+    seconds = await replay_wav(path, transcriber.feed)
+    await transcriber.close()
+    print(f"Replayed {seconds:.1f}s of audio")
+    print(transcriber.stats())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python -m app.audio_pipeline <file.wav> [script.txt]")
+    asyncio.run(_replay_main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
@@ -1,115 +1,215 @@
 """
 Chat History Service for managing patient chatbot conversations.
+
+Messages are written behind: ``save_message`` buffers the row in memory and a
+background task flushes buffered rows in batches with ``executemany``. Reads
+merge buffered rows so a patient always sees their own messages immediately.
 """
 
 import json
+import uuid
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 import asyncio
 
-# Try to import asyncpg for database operations
-try:
-    import asyncpg
-    ASYNCPG_AVAILABLE = True
-except ImportError:
-    ASYNCPG_AVAILABLE = False
-    asyncpg = None
-
 from .config import settings
+from .db import Database, database
 
 
 class ChatHistoryService:
     """Service to manage chat history in the database."""
-    
-    def __init__(self):
-        self.database_url = settings.database_url
-    
+
+    INSERT_QUERY = """
+        INSERT INTO "ChatHistory" (id, "patientId", message, "isUser", "createdAt")
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (id) DO NOTHING
+    """
+
+    def __init__(self, db: Database = database, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_pending: Optional[int] = None):
+        self.db = db
+        self.batch_size = batch_size if batch_size is not None else settings.chat_history_batch_size
+        self.flush_interval = flush_interval if flush_interval is not None else settings.chat_history_flush_interval
+        self.max_pending = max_pending if max_pending is not None else settings.chat_history_max_pending
+        # Rows waiting to be written, and rows currently being written; both stay readable
+        self._pending: List[Dict[str, Any]] = []
+        self._in_flight: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.flush_errors = 0
+        self.dropped = 0
+
+    async def start(self) -> None:
+        """Start the background flush task. Called from the FastAPI lifespan hook."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the background task and flush everything still buffered."""
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> int:
+        """Write all buffered messages in one batch. Returns the number of rows written."""
+        async with self._flush_lock:
+            if not self._pending or not self.db.is_available:
+                return 0
+            batch, self._pending = self._pending, []
+            self._in_flight = batch
+            try:
+                async with self.db.acquire() as conn:
+                    await conn.executemany(self.INSERT_QUERY, [
+                        (row["id"], row["patient_id"], row["message"], row["is_user"], row["created_at"])
+                        for row in batch
+                    ])
+                self.flushed += len(batch)
+                return len(batch)
+            except asyncio.CancelledError:
+                # Cancelled mid-write (e.g. by stop()): keep the rows for the final flush;
+                # ON CONFLICT makes rewriting any that did commit harmless
+                self._pending = batch + self._pending
+                raise
+            except Exception as e:
+                print(f"Error flushing chat history: {e}")
+                self.flush_errors += 1
+                # Keep the rows for the next attempt, dropping the oldest beyond the buffer bound
+                self._pending = batch + self._pending
+                overflow = len(self._pending) - self.max_pending
+                if overflow > 0:
+                    self._pending = self._pending[overflow:]
+                    self.dropped += overflow
+                return 0
+            finally:
+                self._in_flight = []
+
     async def save_message(self, patient_id: str, message: str, is_user: bool) -> Optional[str]:
-        """Save a chat message to the database."""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
+        """Buffer a chat message for batched persistence and return its id."""
+        if not self.db.is_available:
             return None
-        
-        try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
-                    query = """
-                        INSERT INTO "ChatHistory" (id, "patientId", message, "isUser", "createdAt")
-                        VALUES ($1, $2, $3, $4, $5)
-                        RETURNING id
-                    """
-                    
-                    # Generate a simple ID (in production, use proper UUID generation)
-                    message_id = f"chat_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{hash(message) % 10000}"
-                    
-                    result = await conn.fetchval(
-                        query,
-                        message_id,
-                        patient_id,
-                        message,
-                        is_user,
-                        datetime.now()
-                    )
-                    
-                    return result
-                    
-        except Exception as e:
-            print(f"Error saving chat message: {e}")
-            return None
-    
+
+        # Bounded buffer: apply backpressure by flushing before accepting more
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+            if len(self._pending) >= self.max_pending:
+                self._pending.pop(0)
+                self.dropped += 1
+
+        message_id = str(uuid.uuid4())
+        self._pending.append({
+            "id": message_id,
+            "patient_id": patient_id,
+            "message": message,
+            "is_user": is_user,
+            "created_at": datetime.now(),
+        })
+
+        if self._task is None:
+            # No background flusher running (e.g. outside the app lifespan): write through
+            await self.flush()
+        elif len(self._pending) >= self.batch_size:
+            self._schedule_flush()
+
+        return message_id
+
+    def _unflushed_for(self, patient_id: str) -> List[Dict[str, Any]]:
+        return [row for row in self._in_flight + self._pending if row["patient_id"] == patient_id]
+
     async def get_chat_history(self, patient_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Retrieve chat history for a patient."""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
+        """Retrieve chat history for a patient, including messages not yet flushed."""
+        if not self.db.is_available:
             return []
-        
+
         try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
-                    query = """
-                        SELECT id, message, "isUser", "createdAt"
-                        FROM "ChatHistory"
-                        WHERE "patientId" = $1
-                        ORDER BY "createdAt" DESC
-                        LIMIT $2
-                    """
-                    
-                    rows = await conn.fetch(query, patient_id, limit)
-                    
-                    # Convert to list of dictionaries and reverse order (oldest first)
-                    chat_history = []
-                    for row in reversed(rows):
-                        chat_history.append({
-                            "id": row["id"],
-                            "message": row["message"],
-                            "is_user": row["isUser"],
-                            "created_at": row["createdAt"].isoformat() if row["createdAt"] else None
-                        })
-                    
-                    return chat_history
-                    
+            # Snapshot buffered rows before querying so a concurrent flush cannot hide them
+            unflushed = self._unflushed_for(patient_id)
+
+            async with self.db.acquire() as conn:
+                query = """
+                    SELECT id, message, "isUser", "createdAt"
+                    FROM "ChatHistory"
+                    WHERE "patientId" = $1
+                    ORDER BY "createdAt" DESC
+                    LIMIT $2
+                """
+
+                rows = await conn.fetch(query, patient_id, limit)
+
+                # Merge buffered rows (read-your-writes), dedupe by id, keep newest `limit`
+                messages = {row["id"]: (row["createdAt"], row["message"], row["isUser"]) for row in rows}
+                for row in unflushed:
+                    messages.setdefault(row["id"], (row["created_at"], row["message"], row["is_user"]))
+                ordered = sorted(messages.items(), key=lambda item: item[1][0] or datetime.min)[-limit:]
+
+                # Convert to list of dictionaries (oldest first)
+                chat_history = []
+                for message_id, (created_at, message, is_user) in ordered:
+                    chat_history.append({
+                        "id": message_id,
+                        "message": message,
+                        "is_user": is_user,
+                        "created_at": created_at.isoformat() if created_at else None
+                    })
+
+                return chat_history
+
         except Exception as e:
             print(f"Error retrieving chat history: {e}")
             return []
-    
+
     async def clear_chat_history(self, patient_id: str) -> bool:
         """Clear all chat history for a patient."""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
+        if not self.db.is_available:
             return False
-        
+
         try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
+            # Hold the flush lock so an in-flight batch cannot re-insert rows after the delete
+            async with self._flush_lock:
+                self._pending = [row for row in self._pending if row["patient_id"] != patient_id]
+                async with self.db.acquire() as conn:
                     query = """
                         DELETE FROM "ChatHistory"
                         WHERE "patientId" = $1
                     """
-                    
+
                     await conn.execute(query, patient_id)
                     return True
-                    
+
         except Exception as e:
             print(f"Error clearing chat history: {e}")
             return False
 
+    def stats(self) -> Dict[str, Any]:
+        """Return write-behind buffer counters."""
+        return {
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+            "max_pending": self.max_pending,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors,
+            "dropped": self.dropped,
+        }
+
 
 # Global instance
 chat_history_service = ChatHistoryService()
@@ -0,0 +1,126 @@
+"""
+Bounded conversation memory for the patient chatbot.
+
+The last ``recent_turns`` exchanges are replayed verbatim; everything older is
+folded into a per-patient rolling summary. Summaries are updated incrementally
+in the background (only messages not yet folded are sent), so building a prompt
+never waits on summarization and prompt size stays flat however long a patient
+chats.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .chat_history import ChatHistoryService, chat_history_service
+from .config import settings
+
+Summarizer = Callable[[str, str], Awaitable[str]]
+
+
+@dataclass
+class _Summary:
+    text: str
+    # Id and timestamp of the newest message folded into the summary
+    last_id: Optional[str]
+    last_created_at: Optional[str]
+    updated_at: float
+
+
+class ChatMemory:
+    """Per-patient rolling summaries plus recent turns read from chat history."""
+
+    def __init__(self, summarize: Summarizer, history: ChatHistoryService = chat_history_service,
+                 recent_turns: Optional[int] = None, max_patients: Optional[int] = None):
+        self.summarize = summarize
+        self.history = history
+        self.recent_turns = recent_turns if recent_turns is not None else settings.chat_memory_recent_turns
+        self.max_patients = max_patients if max_patients is not None else settings.chat_memory_max_patients
+        self._summaries: "OrderedDict[str, _Summary]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.summary_updates = 0
+        self.summary_errors = 0
+
+    @staticmethod
+    def _unfolded(older: List[Dict[str, Any]], summary: Optional[_Summary]) -> List[Dict[str, Any]]:
+        """Older messages not yet folded into the summary."""
+        if summary is None or summary.last_id is None:
+            return older
+        for index, message in enumerate(older):
+            if message["id"] == summary.last_id:
+                return older[index + 1:]
+        # The folded marker scrolled out of the fetched window: fall back to timestamps
+        return [m for m in older if (m["created_at"] or "") > (summary.last_created_at or "")]
+
+    async def get(self, patient_id: str, current_message: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """Return (summary, recent messages oldest first), excluding the message being answered."""
+        history = await self.history.get_chat_history(patient_id, limit=settings.chat_memory_fetch_limit)
+        # The endpoint saves the question before answering it; do not replay it as history
+        if history and history[-1]["is_user"] and history[-1]["message"].strip() == current_message.strip():
+            history = history[:-1]
+
+        keep = self.recent_turns * 2
+        recent = history[-keep:] if keep else []
+        older = history[:-keep] if keep else history
+
+        summary = self._summaries.get(patient_id)
+        if summary is not None:
+            self._summaries.move_to_end(patient_id)
+        unfolded = self._unfolded(older, summary)
+        if unfolded:
+            self._schedule_fold(patient_id, unfolded)
+        return (summary.text if summary else ""), recent
+
+    def _schedule_fold(self, patient_id: str, messages: List[Dict[str, Any]]) -> None:
+        task = self._tasks.get(patient_id)
+        if task is not None and not task.done():
+            return  # the next request picks up whatever this fold misses
+        self._tasks[patient_id] = asyncio.get_running_loop().create_task(self._fold(patient_id, messages))
+
+    async def _fold(self, patient_id: str, messages: List[Dict[str, Any]]) -> None:
+        previous = self._summaries.get(patient_id)
+        transcript = "\n".join(
+            f"{'Patient' if m['is_user'] else 'Assistant'}: {m['message']}" for m in messages
+        )
+        try:
+            text = await self.summarize(previous.text if previous else "", transcript)
+        except Exception as e:
+            self.summary_errors += 1
+            print(f"Error updating chat summary: {e}")
+            return
+        finally:
+            if self._tasks.get(patient_id) is asyncio.current_task():
+                del self._tasks[patient_id]
+        # A clear() while summarizing drops the result instead of resurrecting the old conversation
+        if self._summaries.get(patient_id) is not previous:
+            return
+        self._summaries[patient_id] = _Summary(
+            text=text.strip(),
+            last_id=messages[-1]["id"],
+            last_created_at=messages[-1]["created_at"],
+            updated_at=time.time(),
+        )
+        self._summaries.move_to_end(patient_id)
+        self.summary_updates += 1
+        while len(self._summaries) > self.max_patients:
+            self._summaries.popitem(last=False)
+
+    def clear(self, patient_id: str) -> None:
+        """Forget a patient's summary, e.g. after their chat history was cleared."""
+        self._summaries.pop(patient_id, None)
+        task = self._tasks.pop(patient_id, None)
+        if task is not None:
+            task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return summary cache counters."""
+        return {
+            "patients": len(self._summaries),
+            "max_patients": self.max_patients,
+            "recent_turns": self.recent_turns,
+            "summaries_in_progress": sum(1 for task in self._tasks.values() if not task.done()),
+            "summary_updates": self.summary_updates,
+            "summary_errors": self.summary_errors,
+        }
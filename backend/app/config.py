@@ -23,8 +23,124 @@ class Settings:
     cerebras_base_url: str = os.getenv("CEREBRAS_BASE_URL", "https://api.cerebras.ai/v1")
     cerebras_model: str = os.getenv("CEREBRAS_MODEL", "llama-3.1-8b-instruct")
 
+    # Notes generation: "split" (notes + prescription calls) or "combined" (one structured call)
+    notes_generation_mode: str = os.getenv("NOTES_GENERATION_MODE", "split")
+
+    # Map-reduce processing of long transcripts
+    notes_map_reduce_threshold_chars: int = int(os.getenv("NOTES_MAP_REDUCE_THRESHOLD_CHARS", "40000"))
+    notes_chunk_chars: int = int(os.getenv("NOTES_CHUNK_CHARS", "12000"))
+    notes_chunk_overlap_chars: int = int(os.getenv("NOTES_CHUNK_OVERLAP_CHARS", "800"))
+    notes_map_concurrency: int = int(os.getenv("NOTES_MAP_CONCURRENCY", "4"))
+
+    # Generated notes cache (set NOTES_CACHE_DIR to enable the on-disk tier)
+    notes_cache_max_entries: int = int(os.getenv("NOTES_CACHE_MAX_ENTRIES", "256"))
+    notes_cache_ttl_seconds: float = float(os.getenv("NOTES_CACHE_TTL_SECONDS", "86400"))
+    notes_cache_dir: str = os.getenv("NOTES_CACHE_DIR", "")
+    notes_cache_disk_max_entries: int = int(os.getenv("NOTES_CACHE_DISK_MAX_ENTRIES", "5000"))
+
+    # Meet audio ingest queue (policy when full: block | drop_oldest | drop_newest)
+    meet_audio_queue_max_chunks: int = int(os.getenv("MEET_AUDIO_QUEUE_MAX_CHUNKS", "64"))
+    meet_audio_drop_policy: str = os.getenv("MEET_AUDIO_DROP_POLICY", "block").lower()
+    meet_audio_block_timeout: float = float(os.getenv("MEET_AUDIO_BLOCK_TIMEOUT", "2"))
+
+    # Streaming session limits (idle TTLs in seconds; the reaper runs every SESSION_REAP_INTERVAL)
+    stt_max_sessions: int = int(os.getenv("STT_MAX_SESSIONS", "50"))
+    stt_session_idle_ttl: float = float(os.getenv("STT_SESSION_IDLE_TTL", "900"))
+    meet_max_sessions: int = int(os.getenv("MEET_MAX_SESSIONS", "20"))
+    meet_session_idle_ttl: float = float(os.getenv("MEET_SESSION_IDLE_TTL", "300"))
+    session_reap_interval: float = float(os.getenv("SESSION_REAP_INTERVAL", "30"))
+    # Multi-worker session registry (backend: memory | sqlite | postgres). WORKER_URL is the address
+    # other workers use to reach this one; without it they answer 421 with a routing hint instead
+    worker_id: str = os.getenv("WORKER_ID", "")
+    worker_url: str = os.getenv("WORKER_URL", "")
+    session_registry_backend: str = os.getenv("SESSION_REGISTRY_BACKEND", "memory").lower()
+    session_registry_path: str = os.getenv("SESSION_REGISTRY_PATH", "")
+    session_registry_heartbeat: float = float(os.getenv("SESSION_REGISTRY_HEARTBEAT", "15"))
+    session_registry_stale_seconds: float = float(os.getenv("SESSION_REGISTRY_STALE_SECONDS", "60"))
+
+    # Pre-started STT sessions kept ready for /stt/session/start (0 disables the pool)
+    stt_pool_size: int = int(os.getenv("STT_POOL_SIZE", "0"))
+
+    # Meet transcript storage: recent segments in memory, all segments written behind per appointment
+    meet_transcript_memory_segments: int = int(os.getenv("MEET_TRANSCRIPT_MEMORY_SEGMENTS", "200"))
+    meet_transcript_batch_size: int = int(os.getenv("MEET_TRANSCRIPT_BATCH_SIZE", "20"))
+    meet_transcript_flush_interval: float = float(os.getenv("MEET_TRANSCRIPT_FLUSH_INTERVAL", "5"))
+    meet_transcript_max_pending: int = int(os.getenv("MEET_TRANSCRIPT_MAX_PENDING", "2000"))
+    # Longest long-poll wait, also the SSE keepalive interval
+    meet_transcript_max_wait: float = float(os.getenv("MEET_TRANSCRIPT_MAX_WAIT", "25"))
+
+    # Meet streaming STT pipeline (input: webm | pcm16, backend: cartesia | fake)
+    meet_audio_input_format: str = os.getenv("MEET_AUDIO_INPUT_FORMAT", "webm").lower()
+    meet_audio_ring_seconds: float = float(os.getenv("MEET_AUDIO_RING_SECONDS", "10"))
+    meet_stt_backend: str = os.getenv("MEET_STT_BACKEND", "cartesia").lower()
+    meet_fake_stt_script: str = os.getenv("MEET_FAKE_STT_SCRIPT", "")
+    ffmpeg_path: str = os.getenv("FFMPEG_PATH", "ffmpeg")
+
+    # Rolling notes drafted during live Meet consultations
+    rolling_notes_enabled: bool = os.getenv("ROLLING_NOTES_ENABLED", "true").lower() == "true"
+    rolling_notes_interval_seconds: float = float(os.getenv("ROLLING_NOTES_INTERVAL_SECONDS", "30"))
+    rolling_notes_min_segments: int = int(os.getenv("ROLLING_NOTES_MIN_SEGMENTS", "8"))
+
+    # Chatbot conversation memory: recent turns verbatim, older turns as a rolling summary
+    chat_memory_recent_turns: int = int(os.getenv("CHAT_MEMORY_RECENT_TURNS", "3"))
+    chat_memory_fetch_limit: int = int(os.getenv("CHAT_MEMORY_FETCH_LIMIT", "50"))
+    chat_memory_message_tokens: int = int(os.getenv("CHAT_MEMORY_MESSAGE_TOKENS", "300"))
+    chat_memory_summary_tokens: int = int(os.getenv("CHAT_MEMORY_SUMMARY_TOKENS", "400"))
+    chat_memory_max_patients: int = int(os.getenv("CHAT_MEMORY_MAX_PATIENTS", "1000"))
+
+    # Per-patient relevance index over transcripts and AI notes (set RELEVANCE_INDEX_DIR to persist)
+    chatbot_retrieval_enabled: bool = os.getenv("CHATBOT_RETRIEVAL_ENABLED", "true").lower() == "true"
+    relevance_index_dir: str = os.getenv("RELEVANCE_INDEX_DIR", "")
+    relevance_top_k: int = int(os.getenv("RELEVANCE_TOP_K", "6"))
+    relevance_chunk_chars: int = int(os.getenv("RELEVANCE_CHUNK_CHARS", "1200"))
+    relevance_chunk_overlap_chars: int = int(os.getenv("RELEVANCE_CHUNK_OVERLAP_CHARS", "150"))
+    relevance_max_patients: int = int(os.getenv("RELEVANCE_MAX_PATIENTS", "200"))
+
+    # Chatbot prompt budget (tokens are estimated at PROMPT_CHARS_PER_TOKEN characters each)
+    chatbot_context_tokens: int = int(os.getenv("CHATBOT_CONTEXT_TOKENS", "3000"))
+    chatbot_max_prompt_tokens: int = int(os.getenv("CHATBOT_MAX_PROMPT_TOKENS", "6000"))
+    prompt_chars_per_token: float = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "3.5"))
+
+    # Outbound LLM limiter (0 disables the corresponding token bucket)
+    llm_requests_per_minute: float = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+    llm_tokens_per_minute: float = float(os.getenv("LLM_TOKENS_PER_MINUTE", "150000"))
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    llm_max_queue_wait: float = float(os.getenv("LLM_MAX_QUEUE_WAIT", "30"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+    # Shared outbound HTTP client settings
+    http_http2: bool = os.getenv("HTTP_HTTP2", "true").lower() == "true"
+    http_max_connections: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+    http_max_keepalive_connections: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    http_keepalive_expiry: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    http_connect_timeout: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+    http_read_timeout: float = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+
     # Database settings
     database_url: str = os.getenv("DATABASE_URL", "")
+    db_pool_min_size: int = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+    db_pool_max_size: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    db_pool_max_inactive_lifetime: float = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+    db_statement_cache_size: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+    # Patient context retrieval: "bundle" (single CTE query), "parallel" or "serial"
+    patient_data_fetch_mode: str = os.getenv("PATIENT_DATA_FETCH_MODE", "bundle")
+
+    # Write-behind chat history persistence
+    chat_history_batch_size: int = int(os.getenv("CHAT_HISTORY_BATCH_SIZE", "50"))
+    chat_history_flush_interval: float = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "0.5"))
+    chat_history_max_pending: int = int(os.getenv("CHAT_HISTORY_MAX_PENDING", "5000"))
+
+    # Formatted patient context cache for the chatbot
+    context_cache_max_entries: int = int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", "1000"))
+    context_cache_ttl_seconds: float = float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "600"))
+
+    # MedicalTests catalog cache
+    medical_tests_refresh_seconds: float = float(os.getenv("MEDICAL_TESTS_REFRESH_SECONDS", "3600"))
+    medical_tests_seed_path: str = os.getenv(
+        "MEDICAL_TESTS_SEED_PATH",
+        os.path.join(os.path.dirname(__file__), '..', '..', 'MedicalTests.json'),
+    )
 
 
 settings = Settings()
@@ -45,3 +161,20 @@ def validate_settings() -> None:
         missing.append("CEREBRAS_API_KEY")
     if missing:
         raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+
+
+# Settings that only accept a fixed set of values
+SETTING_CHOICES = {
+    "MEET_AUDIO_DROP_POLICY": ("meet_audio_drop_policy", ("block", "drop_oldest", "drop_newest")),
+}
+
+
+def validate_choices() -> None:
+    """Reject unknown values for enumerated settings; called once at startup."""
+    invalid = []
+    for env_name, (attr, choices) in SETTING_CHOICES.items():
+        value = getattr(settings, attr)
+        if value not in choices:
+            invalid.append(f"{env_name}={value!r} (expected one of: {', '.join(choices)})")
+    if invalid:
+        raise RuntimeError(f"Invalid environment variables: {'; '.join(invalid)}")
@@ -0,0 +1,144 @@
+"""
+Versioned LRU + TTL cache of formatted patient chatbot context.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from .config import settings
+from .db import Database, database
+
+
+@dataclass
+class _CacheEntry:
+    version: str
+    context: str
+    stored_at: float
+
+
+class PatientContextCache:
+    """Caches the formatted context string per patient, validated by a cheap version stamp.
+
+    The version stamp combines the newest ``updatedAt``/``createdAt`` across the
+    patient's profile, appointments and transcriptions with their row counts, so any
+    write (or delete) made by the frontend changes it even without explicit invalidation.
+    """
+
+    VERSION_QUERY = """
+        SELECT
+            GREATEST(
+                (SELECT max(a."updatedAt") FROM "Appointment" a WHERE a."patientId" = $1),
+                (SELECT pp."updatedAt" FROM "PatientProfile" pp WHERE pp."userId" = $1),
+                (SELECT max(at."createdAt") FROM "AppointmentTranscription" at
+                 JOIN "Appointment" a ON at."appointmentId" = a.id
+                 WHERE a."patientId" = $1)
+            ) AS updated_at,
+            (SELECT count(*) FROM "Appointment" a WHERE a."patientId" = $1) AS appointments,
+            (SELECT count(*) FROM "AppointmentTranscription" at
+             JOIN "Appointment" a ON at."appointmentId" = a.id
+             WHERE a."patientId" = $1) AS transcripts
+    """
+
+    def __init__(self, db: Database = database, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.db = db
+        self.max_entries = max_entries if max_entries is not None else settings.context_cache_max_entries
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.context_cache_ttl_seconds
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    async def get_version(self, patient_id: str) -> Optional[str]:
+        """Return the patient's current data version stamp, or None if it cannot be read."""
+        if not self.db.is_available:
+            return None
+        try:
+            async with self.db.acquire() as conn:
+                row = await conn.fetchrow(self.VERSION_QUERY, patient_id)
+        except Exception as e:
+            print(f"Error reading patient context version: {e}")
+            return None
+        if not row:
+            return None
+        updated_at = row["updated_at"].isoformat() if row["updated_at"] else "-"
+        return f"{updated_at}|{row['appointments']}|{row['transcripts']}"
+
+    def get(self, patient_id: str, version: Optional[str]) -> Optional[str]:
+        """Return the cached context if present, unexpired and at the given version."""
+        entry = self._entries.get(patient_id)
+        if entry is None or version is None:
+            self.misses += 1
+            return None
+        if time.monotonic() - entry.stored_at > self.ttl_seconds:
+            self._entries.pop(patient_id, None)
+            self.expired += 1
+            self.misses += 1
+            return None
+        if entry.version != version:
+            self._entries.pop(patient_id, None)
+            self.stale += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(patient_id)
+        self.hits += 1
+        return entry.context
+
+    def put(self, patient_id: str, version: Optional[str], context: str) -> None:
+        """Store a formatted context at the given version, evicting the least recently used entry."""
+        if version is None or self.max_entries <= 0:
+            return
+        self._entries[patient_id] = _CacheEntry(version=version, context=context, stored_at=time.monotonic())
+        self._entries.move_to_end(patient_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, patient_id: str) -> bool:
+        """Drop the cached context for a patient. Returns True if an entry was removed."""
+        removed = self._entries.pop(patient_id, None) is not None
+        if removed:
+            self.invalidations += 1
+        return removed
+
+    async def invalidate_appointment(self, appointment_id: str) -> Optional[str]:
+        """Drop the cached context for the patient owning an appointment. Returns the patient id."""
+        if not self.db.is_available:
+            return None
+        try:
+            async with self.db.acquire() as conn:
+                patient_id = await conn.fetchval(
+                    'SELECT "patientId" FROM "Appointment" WHERE id = $1', appointment_id
+                )
+        except Exception as e:
+            print(f"Error resolving appointment for context invalidation: {e}")
+            return None
+        if patient_id:
+            self.invalidate(patient_id)
+        return patient_id
+
+    def clear(self) -> None:
+        """Drop every cached context."""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "expired": self.expired,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Global instance
+patient_context_cache = PatientContextCache()
@@ -0,0 +1,62 @@
+"""
+Shared database connection pool for AarogyaAI backend services.
+"""
+
+from typing import Optional
+
+# Try to import asyncpg for database operations
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    ASYNCPG_AVAILABLE = False
+    asyncpg = None
+
+from .config import settings
+
+
+class Database:
+    """Owns the single asyncpg pool shared by all services for the app lifetime."""
+
+    def __init__(self, database_url: Optional[str] = None):
+        self.database_url = database_url if database_url is not None else settings.database_url
+        self.pool = None
+
+    @property
+    def is_configured(self) -> bool:
+        """Whether a database URL is set and the asyncpg driver is installed."""
+        return bool(self.database_url) and ASYNCPG_AVAILABLE
+
+    @property
+    def is_available(self) -> bool:
+        """Whether the pool has been created and can hand out connections."""
+        return self.pool is not None
+
+    async def connect(self) -> None:
+        """Create the pool. Called once from the FastAPI lifespan hook."""
+        if self.pool is not None or not self.is_configured:
+            return
+        self.pool = await asyncpg.create_pool(
+            self.database_url,
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            max_inactive_connection_lifetime=settings.db_pool_max_inactive_lifetime,
+            statement_cache_size=settings.db_statement_cache_size,
+        )
+
+    async def close(self) -> None:
+        """Close the pool on application shutdown."""
+        if self.pool is None:
+            return
+        pool, self.pool = self.pool, None
+        await pool.close()
+
+    def acquire(self):
+        """Acquire a connection from the shared pool (use as ``async with``)."""
+        if self.pool is None:
+            raise RuntimeError("Database pool is not initialised")
+        return self.pool.acquire()
+
+
+# Global instance
+database = Database()
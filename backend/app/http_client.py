@@ -0,0 +1,130 @@
+"""
+Shared outbound HTTP client for Cerebras API calls.
+"""
+
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from .config import settings
+
+
+class SharedHTTPClient:
+    """Owns one long-lived, keep-alive ``httpx.AsyncClient`` for the app lifetime."""
+
+    def __init__(self) -> None:
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests_sent = 0
+        self.requests_in_flight = 0
+        self.request_errors = 0
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        )
+        timeout = httpx.Timeout(
+            connect=settings.http_connect_timeout,
+            read=settings.http_read_timeout,
+            write=settings.http_connect_timeout,
+            pool=settings.http_connect_timeout,
+        )
+        http2 = settings.http_http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                # httpx needs the optional h2 package for HTTP/2
+                http2 = False
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it lazily if the lifespan hook has not run."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def start(self) -> None:
+        """Create the client. Called once from the FastAPI lifespan hook."""
+        _ = self.client
+
+    async def close(self) -> None:
+        """Close the client and its connection pool on application shutdown."""
+        if self._client is None:
+            return
+        client, self._client = self._client, None
+        await client.aclose()
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        """POST through the shared connection pool, keeping request counters."""
+        self.requests_sent += 1
+        self.requests_in_flight += 1
+        try:
+            return await self.client.post(url, **kwargs)
+        except Exception:
+            self.request_errors += 1
+            raise
+        finally:
+            self.requests_in_flight -= 1
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """Open a streaming request through the shared connection pool."""
+        self.requests_sent += 1
+        self.requests_in_flight += 1
+        try:
+            async with self.client.stream(method, url, **kwargs) as response:
+                yield response
+        except Exception:
+            self.request_errors += 1
+            raise
+        finally:
+            self.requests_in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request counters and connection pool statistics."""
+        stats: Dict[str, Any] = {
+            "requests_sent": self.requests_sent,
+            "requests_in_flight": self.requests_in_flight,
+            "request_errors": self.request_errors,
+            "max_connections": settings.http_max_connections,
+            "max_keepalive_connections": settings.http_max_keepalive_connections,
+            "http2_requested": settings.http_http2,
+            "open": self._client is not None and not self._client.is_closed,
+        }
+        if self._client is None:
+            return stats
+
+        # httpx does not expose pool state publicly; read it from the httpcore pool if present
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        stats["connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+        stats["http2_connections"] = sum(1 for c in connections if "HTTP/2" in repr(c))
+        return stats
+
+
+async def iter_completion_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """Yield content deltas from an OpenAI-compatible ``stream: true`` chat completion."""
+    async for line in response.aiter_lines():
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        chunk = json.loads(data)
+        choices = chunk.get("choices") or []
+        if not choices:
+            continue
+        content = (choices[0].get("delta") or {}).get("content")
+        if content:
+            yield content
+
+
+# Global instance
+http_client = SharedHTTPClient()
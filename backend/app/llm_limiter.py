@@ -0,0 +1,276 @@
+"""
+Adaptive outbound limiter shared by all Cerebras calls.
+
+Requests wait in a priority queue and are released by two token buckets (requests
+and estimated tokens per minute) plus a concurrency cap. All three are scaled by
+an AIMD factor: each rate-limited response halves it and honours ``retry-after``,
+and each successful response adds a small step back.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from .config import settings
+from .http_client import http_client
+from .prompt_budget import estimate_tokens
+
+
+# Lower value is served first
+PRIORITY_NOTES = 0
+PRIORITY_CHATBOT = 10
+PRIORITY_BACKGROUND = 20
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]], max_output_tokens: int) -> int:
+    """Estimated token cost of a chat completion: prompt tokens plus the output budget."""
+    return sum(estimate_tokens(message.get("content") or "") for message in messages) + max_output_tokens
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """Parse a ``retry-after`` header given in seconds or as an HTTP date."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class _Bucket:
+    """Token bucket refilled continuously at ``rate`` per second up to ``capacity``."""
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.per_minute = per_minute
+        self.burst_seconds = burst_seconds
+        self.level = self.capacity(1.0)
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0
+
+    def capacity(self, factor: float) -> float:
+        return max(1.0, self.per_minute / 60 * self.burst_seconds * factor)
+
+    def refill(self, now: float, factor: float) -> None:
+        if not self.enabled:
+            return
+        self.level = min(self.capacity(factor), self.level + (now - self.updated) * self.per_minute / 60 * factor)
+        self.updated = now
+
+    def seconds_until(self, amount: float, factor: float) -> float:
+        if not self.enabled or self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.per_minute / 60 * factor)
+
+
+class LLMPermit:
+    """Handle for one admitted request; report 2xx and 429 responses through it so the limiter adapts."""
+
+    def __init__(self, limiter: "LLMLimiter", wait_seconds: float):
+        self.limiter = limiter
+        self.wait_seconds = wait_seconds
+        self.rate_limited_flag = False
+        self.succeeded_flag = False
+
+    def succeeded(self) -> None:
+        self.succeeded_flag = True
+
+    def rate_limited(self, retry_after: Optional[str] = None) -> None:
+        self.rate_limited_flag = True
+        self.limiter.on_rate_limited(retry_after)
+
+
+class LLMLimiter:
+    """Priority-queued, AIMD-adapted token bucket limiter for outbound LLM calls."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_concurrency: Optional[int] = None, max_queue_wait: Optional[float] = None,
+                 max_retries: Optional[int] = None, burst_seconds: float = 10.0):
+        self.requests = _Bucket(
+            requests_per_minute if requests_per_minute is not None else settings.llm_requests_per_minute, burst_seconds
+        )
+        self.tokens = _Bucket(
+            tokens_per_minute if tokens_per_minute is not None else settings.llm_tokens_per_minute, burst_seconds
+        )
+        self.max_concurrency = max_concurrency if max_concurrency is not None else settings.llm_max_concurrency
+        self.max_queue_wait = max_queue_wait if max_queue_wait is not None else settings.llm_max_queue_wait
+        self.max_retries = max_retries if max_retries is not None else settings.llm_max_retries
+        self.rate_factor = 1.0
+        self.min_rate_factor = 0.1
+        self.increase_step = 0.05
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self._queue: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._waits: Deque[float] = deque(maxlen=500)
+        self.admitted = 0
+        self.rate_limited_count = 0
+        self.timeouts = 0
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(1, math.floor(self.max_concurrency * self.rate_factor))
+
+    def _grant_delay(self, tokens: float, now: float) -> float:
+        """Seconds until a request of this size could be admitted (0 = now)."""
+        if self.in_flight >= self.concurrency_limit:
+            return math.inf  # woken by release()
+        delay = max(0.0, self.paused_until - now)
+        delay = max(delay, self.requests.seconds_until(1, self.rate_factor))
+        # A request larger than the whole bucket is admitted once the bucket is full
+        needed = min(tokens, self.tokens.capacity(self.rate_factor))
+        return max(delay, self.tokens.seconds_until(needed, self.rate_factor))
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        now = time.monotonic()
+        self.requests.refill(now, self.rate_factor)
+        self.tokens.refill(now, self.rate_factor)
+        while self._queue:
+            _, _, tokens, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            delay = self._grant_delay(tokens, now)
+            if delay > 0:
+                if math.isfinite(delay):
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            if self.requests.enabled:
+                self.requests.level -= 1
+            if self.tokens.enabled:
+                self.tokens.level -= min(tokens, self.tokens.level)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _schedule(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    async def acquire(self, priority: int, tokens: int) -> LLMPermit:
+        """Wait for admission; raises ValueError if the queue wait exceeds ``max_queue_wait``."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), float(tokens), future))
+        enqueued = time.monotonic()
+        self._schedule()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_queue_wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if future.done() and not future.cancelled():
+                # Admitted at the last moment; give the slot back
+                self.release()
+            future.cancel()
+            raise ValueError("AI service is busy. Please try again shortly.")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            future.cancel()
+            raise
+        wait = time.monotonic() - enqueued
+        self._waits.append(wait)
+        self.admitted += 1
+        return LLMPermit(self, wait)
+
+    def release(self) -> None:
+        """Free a concurrency slot and admit the next waiter if possible."""
+        self.in_flight = max(0, self.in_flight - 1)
+        self._schedule()
+
+    def on_success(self) -> None:
+        """Additive increase after a successful (2xx) response."""
+        self.rate_factor = min(1.0, self.rate_factor + self.increase_step)
+
+    def on_rate_limited(self, retry_after: Optional[str] = None) -> None:
+        """Multiplicative decrease and pause admissions for ``retry-after`` seconds."""
+        self.rate_limited_count += 1
+        self.rate_factor = max(self.min_rate_factor, self.rate_factor / 2)
+        self.paused_until = max(self.paused_until, time.monotonic() + parse_retry_after(retry_after))
+        # Drain the buckets so the reduced rate applies immediately
+        self.requests.level = min(self.requests.level, 0.0)
+        self.tokens.level = min(self.tokens.level, 0.0)
+
+    @asynccontextmanager
+    async def slot(self, priority: int, tokens: int) -> AsyncIterator[LLMPermit]:
+        """Hold an admission slot for the duration of one outbound request."""
+        permit = await self.acquire(priority, tokens)
+        try:
+            yield permit
+        finally:
+            # Errors, 5xx and failed connections must not raise the rate
+            if permit.succeeded_flag and not permit.rate_limited_flag:
+                self.on_success()
+            self.release()
+
+    async def post(self, url: str, *, priority: int, tokens: int, **kwargs: Any) -> httpx.Response:
+        """POST through the limiter, re-queueing rate-limited responses up to ``max_retries`` times."""
+        attempt = 0
+        while True:
+            async with self.slot(priority, tokens) as permit:
+                resp = await http_client.post(url, **kwargs)
+                if resp.status_code == 429:
+                    permit.rate_limited(resp.headers.get("retry-after"))
+                elif resp.is_success:
+                    permit.succeeded()
+            if resp.status_code != 429 or attempt >= self.max_retries:
+                return resp
+            attempt += 1
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, *, priority: int, tokens: int,
+                     **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """Open a streaming request through the limiter, holding the slot until the stream closes."""
+        attempt = 0
+        while True:
+            async with self.slot(priority, tokens) as permit:
+                async with http_client.stream(method, url, **kwargs) as resp:
+                    if resp.status_code == 429:
+                        permit.rate_limited(resp.headers.get("retry-after"))
+                        if attempt < self.max_retries:
+                            attempt += 1
+                            continue
+                    elif resp.is_success:
+                        permit.succeeded()
+                    yield resp
+                    return
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, wait times and adaptation state."""
+        waits = sorted(self._waits)
+        return {
+            "queue_depth": sum(1 for *_, future in self._queue if not future.done()),
+            "in_flight": self.in_flight,
+            "concurrency_limit": self.concurrency_limit,
+            "rate_factor": round(self.rate_factor, 3),
+            "paused_for_seconds": round(max(0.0, self.paused_until - time.monotonic()), 2),
+            "requests_per_minute": self.requests.per_minute,
+            "tokens_per_minute": self.tokens.per_minute,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited_count,
+            "queue_timeouts": self.timeouts,
+            "max_retries": self.max_retries,
+            "wait_avg_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+            "wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+
+
+# Global instance
+llm_limiter = LLMLimiter()
@@ -1,16 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
 import uuid
 
-from .config import validate_settings, settings
+from .config import validate_choices, validate_settings, settings
+from .db import database
+from .http_client import http_client
+from .llm_limiter import llm_limiter
+from .medical_tests import medical_test_catalog
+from .context_cache import patient_context_cache
+from .relevance_index import relevance_index
+from .sse import SSE_HEADERS, SSE_KEEPALIVE, sse_event
+from .notes_cache import notes_cache
 from .stt_manager import stt_manager
-from .ai_notes import generate_notes_and_prescription
-from .patient_chatbot import generate_chatbot_response
+from .session_limits import SessionLimitError
+from .session_registry import session_registry
+from .session_routing import SessionRoutingMiddleware
+from .ai_notes import generate_notes_and_prescription, stream_notes_and_prescription, last_pipeline_timings, notes_flight
+from .patient_chatbot import generate_chatbot_response, stream_chatbot_response, chatbot_flight, patient_data_service, chat_memory
+from .single_flight import fingerprint
 from .chat_history import chat_history_service
 from .payment_service import payment_service, PaymentRequest
-from .meet_transcriber import meet_transcriber_manager, MeetTranscriptionRequest
+from .meet_transcriber import meet_transcriber_manager, MeetTranscriptionRequest, cleanup_meet_transcriber
 
 
 class StartResponse(BaseModel):
@@ -25,7 +39,56 @@ class StopResponse(BaseModel):
     ok: bool
 
 
-app = FastAPI(title="AarogyaAI STT Service", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail fast on misspelled option values instead of silently running with a fallback
+    validate_choices()
+    # One connection pool for the whole process, shared by every service
+    try:
+        await database.connect()
+    except Exception as e:
+        print(f"Error creating database pool: {e}")
+    # One keep-alive HTTP client for all Cerebras calls
+    await http_client.start()
+    # MedicalTests catalog is loaded once and refreshed in the background
+    await medical_test_catalog.start()
+    # Chat messages are written behind in batches
+    await chat_history_service.start()
+    # Silero VAD is loaded once and shared; the optional STT session pool fills in the background
+    if settings.cartesia_api_key:
+        await stt_manager.warm_up()
+    # Other workers find the sessions this one owns through the shared registry
+    await session_registry.start()
+    # Abandoned STT and Meet sessions are closed after their idle TTL
+    stt_manager.reaper.start()
+    meet_transcriber_manager.reaper.start()
+    try:
+        yield
+    finally:
+        await meet_transcriber_manager.reaper.stop()
+        await stt_manager.reaper.stop()
+        # Flush Meet transcripts and buffered chat messages before the pool goes away
+        await cleanup_meet_transcriber()
+        await stt_manager.stop_all()
+        await session_registry.close()
+        await chat_history_service.stop()
+        notes_cache.close()
+        await medical_test_catalog.stop()
+        await http_client.close()
+        await database.close()
+
+
+app = FastAPI(title="AarogyaAI STT Service", version="0.1.0", lifespan=lifespan)
+
+def _is_local_session(kind: str, session_id: str) -> bool:
+    if kind == "stt":
+        return stt_manager.has_session(session_id)
+    return session_id in meet_transcriber_manager.sessions
+
+
+# Requests for a session held by another worker are forwarded to it (or answered with a routing hint).
+# Added first so CORS wraps it and forwarded responses and 421 hints reach the browser
+app.add_middleware(SessionRoutingMiddleware, registry=session_registry, is_local=_is_local_session)
 
 # Allow frontend origin to call the backend
 app.add_middleware(
@@ -34,11 +97,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Worker"],
 )
 
 
+def _session_limit_exception(e: SessionLimitError) -> HTTPException:
+    # Capacity frees up when sessions stop or the next reaper pass closes idle ones
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(int(settings.session_reap_interval))},
+    )
+
+
 @app.post("/stt/session/start", response_model=StartResponse)
-async def start_session() -> StartResponse:
+async def start_session(response: Response) -> StartResponse:
     # If Cartesia is not configured, return a dummy session id so UI can proceed
     if not settings.cartesia_api_key:
         return StartResponse(session_id=str(uuid.uuid4()))
@@ -46,10 +119,24 @@ async def start_session() -> StartResponse:
         validate_settings()
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
-    session_id = await stt_manager.start_session()
+    try:
+        session_id = await stt_manager.start_session()
+    except SessionLimitError as e:
+        raise _session_limit_exception(e)
+    response.headers["X-Session-Worker"] = session_registry.worker.worker_id
     return StartResponse(session_id=session_id)
 
 
+@app.post("/stt/session/heartbeat", response_model=StopResponse)
+async def heartbeat_session(payload: StopRequest) -> StopResponse:
+    """Keep an STT session from being closed as idle"""
+    if not settings.cartesia_api_key:
+        return StopResponse(ok=True)
+    if not stt_manager.touch(payload.session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return StopResponse(ok=True)
+
+
 @app.post("/stt/session/stop", response_model=StopResponse)
 async def stop_session(payload: StopRequest) -> StopResponse:
     # If there was no real session (e.g., dummy id), just return ok
@@ -63,6 +150,7 @@ async def stop_session(payload: StopRequest) -> StopResponse:
 
 class TranscriptPayload(BaseModel):
     transcript: str
+    bypass_cache: bool = False
 
 
 class NotesResponse(BaseModel):
@@ -87,12 +175,54 @@ class ChatHistoryResponse(BaseModel):
 
 class PaymentLogsResponse(BaseModel):
     payments: list
+    next_cursor: Optional[str] = None
 
 
 class PaymentStatsResponse(BaseModel):
     statistics: dict
 
 
+class MetricsResponse(BaseModel):
+    metrics: dict
+
+
+@app.get("/metrics/http", response_model=MetricsResponse)
+async def get_http_metrics() -> MetricsResponse:
+    """Get request and connection pool statistics for the shared Cerebras HTTP client."""
+    return MetricsResponse(metrics=http_client.stats())
+
+
+@app.get("/metrics/single-flight", response_model=MetricsResponse)
+async def get_single_flight_metrics() -> MetricsResponse:
+    """Get how many duplicate notes/chatbot requests joined an in-flight generation."""
+    return MetricsResponse(metrics={"notes": notes_flight.stats(), "chatbot": chatbot_flight.stats()})
+
+
+@app.get("/metrics/llm-limiter", response_model=MetricsResponse)
+async def get_llm_limiter_metrics() -> MetricsResponse:
+    """Get queue depth, wait times and rate adaptation state of the outbound Cerebras limiter."""
+    return MetricsResponse(metrics=llm_limiter.stats())
+
+
+@app.get("/metrics/sessions", response_model=MetricsResponse)
+async def get_session_metrics() -> MetricsResponse:
+    """List live STT and Meet sessions with their age, idle time and memory estimates, plus limits."""
+    return MetricsResponse(metrics={"stt": stt_manager.stats(), "meet": meet_transcriber_manager.stats()})
+
+
+@app.get("/metrics/session-registry", response_model=MetricsResponse)
+async def get_session_registry_metrics() -> MetricsResponse:
+    """Get this worker's identity in the session registry and its lookup and forwarding counters."""
+    return MetricsResponse(metrics=await session_registry.stats())
+
+
+@app.post("/medical-tests/catalog/refresh", response_model=MetricsResponse)
+async def refresh_medical_tests_catalog() -> MetricsResponse:
+    """Reload the in-memory MedicalTests catalog on demand (e.g. after seeding new tests)."""
+    await medical_test_catalog.refresh()
+    return MetricsResponse(metrics=medical_test_catalog.stats())
+
+
 @app.post("/ai/notes", response_model=NotesResponse)
 async def generate_ai_notes(payload: TranscriptPayload) -> NotesResponse:
     try:
@@ -109,7 +239,9 @@ async def generate_ai_notes(payload: TranscriptPayload) -> NotesResponse:
         raise HTTPException(status_code=400, detail="Transcript is required")
 
     try:
-        notes, prescription = await generate_notes_and_prescription(payload.transcript.strip())
+        notes, prescription = await generate_notes_and_prescription(
+            payload.transcript.strip(), use_cache=not payload.bypass_cache
+        )
         return NotesResponse(notes=notes, prescription=prescription)
     except HTTPException:
         raise
@@ -117,6 +249,34 @@ async def generate_ai_notes(payload: TranscriptPayload) -> NotesResponse:
         raise HTTPException(status_code=502, detail=f"AI generation failed: {e}")
 
 
+def _notes_event_stream(transcript: str, use_cache: bool = True) -> StreamingResponse:
+    """Wrap streamed notes/prescription events as a Server-Sent Events response."""
+    async def event_stream():
+        try:
+            async for event, data in stream_notes_and_prescription(transcript, use_cache=use_cache):
+                yield sse_event(event, data)
+        except Exception as e:
+            yield sse_event("error", {"detail": f"AI generation failed: {e}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.post("/ai/notes/stream")
+async def generate_ai_notes_stream(payload: TranscriptPayload) -> StreamingResponse:
+    """Stream AI notes as Server-Sent Events.
+    
+    Emits one ``section`` event per completed notes section, then a ``prescription``
+    event with the prescription JSON and a final ``done`` event with the full notes.
+    """
+    if not settings.cerebras_api_key:
+        raise HTTPException(status_code=500, detail="Cerebras AI not configured")
+
+    if not payload.transcript or not payload.transcript.strip():
+        raise HTTPException(status_code=400, detail="Transcript is required")
+
+    return _notes_event_stream(payload.transcript.strip(), use_cache=not payload.bypass_cache)
+
+
 @app.post("/ai/chatbot", response_model=ChatbotResponse)
 async def intelligent_chatbot(payload: ChatbotPayload) -> ChatbotResponse:
     """Intelligent chatbot endpoint that uses patient data and Cerebras AI."""
@@ -136,7 +296,7 @@ async def intelligent_chatbot(payload: ChatbotPayload) -> ChatbotResponse:
     patient_id = payload.patient_id.strip()
     user_message = payload.message.strip()
 
-    try:
+    async def answer() -> str:
         # Save user message to chat history
         await chat_history_service.save_message(patient_id, user_message, is_user=True)
         
@@ -145,7 +305,11 @@ async def intelligent_chatbot(payload: ChatbotPayload) -> ChatbotResponse:
         
         # Save bot response to chat history
         await chat_history_service.save_message(patient_id, response, is_user=False)
-        
+        return response
+
+    try:
+        # A duplicate submit of the same question joins the in-flight answer (one LLM call, one history pair)
+        response = await chatbot_flight.do(fingerprint(patient_id, user_message), answer)
         return ChatbotResponse(response=response)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -153,6 +317,108 @@ async def intelligent_chatbot(payload: ChatbotPayload) -> ChatbotResponse:
         raise HTTPException(status_code=502, detail=f"Chatbot generation failed: {e}")
 
 
+@app.post("/ai/chatbot/stream")
+async def intelligent_chatbot_stream(payload: ChatbotPayload) -> StreamingResponse:
+    """Stream the chatbot response as Server-Sent Events.
+    
+    Emits ``delta`` events with ``{"text": ...}`` as tokens arrive, then a ``done`` event
+    with the full response (disclaimer included) once it has been saved to chat history.
+    Failures mid-stream are reported as an ``error`` event.
+    """
+    if not settings.cerebras_api_key:
+        raise HTTPException(status_code=500, detail="Cerebras AI not configured")
+    
+    if not payload.patient_id or not payload.patient_id.strip():
+        raise HTTPException(status_code=400, detail="Patient ID is required")
+    
+    if not payload.message or not payload.message.strip():
+        raise HTTPException(status_code=400, detail="Message is required")
+
+    patient_id = payload.patient_id.strip()
+    user_message = payload.message.strip()
+
+    async def event_stream():
+        # Save user message to chat history
+        await chat_history_service.save_message(patient_id, user_message, is_user=True)
+        
+        parts = []
+        try:
+            async for delta in stream_chatbot_response(patient_id, user_message):
+                parts.append(delta)
+                yield sse_event("delta", {"text": delta})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Chatbot generation failed: {e}"})
+            return
+        
+        # Persist the full response only once the stream has completed
+        response = "".join(parts)
+        await chat_history_service.save_message(patient_id, response, is_user=False)
+        yield sse_event("done", {"response": response})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+class ContextInvalidatePayload(BaseModel):
+    patient_id: Optional[str] = None
+    appointment_id: Optional[str] = None
+
+
+@app.post("/ai/chatbot/context/invalidate")
+async def invalidate_chatbot_context(payload: ContextInvalidatePayload):
+    """Drop the cached chatbot context after notes, prescriptions or transcripts are written."""
+    if not payload.patient_id and not payload.appointment_id:
+        raise HTTPException(status_code=400, detail="Patient ID or appointment ID is required")
+    
+    patient_id = payload.patient_id.strip() if payload.patient_id else None
+    if patient_id:
+        patient_context_cache.invalidate(patient_id)
+    elif payload.appointment_id:
+        patient_id = await patient_context_cache.invalidate_appointment(payload.appointment_id.strip())
+    return {"message": "Context invalidated", "patient_id": patient_id}
+
+
+@app.get("/metrics/notes-cache", response_model=MetricsResponse)
+async def get_notes_cache_metrics() -> MetricsResponse:
+    """Get hit/miss counters for the generated notes cache."""
+    return MetricsResponse(metrics=notes_cache.stats())
+
+
+@app.get("/metrics/notes-pipeline", response_model=MetricsResponse)
+async def get_notes_pipeline_metrics() -> MetricsResponse:
+    """Get per-stage timings of the most recent long-transcript map-reduce run."""
+    return MetricsResponse(metrics=dict(last_pipeline_timings))
+
+
+@app.get("/metrics/context-cache", response_model=MetricsResponse)
+async def get_context_cache_metrics() -> MetricsResponse:
+    """Get hit/miss counters for the chatbot patient context cache."""
+    return MetricsResponse(metrics=patient_context_cache.stats())
+
+
+@app.get("/metrics/chatbot-context", response_model=MetricsResponse)
+async def get_chatbot_context_metrics() -> MetricsResponse:
+    """Get token usage of the budgeted chatbot patient context."""
+    return MetricsResponse(metrics=patient_data_service.context_stats())
+
+
+@app.get("/metrics/relevance-index", response_model=MetricsResponse)
+async def get_relevance_index_metrics() -> MetricsResponse:
+    """Get size and usage counters of the per-patient transcript/notes relevance index."""
+    return MetricsResponse(metrics=relevance_index.stats())
+
+
+@app.get("/metrics/chat-memory", response_model=MetricsResponse)
+async def get_chat_memory_metrics() -> MetricsResponse:
+    """Get rolling conversation summary counters for the chatbot."""
+    return MetricsResponse(metrics=chat_memory.stats())
+
+
+@app.get("/metrics/chat-history", response_model=MetricsResponse)
+async def get_chat_history_metrics() -> MetricsResponse:
+    """Get write-behind buffer counters for chat history persistence."""
+    return MetricsResponse(metrics=chat_history_service.stats())
+
+
 @app.get("/ai/chatbot/history/{patient_id}", response_model=ChatHistoryResponse)
 async def get_chat_history(patient_id: str, limit: int = 50) -> ChatHistoryResponse:
     """Get chat history for a patient."""
@@ -175,6 +441,7 @@ async def clear_chat_history(patient_id: str):
     try:
         success = await chat_history_service.clear_chat_history(patient_id.strip())
         if success:
+            chat_memory.clear(patient_id.strip())
             return {"message": "Chat history cleared successfully"}
         else:
             raise HTTPException(status_code=500, detail="Failed to clear chat history")
@@ -185,11 +452,16 @@ async def clear_chat_history(patient_id: str):
 
 
 @app.get("/payment/logs/{doctor_id}", response_model=PaymentLogsResponse)
-async def get_payment_logs(doctor_id: str, limit: int = 50) -> PaymentLogsResponse:
-    """Get payment logs for a doctor."""
+async def get_payment_logs(doctor_id: str, limit: int = 50, cursor: Optional[str] = None) -> PaymentLogsResponse:
+    """Get payment logs for a doctor, one keyset page at a time (pass back next_cursor)."""
+    if limit < 1 or limit > 200:
+        raise HTTPException(status_code=400, detail="Limit must be between 1 and 200")
+    
     try:
-        payments = await payment_service.get_payment_logs(doctor_id, limit)
-        return PaymentLogsResponse(payments=payments)
+        payments, next_cursor = await payment_service.get_payment_logs_page(doctor_id, limit, cursor)
+        return PaymentLogsResponse(payments=payments, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve payment logs: {e}")
 
@@ -221,6 +493,7 @@ async def get_appointment_with_payment(appointment_id: str):
 class StopAndProcessRequest(BaseModel):
     session_id: str
     transcript: str
+    bypass_cache: bool = False
 
 
 @app.post("/stt/session/stop_and_process", response_model=NotesResponse)
@@ -235,12 +508,29 @@ async def stop_and_process(payload: StopAndProcessRequest) -> NotesResponse:
         raise HTTPException(status_code=400, detail="Transcript is required")
 
     try:
-        notes, prescription = await generate_notes_and_prescription(payload.transcript.strip())
+        notes, prescription = await generate_notes_and_prescription(
+            payload.transcript.strip(), use_cache=not payload.bypass_cache
+        )
         return NotesResponse(notes=notes, prescription=prescription)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"AI generation failed: {e}")
 
 
+@app.post("/stt/session/stop_and_process/stream")
+async def stop_and_process_stream(payload: StopAndProcessRequest) -> StreamingResponse:
+    """Stop the STT session and stream AI notes as Server-Sent Events (see /ai/notes/stream)."""
+    # Stop STT session if it exists (best-effort)
+    try:
+        await stt_manager.stop_session(payload.session_id)
+    except Exception:
+        pass
+
+    if not payload.transcript or not payload.transcript.strip():
+        raise HTTPException(status_code=400, detail="Transcript is required")
+
+    return _notes_event_stream(payload.transcript.strip(), use_cache=not payload.bypass_cache)
+
+
 # Meet Transcription Bot Endpoints
 
 class MeetTranscriptionResponse(BaseModel):
@@ -253,21 +543,38 @@ class MeetTranscriptionStatus(BaseModel):
     is_running: bool
     meet_url: str
     appointment_id: Optional[str] = None
+    audio_queue_depth: int = 0
+    audio_queue_max: int = 0
+    audio_drop_policy: Optional[str] = None
+    audio_chunks_received: int = 0
+    audio_bytes_received: int = 0
+    audio_chunks_dropped: int = 0
+    pipeline: Optional[dict] = None
+    transcript: Optional[dict] = None
 
 
 class MeetTranscriptionData(BaseModel):
     session_id: str
     transcriptions: list
+    interim: Optional[str] = None
+    # Pass as ``since`` on the next request to receive only newer segments
+    next_seq: int = 0
+    # Segments after ``since`` that already left memory (persisted with the appointment)
+    missed: int = 0
+    is_running: bool = True
 
 
 @app.post("/meet/transcription/start", response_model=MeetTranscriptionResponse)
-async def start_meet_transcription(payload: MeetTranscriptionRequest) -> MeetTranscriptionResponse:
+async def start_meet_transcription(payload: MeetTranscriptionRequest, response: Response) -> MeetTranscriptionResponse:
     """Start Google Meet transcription"""
     try:
         session_id = await meet_transcriber_manager.create_session(
             payload.meet_url, payload.appointment_id
         )
+        response.headers["X-Session-Worker"] = session_registry.worker.worker_id
         return MeetTranscriptionResponse(session_id=session_id, status="started")
+    except SessionLimitError as e:
+        raise _session_limit_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start Meet transcription: {e}")
 
@@ -285,6 +592,42 @@ async def stop_meet_transcription(payload: StopRequest) -> MeetTranscriptionResp
         raise HTTPException(status_code=500, detail=f"Failed to stop Meet transcription: {e}")
 
 
+@app.post("/meet/transcription/stop_and_process", response_model=NotesResponse)
+async def meet_stop_and_process(payload: StopRequest) -> NotesResponse:
+    """Stop Meet transcription and generate notes from the rolling draft.
+    
+    Most of the transcript has already been summarized in the background while the call
+    was running, so only the remaining tail is reconciled here.
+    """
+    session = meet_transcriber_manager.get_session(payload.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    try:
+        # Finals arrive asynchronously: speech still queued or in the STT pipeline counts too
+        await session.flush_audio()
+        if not session.transcript.total:
+            raise HTTPException(status_code=400, detail="Transcript is required")
+        notes, prescription = await session.finalize_notes()
+        return NotesResponse(notes=notes, prescription=prescription)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"AI generation failed: {e}")
+    finally:
+        await meet_transcriber_manager.stop_session(payload.session_id)
+
+
+@app.get("/meet/transcription/draft/{session_id}", response_model=MetricsResponse)
+async def get_meet_transcription_draft(session_id: str) -> MetricsResponse:
+    """Get the rolling findings draft of a live Meet session and its progress counters"""
+    session = meet_transcriber_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return MetricsResponse(metrics={"findings": session.rolling_notes.findings, **session.rolling_notes.stats()})
+
+
 @app.get("/meet/transcription/status/{session_id}", response_model=MeetTranscriptionStatus)
 async def get_meet_transcription_status(session_id: str) -> MeetTranscriptionStatus:
     """Get Meet transcription status"""
@@ -296,26 +639,79 @@ async def get_meet_transcription_status(session_id: str) -> MeetTranscriptionSta
         session_id=session_id,
         is_running=session.is_running,
         meet_url=session.meet_url,
-        appointment_id=session.appointment_id
+        appointment_id=session.appointment_id,
+        transcript=session.transcript.stats(),
+        **session.audio_stats()
     )
 
 
 @app.get("/meet/transcription/data/{session_id}", response_model=MeetTranscriptionData)
-async def get_meet_transcription_data(session_id: str) -> MeetTranscriptionData:
-    """Get Meet transcription data"""
+async def get_meet_transcription_data(session_id: str, since: int = 0, wait: float = 0) -> MeetTranscriptionData:
+    """Get Meet transcription segments with a sequence number above ``since``.
+    
+    With ``wait`` > 0 this is a long poll: if nothing is newer than ``since`` the request
+    waits up to that many seconds (capped at MEET_TRANSCRIPT_MAX_WAIT) for a new segment.
+    """
     session = meet_transcriber_manager.get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Get transcriptions from the session
-    transcriptions = session.get_transcriptions()
+    since = max(0, since)
+    if wait > 0:
+        await session.transcript.wait(since, min(wait, settings.meet_transcript_max_wait))
     
     return MeetTranscriptionData(
         session_id=session_id,
-        transcriptions=transcriptions
+        transcriptions=session.get_transcriptions(since),
+        interim=session.interim_text or None,
+        next_seq=session.transcript.last_seq,
+        missed=session.transcript.missed(since),
+        is_running=session.is_running
     )
 
 
+@app.get("/meet/transcription/stream/{session_id}")
+async def stream_meet_transcription(session_id: str, request: Request, since: int = 0) -> StreamingResponse:
+    """Push Meet transcription segments as Server-Sent Events while the session runs.
+    
+    Events: "segment" (id is the segment's seq, so a reconnecting client resumes through
+    Last-Event-ID), "missed" (count of segments that left the in-memory window before
+    they could be sent), "interim" and, when the session stops, "end".
+    """
+    session = meet_transcriber_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    last_event_id = request.headers.get("last-event-id", "")
+    cursor = int(last_event_id) if last_event_id.isdigit() else max(0, since)
+
+    async def event_stream():
+        nonlocal cursor
+        interim = ""
+        while True:
+            missed = session.transcript.missed(cursor)
+            if missed:
+                yield sse_event("missed", {"count": missed})
+            for segment in session.get_transcriptions(cursor):
+                yield sse_event("segment", segment, event_id=segment["seq"])
+                cursor = segment["seq"]
+            cursor = max(cursor, session.transcript.last_seq)
+            if session.interim_text != interim:
+                interim = session.interim_text
+                yield sse_event("interim", {"text": interim})
+            if session.transcript.closed:
+                yield sse_event("end", {"next_seq": cursor})
+                return
+            if await request.is_disconnected():
+                return
+            # A connected subscriber keeps the session from being reaped as idle
+            session.touch()
+            changed = await session.transcript.wait(cursor, settings.meet_transcript_max_wait)
+            if not changed:
+                yield SSE_KEEPALIVE
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 class AudioChunk(BaseModel):
     audio: str  # Base64 encoded audio
 
@@ -327,26 +723,15 @@ class TranscriptionText(BaseModel):
 @app.post("/meet/transcription/{session_id}")
 async def receive_meet_transcription(session_id: str, payload: TranscriptionText):
     """Receive transcription text from frontend"""
-    import time
-    
     session = meet_transcriber_manager.get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
     try:
-        # Store the transcription
-        current_time = time.time()
-        transcription = {
-            "text": payload.text,
-            "timestamp": current_time
-        }
-        session.transcriptions.append(transcription)
+        # Store the transcription (also feeds the rolling notes draft)
+        transcription = session.add_transcription(payload.text)
         
-        # Call callback if set
-        if session.transcription_callback:
-            session.transcription_callback(payload.text)
-        
-        return {"status": "ok", "text": payload.text, "timestamp": current_time}
+        return {"status": "ok", "text": payload.text, "timestamp": transcription["timestamp"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to store transcription: {e}")
 
@@ -365,9 +750,38 @@ async def receive_meet_audio(session_id: str, payload: AudioChunk):
         # Decode base64 audio
         audio_data = base64.b64decode(payload.audio)
         
-        # Process audio chunk
-        await session.process_audio_chunk(audio_data)
+        # Queue the chunk for the session's audio worker
+        accepted = await session.ingest_audio(audio_data)
         
-        return {"status": "ok", "bytes_received": len(audio_data)}
+        return {"status": "ok" if accepted else "dropped", "bytes_received": len(audio_data)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process audio: {e}")
+
+
+@app.websocket("/meet/audio/{session_id}/ws")
+async def meet_audio_websocket(websocket: WebSocket, session_id: str):
+    """Receive raw binary audio frames for a Meet session.
+    
+    Each binary frame is one audio chunk and goes into the session's bounded ingest queue.
+    Under the "block" policy a full queue stops this loop from reading, so backpressure
+    reaches the client through the socket. Text frames are ignored.
+    """
+    session = meet_transcriber_manager.get_session(session_id)
+    if not session:
+        await websocket.close(code=4404)
+        return
+    
+    await websocket.accept()
+    try:
+        while session.is_running:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            audio_data = message.get("bytes")
+            if audio_data:
+                await session.ingest_audio(audio_data)
+        else:
+            # Session stopped from elsewhere
+            await websocket.close(code=1000)
+    except WebSocketDisconnect:
+        pass
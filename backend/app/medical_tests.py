@@ -0,0 +1,148 @@
+"""
+Process-wide cache of the MedicalTests catalog.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from .config import settings
+from .db import Database, database
+
+# Minimum gap between load attempts after one has failed
+RETRY_AFTER_FAILURE_SECONDS = 30.0
+
+
+class MedicalTestCatalog:
+    """In-memory MedicalTests catalog with O(1) lookup by TestID and periodic refresh."""
+
+    def __init__(self, db: Database = database, refresh_seconds: Optional[float] = None):
+        self.db = db
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else settings.medical_tests_refresh_seconds
+        self.by_id: Dict[str, str] = {}
+        self.names: List[str] = []
+        self.tests: List[Dict[str, str]] = []
+        self.loaded_at: Optional[float] = None
+        self.failed_at: Optional[float] = None
+        self.source: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_stale(self) -> bool:
+        """Whether the catalog should be reloaded: never loaded, or older than the refresh interval
+        (0 means never refresh once loaded). A failed attempt is not retried for a while."""
+        now = time.monotonic()
+        if self.failed_at is not None and now - self.failed_at < RETRY_AFTER_FAILURE_SECONDS:
+            return False
+        if self.loaded_at is None:
+            return True
+        return self.refresh_seconds > 0 and now - self.loaded_at > self.refresh_seconds
+
+    def _set_rows(self, rows: Iterable[Dict[str, Any]], source: str) -> None:
+        # Build new structures first and swap them in, so readers never see a partial catalog
+        tests = sorted(
+            ({"id": row["TestID"], "name": row["TestName"]} for row in rows),
+            key=lambda test: test["name"],
+        )
+        self.by_id = {test["id"]: test["name"] for test in tests}
+        self.names = [test["name"] for test in tests]
+        self.tests = tests
+        self.loaded_at = time.monotonic()
+        self.failed_at = None
+        self.source = source
+
+    async def _fetch_from_db(self) -> Optional[List[Dict[str, Any]]]:
+        if not self.db.is_available:
+            return None
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT mt."TestName", mt."TestID"
+                FROM "MedicalTests" mt
+            """)
+            return [dict(row) for row in rows]
+
+    def _read_seed_file(self) -> Optional[List[Dict[str, Any]]]:
+        path = settings.medical_tests_seed_path
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else None
+
+    async def refresh(self) -> bool:
+        """Reload the catalog from the database, falling back to the MedicalTests.json seed."""
+        async with self._lock:
+            try:
+                rows = await self._fetch_from_db()
+                if rows is not None:
+                    self._set_rows(rows, "database")
+                    return True
+            except Exception as e:
+                print(f"Error loading medical tests catalog: {e}")
+
+            try:
+                rows = await asyncio.to_thread(self._read_seed_file)
+            except Exception as e:
+                print(f"Error reading medical tests seed file: {e}")
+                rows = None
+            if rows is not None and (self.loaded_at is None or self.source != "database"):
+                self._set_rows(rows, "seed_file")
+                return True
+            self.failed_at = time.monotonic()
+            return False
+
+    async def ensure_fresh(self) -> None:
+        """Refresh the catalog if it has not been loaded or has passed its TTL."""
+        if self.is_stale:
+            await self.refresh()
+
+    def get_name(self, test_id: str) -> Optional[str]:
+        """Look up a test name by TestID."""
+        return self.by_id.get(test_id)
+
+    def resolve(self, test_ids: Iterable[str]) -> List[Dict[str, str]]:
+        """Resolve TestIDs to {id, name} entries, skipping unknown IDs."""
+        resolved = []
+        for test_id in test_ids:
+            name = self.by_id.get(test_id)
+            if name is not None:
+                resolved.append({"id": test_id, "name": name})
+        return resolved
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            await self.refresh()
+
+    async def start(self) -> None:
+        """Load the catalog and start the background refresh task."""
+        await self.refresh()
+        if self._task is None and self.refresh_seconds > 0:
+            self._task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """Stop the background refresh task."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Return catalog size and freshness information."""
+        return {
+            "tests": len(self.tests),
+            "source": self.source,
+            "age_seconds": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+# Global instance
+medical_test_catalog = MedicalTestCatalog()
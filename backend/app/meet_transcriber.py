@@ -1,14 +1,20 @@
 import asyncio
 import json
 import logging
+import time
 import uuid
 from typing import Dict, Optional, Callable
 import websockets
 import websockets.exceptions
 from pydantic import BaseModel
 
-from .stt_manager import stt_manager
+from .ai_notes import generate_notes_and_prescription
+from .audio_pipeline import StreamingTranscriber
 from .config import settings
+from .rolling_notes import RollingNotesDraft
+from .transcript_store import TranscriptStore
+from .session_limits import IdleReaper, SessionLimitError
+from .session_registry import session_registry
 
 logger = logging.getLogger(__name__)
 
@@ -24,18 +30,50 @@ class MeetTranscriptionSession:
         self.session_id = session_id
         self.meet_url = meet_url
         self.appointment_id = appointment_id
-        self.stt_session_id: Optional[str] = None
         self.websocket: Optional[websockets.WebSocketServerProtocol] = None
         self.is_running = False
         self.transcription_callback: Optional[Callable[[str], None]] = None
-        self.transcriptions: list = []
+        self.transcript = TranscriptStore(appointment_id)
+        self.interim_text = ""
+        self.transcriber: Optional[StreamingTranscriber] = None
+        self.rolling_notes = RollingNotesDraft()
+        # Bounded ingest queue between audio receivers (WebSocket/HTTP) and the processing worker
+        self.audio_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.meet_audio_queue_max_chunks)
+        self.audio_drop_policy = settings.meet_audio_drop_policy
+        self._audio_task: Optional[asyncio.Task] = None
+        self.audio_chunks_received = 0
+        self.audio_bytes_received = 0
+        self.audio_chunks_dropped = 0
+        self.created_at = time.time()
+        self.last_activity = time.monotonic()
+
+    def touch(self) -> None:
+        """Record client activity, postponing idle reaping"""
+        self.last_activity = time.monotonic()
+
+    @property
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_activity
 
     async def start(self) -> bool:
         """Start the Meet transcription session"""
         try:
-            # Start STT session
-            self.stt_session_id = await stt_manager.start_session()
+            # The streaming pipeline owns this session's only STT stream
+            transcriber = StreamingTranscriber(
+                on_final=lambda text, info: self.add_transcription(text),
+                on_interim=self._on_interim,
+            )
+            try:
+                await transcriber.start()
+            except Exception:
+                await transcriber.close()
+                raise
+            self.transcriber = transcriber
             self.is_running = True
+            self.transcript.start()
+            if settings.rolling_notes_enabled:
+                self.rolling_notes.start()
+            self._audio_task = asyncio.get_running_loop().create_task(self._audio_worker())
             
             logger.info(f"Started Meet transcription session {self.session_id} for {self.meet_url}")
             logger.info("Waiting for real audio input from Google Meet...")
@@ -48,11 +86,9 @@ class MeetTranscriptionSession:
         """Stop the Meet transcription session"""
         try:
             self.is_running = False
-            
-            # Stop STT session
-            if self.stt_session_id:
-                await stt_manager.stop_session(self.stt_session_id)
-                self.stt_session_id = None
+            await self.flush_audio()
+            await self.rolling_notes.stop()
+            await self.transcript.close()
             
             # Close websocket if open
             if self.websocket:
@@ -65,58 +101,143 @@ class MeetTranscriptionSession:
             logger.error(f"Failed to stop Meet transcription session: {e}")
             return False
 
-    async def process_audio_chunk(self, audio_data: bytes) -> str:
-        """Process audio chunk and return transcription"""
-        if not self.is_running or not self.stt_session_id:
-            return ""
+    async def ingest_audio(self, audio_data: bytes) -> bool:
+        """Queue an audio chunk for processing. Returns False if a chunk had to be dropped.
         
+        When the queue is full, "block" waits up to MEET_AUDIO_BLOCK_TIMEOUT (which stops the
+        receiver reading and pushes back on the client) before dropping the new chunk;
+        "drop_oldest" evicts the oldest queued chunk and "drop_newest" discards the new one.
+        """
+        self.touch()
+        self.audio_chunks_received += 1
+        self.audio_bytes_received += len(audio_data)
+        item = (time.monotonic(), audio_data)
         try:
-            logger.info(f"Processing audio chunk of {len(audio_data)} bytes")
-            
-            # Get the STT session
-            stt_session = stt_manager._sessions.get(self.stt_session_id)
-            if not stt_session or not stt_session.session:
-                logger.warning("STT session not available")
-                return ""
-            
-            # Process audio through STT
-            # Note: This is a simplified approach. In production, you'd need to:
-            # 1. Convert WebM to the format expected by Cartesia
-            # 2. Handle audio streaming properly
-            # 3. Accumulate partial results
-            
-            # For now, we'll use a simple approach with the existing STT
-            # The audio needs to be in the right format for Cartesia
-            
-            import io
-            import time
-            
-            # Create a simple transcription from the audio
-            # In a real implementation, you'd send this to Cartesia STT
-            transcription_text = f"[Audio processed: {len(audio_data)} bytes at {time.time():.2f}]"
-            
-            # Store the transcription
-            current_time = time.time()
-            transcription = {
-                "text": transcription_text,
-                "timestamp": current_time
-            }
-            self.transcriptions.append(transcription)
-            
-            # Call callback if set
-            if self.transcription_callback:
-                self.transcription_callback(transcription_text)
-            
-            logger.info(f"Transcription created: {transcription_text}")
-            return transcription_text
-                
+            self.audio_queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+        
+        if self.audio_drop_policy == "block":
+            try:
+                await asyncio.wait_for(self.audio_queue.put(item), timeout=settings.meet_audio_block_timeout)
+                return True
+            except asyncio.TimeoutError:
+                pass
+        elif self.audio_drop_policy == "drop_oldest":
+            try:
+                self.audio_queue.get_nowait()
+                self.audio_queue.task_done()
+            except asyncio.QueueEmpty:
+                pass
+            self.audio_queue.put_nowait(item)
+        
+        self.audio_chunks_dropped += 1
+        if self.audio_chunks_dropped == 1 or self.audio_chunks_dropped % 100 == 0:
+            logger.warning(
+                f"Audio ingest queue full for session {self.session_id}; "
+                f"{self.audio_chunks_dropped} chunks dropped so far ({self.audio_drop_policy})"
+            )
+        return False
+
+    async def _audio_worker(self) -> None:
+        """Drain the ingest queue one chunk at a time"""
+        while True:
+            enqueued_at, audio_data = await self.audio_queue.get()
+            try:
+                await self.process_audio_chunk(audio_data, enqueued_at)
+            finally:
+                self.audio_queue.task_done()
+
+    def audio_stats(self) -> dict:
+        """Ingest queue depth and counters"""
+        return {
+            "audio_queue_depth": self.audio_queue.qsize(),
+            "audio_queue_max": self.audio_queue.maxsize,
+            "audio_drop_policy": self.audio_drop_policy,
+            "audio_chunks_received": self.audio_chunks_received,
+            "audio_bytes_received": self.audio_bytes_received,
+            "audio_chunks_dropped": self.audio_chunks_dropped,
+            "pipeline": self.transcriber.stats() if self.transcriber else None,
+        }
+
+    def memory_estimate(self) -> int:
+        """Approximate bytes held in this worker (excluding the STT stream and the ffmpeg process)"""
+        average_chunk = self.audio_bytes_received // self.audio_chunks_received if self.audio_chunks_received else 0
+        ring = self.transcriber.ring.capacity if self.transcriber else 0
+        return (
+            self.audio_queue.qsize() * average_chunk
+            + ring
+            + self.transcript.memory_estimate()
+            + self.rolling_notes.memory_estimate()
+        )
+
+    def info(self) -> dict:
+        """Age, idle time and memory estimate for session listings"""
+        return {
+            "meet_url": self.meet_url,
+            "appointment_id": self.appointment_id,
+            "is_running": self.is_running,
+            "age_seconds": round(time.time() - self.created_at, 1),
+            "idle_seconds": round(self.idle_seconds, 1),
+            "segments": self.transcript.total,
+            "audio_queue_depth": self.audio_queue.qsize(),
+            "memory_estimate_bytes": self.memory_estimate(),
+        }
+
+    async def flush_audio(self, timeout: float = 10.0) -> None:
+        """Process queued chunks, then flush the STT pipeline so its last finals are stored"""
+        if self._audio_task is not None:
+            try:
+                await asyncio.wait_for(self.audio_queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropping {self.audio_queue.qsize()} unprocessed audio chunks for session {self.session_id}")
+            self._audio_task.cancel()
+            self._audio_task = None
+        if self.transcriber is not None:
+            await self.transcriber.close(timeout=timeout)
+        self.interim_text = ""
+
+    async def process_audio_chunk(self, audio_data: bytes, enqueued_at: Optional[float] = None) -> None:
+        """Feed an audio chunk into the streaming STT pipeline.
+        
+        Transcripts arrive asynchronously: finals through add_transcription, interim
+        results in interim_text.
+        """
+        if self.transcriber is None:
+            return
+        
+        try:
+            await self.transcriber.feed(audio_data, enqueued_at)
         except Exception as e:
             logger.error(f"Failed to process audio chunk: {e}")
-            return ""
 
-    def get_transcriptions(self) -> list:
-        """Get all transcriptions for this session"""
-        return self.transcriptions.copy()
+    def _on_interim(self, text: str, info: dict) -> None:
+        self.interim_text = text
+        self.transcript.notify()
+
+    def add_transcription(self, text: str) -> dict:
+        """Store a transcript segment and feed it to the rolling notes draft"""
+        transcription = self.transcript.append(text)
+        if settings.rolling_notes_enabled:
+            self.rolling_notes.add_segment(text)
+        
+        # Call callback if set
+        if self.transcription_callback:
+            self.transcription_callback(text)
+        return transcription
+
+    async def finalize_notes(self) -> tuple:
+        """Generate notes from the rolling draft plus the transcript tail it does not cover yet"""
+        await self.flush_audio()
+        if not settings.rolling_notes_enabled:
+            # No draft to build on: the whole transcript goes through the notes pipeline
+            return await generate_notes_and_prescription(await self.transcript.text())
+        return await self.rolling_notes.finalize()
+
+    def get_transcriptions(self, since: int = 0) -> list:
+        """Get the in-memory transcriptions with a sequence number above ``since``"""
+        return self.transcript.recent(since)
 
     def set_transcription_callback(self, callback: Callable[[str], None]) -> None:
         """Set callback function for transcription results"""
@@ -124,17 +245,31 @@ class MeetTranscriptionSession:
 
 
 class MeetTranscriberManager:
-    def __init__(self):
+    def __init__(self, max_sessions: Optional[int] = None, idle_ttl: Optional[float] = None):
         self.sessions: Dict[str, MeetTranscriptionSession] = {}
+        self.max_sessions = max_sessions if max_sessions is not None else settings.meet_max_sessions
+        self.idle_ttl = idle_ttl if idle_ttl is not None else settings.meet_session_idle_ttl
+        self.reaper = IdleReaper("Meet", self.reap_idle, settings.session_reap_interval)
+        # Sessions being started count against the limit before they are registered
+        self._starting = 0
+        self.rejected = 0
 
     async def create_session(self, meet_url: str, appointment_id: Optional[str] = None) -> str:
         """Create a new Meet transcription session"""
+        if len(self.sessions) + self._starting >= self.max_sessions:
+            self.rejected += 1
+            raise SessionLimitError("Meet", self.max_sessions)
         session_id = str(uuid.uuid4())
         session = MeetTranscriptionSession(session_id, meet_url, appointment_id)
         
-        success = await session.start()
+        self._starting += 1
+        try:
+            success = await session.start()
+        finally:
+            self._starting -= 1
         if success:
             self.sessions[session_id] = session
+            await session_registry.register("meet", session_id)
             return session_id
         else:
             raise RuntimeError("Failed to create Meet transcription session")
@@ -145,11 +280,41 @@ class MeetTranscriberManager:
         if not session:
             return False
         
+        await session_registry.unregister("meet", session_id)
         return await session.stop()
 
     def get_session(self, session_id: str) -> Optional[MeetTranscriptionSession]:
-        """Get a Meet transcription session by ID"""
-        return self.sessions.get(session_id)
+        """Get a Meet transcription session by ID (a client looking it up counts as activity)"""
+        session = self.sessions.get(session_id)
+        if session:
+            session.touch()
+        return session
+
+    async def reap_idle(self) -> int:
+        """Stop sessions with no audio and no client requests for longer than the idle TTL"""
+        idle = [session_id for session_id, session in self.sessions.items() if session.idle_seconds > self.idle_ttl]
+        for session_id in idle:
+            logger.info(f"Stopping idle Meet transcription session {session_id}")
+            await self.stop_session(session_id)
+        return len(idle)
+
+    def list_sessions(self) -> list:
+        """Live sessions with age, idle time and memory estimates"""
+        return [{"session_id": session_id, **session.info()} for session_id, session in self.sessions.items()]
+
+    def stats(self) -> dict:
+        """Session counts, limits and the live session list"""
+        sessions = self.list_sessions()
+        return {
+            "active": len(sessions),
+            "starting": self._starting,
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "rejected": self.rejected,
+            "reaped": self.reaper.reaped,
+            "memory_estimate_bytes": sum(session["memory_estimate_bytes"] for session in sessions),
+            "sessions": sessions,
+        }
 
     async def cleanup_all_sessions(self) -> None:
         """Cleanup all active sessions"""
@@ -168,7 +333,6 @@ class MeetTranscriptionBot:
         self.meet_url = meet_url
         self.appointment_id = appointment_id
         self.session_id: Optional[str] = None
-        self.transcriptions = []
         self.is_running = False
 
     async def start(self) -> str:
@@ -211,20 +375,22 @@ class MeetTranscriptionBot:
             return False
 
     def _on_transcription(self, text: str) -> None:
-        """Handle transcription results"""
-        self.transcriptions.append({
-            "text": text,
-            "timestamp": asyncio.get_event_loop().time()
-        })
+        """Handle transcription results (the session stores them)"""
         logger.info(f"Transcription: {text}")
 
+    def _session(self) -> Optional[MeetTranscriptionSession]:
+        return meet_transcriber_manager.get_session(self.session_id) if self.session_id else None
+
     def get_transcriptions(self) -> list:
-        """Get all transcriptions"""
-        return self.transcriptions.copy()
+        """Get the session's recent transcriptions"""
+        session = self._session()
+        return session.get_transcriptions() if session else []
 
     def clear_transcriptions(self) -> None:
-        """Clear all transcriptions"""
-        self.transcriptions.clear()
+        """Clear the session's in-memory transcriptions"""
+        session = self._session()
+        if session:
+            session.transcript.clear()
 
 
 # Utility function to create and manage Meet bots
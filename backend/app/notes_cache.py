@@ -0,0 +1,223 @@
+"""
+Content-addressed cache for generated medical notes and prescriptions.
+
+Entries are keyed by a hash of the normalized transcript, the model and the
+prompt version, so a prompt or model change never serves stale output. An
+in-memory LRU tier is backed by an optional SQLite file under a cache dir.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .config import settings
+
+
+CachedNotes = Tuple[str, Dict[str, Any]]
+
+
+class _DiskTier:
+    """SQLite-backed tier; every method is blocking and meant to run in a worker thread."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS notes_cache (
+                key TEXT PRIMARY KEY,
+                notes TEXT NOT NULL,
+                prescription TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, key: str, ttl_seconds: float) -> Optional[CachedNotes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT notes, prescription, created_at FROM notes_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[2] > ttl_seconds:
+                self._conn.execute("DELETE FROM notes_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE notes_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, notes: str, prescription: Dict[str, Any], ttl_seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO notes_cache (key, notes, prescription, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, notes, json.dumps(prescription), now, now),
+            )
+            # Size-bounded eviction: drop expired rows, then least recently used beyond the bound
+            self._conn.execute("DELETE FROM notes_cache WHERE created_at < ?", (now - ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM notes_cache WHERE key IN ("
+                "SELECT key FROM notes_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM notes_cache").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class TranscriptKey:
+    """``NotesCache.make_key`` built up one transcript line at a time.
+
+    Lets a live transcript be cache-addressed without keeping all of its text.
+    """
+
+    def __init__(self, model: str, prompt_version: str):
+        self._digest = hashlib.sha256()
+        for part in (prompt_version, model):
+            self._digest.update(part.encode("utf-8"))
+            self._digest.update(b"\0")
+        self._empty = True
+
+    def add(self, line: str) -> None:
+        # Lines are joined by newlines, which normalization turns into single spaces
+        normalized = re.sub(r"\s+", " ", line).strip()
+        if not normalized:
+            return
+        if not self._empty:
+            self._digest.update(b" ")
+        self._digest.update(normalized.encode("utf-8"))
+        self._empty = False
+
+    def hexdigest(self) -> str:
+        digest = self._digest.copy()
+        digest.update(b"\0")
+        return digest.hexdigest()
+
+
+class NotesCache:
+    """Two-tier (memory LRU + optional SQLite) cache of (notes, prescription) results."""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 cache_dir: Optional[str] = None, disk_max_entries: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else settings.notes_cache_max_entries
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.notes_cache_ttl_seconds
+        cache_dir = cache_dir if cache_dir is not None else settings.notes_cache_dir
+        disk_max_entries = disk_max_entries if disk_max_entries is not None else settings.notes_cache_disk_max_entries
+        self._memory: "OrderedDict[str, Tuple[float, CachedNotes]]" = OrderedDict()
+        self._disk: Optional[_DiskTier] = None
+        if cache_dir:
+            try:
+                self._disk = _DiskTier(os.path.join(cache_dir, "notes_cache.sqlite3"), disk_max_entries)
+            except Exception as e:
+                print(f"Error opening notes disk cache: {e}")
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def make_key(transcript: str, model: str, prompt_version: str) -> str:
+        """Hash the normalized transcript with the model and prompt version."""
+        normalized = re.sub(r"\s+", " ", transcript).strip()
+        digest = hashlib.sha256()
+        for part in (prompt_version, model, normalized):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _remember(self, key: str, value: CachedNotes) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (time.monotonic(), value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[CachedNotes]:
+        """Look a key up in memory, then on disk (promoting disk hits into memory)."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if time.monotonic() - stored_at <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return value
+            self._memory.pop(key, None)
+
+        if self._disk is not None:
+            try:
+                value = await asyncio.to_thread(self._disk.get, key, self.ttl_seconds)
+            except Exception as e:
+                print(f"Error reading notes disk cache: {e}")
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, notes: str, prescription: Dict[str, Any]) -> None:
+        """Store a result in memory and, if enabled, on disk."""
+        self._remember(key, (notes, prescription))
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.put, key, notes, prescription, self.ttl_seconds)
+            except Exception as e:
+                print(f"Error writing notes disk cache: {e}")
+
+    def record_bypass(self) -> None:
+        """Count a request that skipped the cache lookup."""
+        self.bypassed += 1
+
+    def close(self) -> None:
+        """Close the disk tier."""
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and tier sizes."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        stats: Dict[str, Any] = {
+            "memory_entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "disk_enabled": self._disk is not None,
+        }
+        if self._disk is not None:
+            try:
+                stats["disk_entries"] = self._disk.count()
+            except Exception:
+                stats["disk_entries"] = None
+        return stats
+
+
+# Global instance
+notes_cache = NotesCache()
@@ -1,17 +1,20 @@
 import json
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
 import asyncio
+from collections import deque
 from datetime import datetime
 
 import httpx
 from .config import settings
-
-try:
-    import asyncpg
-    ASYNCPG_AVAILABLE = True
-except ImportError:
-    ASYNCPG_AVAILABLE = False
-    asyncpg = None
+from .http_client import iter_completion_deltas
+from .llm_limiter import PRIORITY_BACKGROUND, PRIORITY_CHATBOT, estimate_message_tokens, llm_limiter
+from .db import Database, database
+from .medical_tests import MedicalTestCatalog, medical_test_catalog
+from .context_cache import PatientContextCache, patient_context_cache
+from .single_flight import SingleFlight
+from .chat_memory import ChatMemory
+from .prompt_budget import PromptBudget, estimate_tokens, truncate_to_tokens
+from .relevance_index import IndexDocument, RelevanceIndex, relevance_index
 
 
 SYSTEM_CHATBOT = (
@@ -102,161 +105,295 @@ SYSTEM_CHATBOT = (
 )
 
 
+SYSTEM_CHAT_SUMMARY = (
+    "You maintain a running summary of a conversation between a patient and a healthcare assistant. "
+    "You receive the summary so far and older messages that are not yet in it. Return the updated summary "
+    "in at most 10 concise bullet points: the patient's questions and concerns, symptoms or facts they reported, "
+    "and advice already given. Keep facts from the existing summary unless the new messages correct them. "
+    "Do not add anything that was not said."
+)
+
+CHATBOT_DISCLAIMER = "\n\n⚠️ *This information is for general guidance only and should not replace professional medical advice. Please consult with your healthcare provider for personalized medical care.*"
+
+
 class PatientDataService:
     """Service to retrieve comprehensive patient data from the database."""
     
-    def __init__(self):
-        self.database_url = settings.database_url
+    def __init__(self, db: Database = database, catalog: MedicalTestCatalog = medical_test_catalog,
+                 context_cache: PatientContextCache = patient_context_cache,
+                 index: Optional[RelevanceIndex] = relevance_index):
+        self.db = db
+        self.catalog = catalog
+        self.context_cache = context_cache
+        # With an index, transcripts and AI notes are retrieved per question instead of always included
+        self.index = index if settings.chatbot_retrieval_enabled else None
+        self.last_context_report: Dict[str, Any] = {}
+        self.context_tokens: Deque[int] = deque(maxlen=500)
+    
+    # Share of the context token budget each section may claim before leftovers are redistributed
+    CONTEXT_SECTION_SHARES = {
+        "profile": 0.10,
+        "medications": 0.15,
+        "recommended_tests": 0.05,
+        "appointments": 0.20,
+        "ai_notes": 0.20,
+        "transcripts": 0.25,
+        "medical_tests": 0.05,
+    }
+    
+    # Budget share of the history sections, which the relevance index serves per question when enabled
+    HISTORY_SHARE = CONTEXT_SECTION_SHARES["ai_notes"] + CONTEXT_SECTION_SHARES["transcripts"]
+    
+    # Shared SELECT lists so every fetch mode returns the same columns
+    PROFILE_QUERY = """
+        SELECT pp.name, pp.age, pp.gender, pp.weight, pp.height, pp.phone, 
+               pp.allergies, pp.ailments, pp."scribeNotes"
+        FROM "PatientProfile" pp
+        JOIN "User" u ON pp."userId" = u.id
+        WHERE u.id = $1
+    """
+    
+    APPOINTMENTS_QUERY = """
+        SELECT a.id, a."scheduledAt", a.reason, a.status, a.notes, a."AI-Notes" as ai_notes,
+               a.prescription, a."recommendedTests",
+               dp.name as doctor_name, dp.department, dp.speciality
+        FROM "Appointment" a
+        JOIN "User" d ON a."doctorId" = d.id
+        LEFT JOIN "DoctorProfile" dp ON d.id = dp."userId"
+        WHERE a."patientId" = $1
+        ORDER BY a."scheduledAt" DESC
+        LIMIT 10
+    """
+    
+    TRANSCRIPTS_QUERY = """
+        SELECT at.id, at.text, at."createdAt", a."scheduledAt", a.id AS "appointmentId"
+        FROM "AppointmentTranscription" at
+        JOIN "Appointment" a ON at."appointmentId" = a.id
+        WHERE a."patientId" = $1
+        ORDER BY at."createdAt" DESC
+        LIMIT 20
+    """
+    
+    # Whole patient bundle in one round trip; json_agg keeps each section's ordering
+    BUNDLE_QUERY = f"""
+        WITH profile AS ({PROFILE_QUERY}),
+             appointments AS ({APPOINTMENTS_QUERY}),
+             transcripts AS ({TRANSCRIPTS_QUERY})
+        SELECT
+            (SELECT row_to_json(p) FROM profile p LIMIT 1) AS profile,
+            (SELECT COALESCE(json_agg(ap ORDER BY ap."scheduledAt" DESC), '[]'::json)
+             FROM appointments ap) AS appointments,
+            (SELECT COALESCE(json_agg(t ORDER BY t."createdAt" DESC), '[]'::json)
+             FROM transcripts t) AS transcripts
+    """
     
     async def get_patient_data(self, patient_id: str) -> Dict[str, Any]:
-        """Retrieve comprehensive patient data including medical history, appointments, and prescriptions."""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
-            # Fallback to empty data if database not configured or asyncpg not available
+        """Retrieve comprehensive patient data including medical history, appointments, and prescriptions.
+        
+        The fetch strategy is chosen by ``settings.patient_data_fetch_mode``:
+        "bundle" (one CTE query), "parallel" (concurrent queries on separate
+        pooled connections) or "serial" (one connection, one query after another).
+        """
+        if not self.db.is_available:
+            # Fallback to empty data if the shared database pool is not available
             return self._get_empty_patient_data(patient_id)
         
         try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
-                    # Get patient profile
-                    profile_query = """
-                        SELECT pp.name, pp.age, pp.gender, pp.weight, pp.height, pp.phone, 
-                               pp.allergies, pp.ailments, pp."scribeNotes"
-                        FROM "PatientProfile" pp
-                        JOIN "User" u ON pp."userId" = u.id
-                        WHERE u.id = $1
-                    """
-                    profile_row = await conn.fetchrow(profile_query, patient_id)
-                    
-                    # Get recent appointments
-                    appointments_query = """
-                        SELECT a.id, a."scheduledAt", a.reason, a.status, a.notes, a."AI-Notes" as ai_notes,
-                               a.prescription, a."recommendedTests",
-                               dp.name as doctor_name, dp.department, dp.speciality
-                        FROM "Appointment" a
-                        JOIN "User" d ON a."doctorId" = d.id
-                        LEFT JOIN "DoctorProfile" dp ON d.id = dp."userId"
-                        WHERE a."patientId" = $1
-                        ORDER BY a."scheduledAt" DESC
-                        LIMIT 10
-                    """
-                    appointments = await conn.fetch(appointments_query, patient_id)
-                    
-                    # Get recent transcripts
-                    transcripts_query = """
-                        SELECT at.text, at."createdAt", a."scheduledAt"
-                        FROM "AppointmentTranscription" at
-                        JOIN "Appointment" a ON at."appointmentId" = a.id
-                        WHERE a."patientId" = $1
-                        ORDER BY at."createdAt" DESC
-                        LIMIT 20
-                    """
-                    transcripts = await conn.fetch(transcripts_query, patient_id)
-                    
-                    # Get medical tests
-                    tests_query = """
-                        SELECT mt."TestName", mt."TestID"
-                        FROM "MedicalTests" mt
-                        ORDER BY mt."TestName"
-                    """
-                    medical_tests = await conn.fetch(tests_query)
-                    
-                    # Process the data
-                    patient_data = {
-                        "basic_info": {
-                            "patient_id": patient_id,
-                            "retrieved_at": datetime.now().isoformat()
-                        },
-                        "profile": {
-                            "name": profile_row["name"] if profile_row else None,
-                            "age": profile_row["age"] if profile_row else None,
-                            "gender": profile_row["gender"] if profile_row else None,
-                            "weight": float(profile_row["weight"]) if profile_row and profile_row["weight"] is not None else None,
-                            "height": float(profile_row["height"]) if profile_row and profile_row["height"] is not None else None,
-                            "phone": profile_row["phone"] if profile_row else None,
-                            "allergies": profile_row["allergies"] if profile_row else None,
-                            "ailments": profile_row["ailments"] if profile_row else None,
-                            "scribe_notes": profile_row["scribeNotes"] if profile_row else None,
-                        },
-                        "appointments": [],
-                        "prescriptions": [],
-                        "ai_notes": [],
-                        "transcripts": [],
-                        "medical_tests": [],
-                        "recommended_tests": []
-                    }
-                    
-                    # Process appointments
-                    for appt in appointments:
-                        appointment_data = {
-                            "id": appt["id"],
-                            "date": appt["scheduledAt"].isoformat() if appt["scheduledAt"] else None,
-                            "doctor": appt["doctor_name"] or "Unknown Doctor",
-                            "department": appt["department"],
-                            "speciality": appt["speciality"],
-                            "reason": appt["reason"],
-                            "status": appt["status"],
-                            "notes": appt["notes"],
-                            "ai_notes": appt["ai_notes"]
-                        }
-                        patient_data["appointments"].append(appointment_data)
-                        
-                        # Extract prescription data
-                        if appt["prescription"]:
-                            try:
-                                prescription_data = json.loads(appt["prescription"])
-                                if isinstance(prescription_data, dict):
-                                    patient_data["prescriptions"].extend(prescription_data.get("medications", []))
-                            except (json.JSONDecodeError, TypeError):
-                                pass
-                        
-                        # Extract recommended tests
-                        if appt["recommendedTests"]:
-                            try:
-                                test_ids = json.loads(appt["recommendedTests"])
-                                if isinstance(test_ids, list):
-                                    for test_id in test_ids:
-                                        # Find test name
-                                        for test in medical_tests:
-                                            if test["TestID"] == test_id:
-                                                patient_data["recommended_tests"].append({
-                                                    "id": test_id,
-                                                    "name": test["TestName"],
-                                                    "status": "Pending"
-                                                })
-                                                break
-                            except (json.JSONDecodeError, TypeError):
-                                pass
-                    
-                    # Process transcripts
-                    for transcript in transcripts:
-                        patient_data["transcripts"].append({
-                            "text": transcript["text"],
-                            "created_at": transcript["createdAt"].isoformat() if transcript["createdAt"] else None,
-                            "appointment_date": transcript["scheduledAt"].isoformat() if transcript["scheduledAt"] else None
-                        })
-                    
-                    # Process AI notes
-                    for appt in appointments:
-                        if appt["ai_notes"]:
-                            patient_data["ai_notes"].append({
-                                "date": appt["scheduledAt"].isoformat() if appt["scheduledAt"] else None,
-                                "summary": appt["ai_notes"][:200] + "..." if len(appt["ai_notes"]) > 200 else appt["ai_notes"]
-                            })
-                    
-                    # Process medical tests
-                    for test in medical_tests:
-                        patient_data["medical_tests"].append({
-                            "id": test["TestID"],
-                            "name": test["TestName"]
-                        })
-                    
-                    return patient_data
-                    
+            # Medical tests come from the shared in-memory catalog, not a per-message query
+            await self.catalog.ensure_fresh()
+            
+            mode = settings.patient_data_fetch_mode
+            if mode == "parallel":
+                profile_row, appointments, transcripts = await self._fetch_parallel(patient_id)
+            elif mode == "serial":
+                profile_row, appointments, transcripts = await self._fetch_serial(patient_id)
+            else:
+                profile_row, appointments, transcripts = await self._fetch_bundle(patient_id)
+            
+            return self._build_patient_data(patient_id, profile_row, appointments, transcripts)
+                
         except Exception as e:
             # Log error and return empty data
             print(f"Error retrieving patient data: {e}")
             return self._get_empty_patient_data(patient_id)
     
+    async def get_patient_context(self, patient_id: str, question: Optional[str] = None) -> str:
+        """Return the formatted patient context, served from the versioned cache when nothing changed.
+        
+        When the relevance index is enabled, the cached part omits transcripts and AI notes;
+        the chunks most relevant to ``question`` are appended instead.
+        """
+        version = await self.context_cache.get_version(patient_id)
+        patient_context = self.context_cache.get(patient_id, version)
+        if patient_context is None or (self.index is not None and not await self.index.has(patient_id)):
+            patient_data = await self.get_patient_data(patient_id)
+            patient_context = self.format_patient_context(patient_data, include_history=self.index is None)
+            # Never cache the fallback context produced when the database is unavailable
+            if "note" not in patient_data.get("basic_info", {}):
+                if self.index is not None:
+                    # Only transcripts and notes not indexed yet are chunked
+                    await self.index.update(patient_id, self._index_documents(patient_data))
+                self.context_cache.put(patient_id, version, patient_context)
+        
+        if self.index is not None and question:
+            excerpts = await self._relevant_excerpts(patient_id, question)
+            if excerpts:
+                patient_context = f"{patient_context}\n\n{excerpts}"
+        return patient_context
+    
+    @staticmethod
+    def _index_documents(patient_data: Dict[str, Any]) -> List[IndexDocument]:
+        """Transcripts and full AI notes of a patient as relevance index documents."""
+        documents = [
+            IndexDocument(key=f"transcript:{t['id']}", kind="Transcript", date=t.get("appointment_date"), text=t["text"] or "")
+            for t in patient_data.get("transcripts", []) if t.get("id")
+        ]
+        documents.extend(
+            IndexDocument(key=f"ai_notes:{a['id']}", kind="Consultation notes", date=a.get("date"), text=a["ai_notes"])
+            for a in patient_data.get("appointments", []) if a.get("ai_notes")
+        )
+        return documents
+    
+    async def _relevant_excerpts(self, patient_id: str, question: str) -> str:
+        """Top-k indexed chunks for the question, within the history share of the context budget."""
+        chunks = await self.index.search(patient_id, question)
+        budget = PromptBudget(int(settings.chatbot_context_tokens * self.HISTORY_SHARE))
+        budget.add_section(
+            "excerpts", 0, budget.budget, "=== RELEVANT EXCERPTS FROM PAST CONSULTATIONS ===",
+            [f"[{chunk['kind']}{' ' + chunk['date'] if chunk['date'] else ''}]\n{chunk['text']}" for chunk in chunks],
+        )
+        excerpts, report = budget.render()
+        self.last_context_report = {**self.last_context_report, "retrieval": report}
+        return excerpts.rstrip()
+    
+    async def _fetch_bundle(self, patient_id: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Fetch profile, appointments and transcripts with a single query."""
+        async with self.db.acquire() as conn:
+            row = await conn.fetchrow(self.BUNDLE_QUERY, patient_id)
+        
+        def _load(value: Any) -> Any:
+            # asyncpg returns json columns as text unless a codec is registered
+            return json.loads(value) if isinstance(value, str) else value
+        
+        return _load(row["profile"]), _load(row["appointments"]) or [], _load(row["transcripts"]) or []
+    
+    async def _fetch_parallel(self, patient_id: str) -> Tuple[Any, List[Any], List[Any]]:
+        """Fetch profile, appointments and transcripts concurrently on separate pooled connections."""
+        async def _fetchrow(query: str) -> Any:
+            async with self.db.acquire() as conn:
+                return await conn.fetchrow(query, patient_id)
+        
+        async def _fetch(query: str) -> List[Any]:
+            async with self.db.acquire() as conn:
+                return await conn.fetch(query, patient_id)
+        
+        return await asyncio.gather(
+            _fetchrow(self.PROFILE_QUERY),
+            _fetch(self.APPOINTMENTS_QUERY),
+            _fetch(self.TRANSCRIPTS_QUERY),
+        )
+    
+    async def _fetch_serial(self, patient_id: str) -> Tuple[Any, List[Any], List[Any]]:
+        """Fetch profile, appointments and transcripts one after another on one connection."""
+        async with self.db.acquire() as conn:
+            profile_row = await conn.fetchrow(self.PROFILE_QUERY, patient_id)
+            appointments = await conn.fetch(self.APPOINTMENTS_QUERY, patient_id)
+            transcripts = await conn.fetch(self.TRANSCRIPTS_QUERY, patient_id)
+            return profile_row, appointments, transcripts
+    
+    def _build_patient_data(self, patient_id: str, profile_row: Any, appointments: List[Any], transcripts: List[Any]) -> Dict[str, Any]:
+        """Build the patient data dict from profile, appointment and transcript rows (records or JSON dicts)."""
+        def _iso(value: Any) -> Optional[str]:
+            # Records carry datetimes; the bundle query already returns ISO strings
+            if not value:
+                return None
+            return value.isoformat() if isinstance(value, datetime) else str(value)
+        
+        patient_data = {
+            "basic_info": {
+                "patient_id": patient_id,
+                "retrieved_at": datetime.now().isoformat()
+            },
+            "profile": {
+                "name": profile_row["name"] if profile_row else None,
+                "age": profile_row["age"] if profile_row else None,
+                "gender": profile_row["gender"] if profile_row else None,
+                "weight": float(profile_row["weight"]) if profile_row and profile_row["weight"] is not None else None,
+                "height": float(profile_row["height"]) if profile_row and profile_row["height"] is not None else None,
+                "phone": profile_row["phone"] if profile_row else None,
+                "allergies": profile_row["allergies"] if profile_row else None,
+                "ailments": profile_row["ailments"] if profile_row else None,
+                "scribe_notes": profile_row["scribeNotes"] if profile_row else None,
+            },
+            "appointments": [],
+            "prescriptions": [],
+            "ai_notes": [],
+            "transcripts": [],
+            "medical_tests": [],
+            "recommended_tests": []
+        }
+        
+        # Process appointments
+        for appt in appointments:
+            appointment_data = {
+                "id": appt["id"],
+                "date": _iso(appt["scheduledAt"]),
+                "doctor": appt["doctor_name"] or "Unknown Doctor",
+                "department": appt["department"],
+                "speciality": appt["speciality"],
+                "reason": appt["reason"],
+                "status": appt["status"],
+                "notes": appt["notes"],
+                "ai_notes": appt["ai_notes"]
+            }
+            patient_data["appointments"].append(appointment_data)
+            
+            # Extract prescription data
+            if appt["prescription"]:
+                try:
+                    prescription_data = json.loads(appt["prescription"])
+                    if isinstance(prescription_data, dict):
+                        patient_data["prescriptions"].extend(prescription_data.get("medications", []))
+                except (json.JSONDecodeError, TypeError):
+                    pass
+            
+            # Extract recommended tests
+            if appt["recommendedTests"]:
+                try:
+                    test_ids = json.loads(appt["recommendedTests"])
+                    if isinstance(test_ids, list):
+                        for test in self.catalog.resolve(test_ids):
+                            patient_data["recommended_tests"].append({
+                                "id": test["id"],
+                                "name": test["name"],
+                                "status": "Pending"
+                            })
+                except (json.JSONDecodeError, TypeError):
+                    pass
+        
+        # Process transcripts
+        for transcript in transcripts:
+            patient_data["transcripts"].append({
+                "id": transcript["id"],
+                "appointment_id": transcript["appointmentId"],
+                "text": transcript["text"],
+                "created_at": _iso(transcript["createdAt"]),
+                "appointment_date": _iso(transcript["scheduledAt"])
+            })
+        
+        # Process AI notes
+        for appt in appointments:
+            if appt["ai_notes"]:
+                patient_data["ai_notes"].append({
+                    "date": _iso(appt["scheduledAt"]),
+                    "summary": appt["ai_notes"][:200] + "..." if len(appt["ai_notes"]) > 200 else appt["ai_notes"]
+                })
+        
+        # Medical tests (catalog is already sorted by name)
+        patient_data["medical_tests"] = list(self.catalog.tests)
+        
+        return patient_data
+    
     def _get_empty_patient_data(self, patient_id: str) -> Dict[str, Any]:
         """Return empty patient data structure when database is unavailable."""
         return {
@@ -284,128 +421,135 @@ class PatientDataService:
             "recommended_tests": []
         }
     
-    def format_patient_context(self, patient_data: Dict[str, Any]) -> str:
-        """Format patient data into a comprehensive, structured context for the AI."""
-        context_parts = []
+    def format_patient_context(self, patient_data: Dict[str, Any], token_budget: Optional[int] = None,
+                               include_history: bool = True) -> str:
+        """Format patient data into a comprehensive, structured context for the AI, within a token budget.
+        
+        ``include_history=False`` leaves out consultation summaries and transcripts (and their
+        share of the budget), for when they are retrieved per question from the relevance index.
+        """
+        total = token_budget if token_budget is not None else settings.chatbot_context_tokens
+        budget = PromptBudget(total if include_history else int(total * (1 - self.HISTORY_SHARE)))
+        
+        def allowance(name: str) -> int:
+            return int(budget.budget * self.CONTEXT_SECTION_SHARES[name])
         
         # Basic profile information with enhanced details
         profile = patient_data.get("profile", {})
         if any(profile.values()):
-            context_parts.append("=== COMPREHENSIVE PATIENT PROFILE ===")
+            lines = []
             if profile.get("name"):
-                context_parts.append(f"Patient Name: {profile['name']}")
+                lines.append(f"Patient Name: {profile['name']}")
             if profile.get("age"):
-                context_parts.append(f"Age: {profile['age']} years old")
+                lines.append(f"Age: {profile['age']} years old")
             if profile.get("gender"):
-                context_parts.append(f"Gender: {profile['gender']}")
+                lines.append(f"Gender: {profile['gender']}")
+            if profile.get("allergies"):
+                lines.append(f"Known Allergies: {profile['allergies']}")
+            if profile.get("ailments"):
+                lines.append(f"Current Medical Conditions: {profile['ailments']}")
             if profile.get("weight") and profile.get("height"):
                 bmi = profile["weight"] / ((profile["height"] / 100) ** 2)
                 bmi_category = self._get_bmi_category(bmi)
-                context_parts.append(f"Physical Stats: {profile['weight']} kg, {profile['height']} cm")
-                context_parts.append(f"BMI: {bmi:.1f} ({bmi_category})")
-            if profile.get("phone"):
-                context_parts.append(f"Contact: {profile['phone']}")
-            if profile.get("allergies"):
-                context_parts.append(f"Known Allergies: {profile['allergies']}")
-            if profile.get("ailments"):
-                context_parts.append(f"Current Medical Conditions: {profile['ailments']}")
+                lines.append(f"Physical Stats: {profile['weight']} kg, {profile['height']} cm")
+                lines.append(f"BMI: {bmi:.1f} ({bmi_category})")
             if profile.get("scribe_notes"):
-                context_parts.append(f"Additional Notes: {profile['scribe_notes']}")
-            context_parts.append("")
-        
-        # Recent appointments with comprehensive details
-        appointments = patient_data.get("appointments", [])
-        if appointments:
-            context_parts.append("=== RECENT MEDICAL APPOINTMENTS ===")
-            for i, appt in enumerate(appointments[-5:], 1):  # Show last 5 appointments
-                context_parts.append(f"Appointment #{i}:")
-                if appt.get('date'):
-                    context_parts.append(f"  Date: {appt['date']}")
-                if appt.get('doctor'):
-                    context_parts.append(f"  Doctor: {appt['doctor']}")
-                if appt.get('department'):
-                    context_parts.append(f"  Department: {appt['department']}")
-                if appt.get('speciality'):
-                    context_parts.append(f"  Specialty: {appt['speciality']}")
-                if appt.get('reason'):
-                    context_parts.append(f"  Reason for Visit: {appt['reason']}")
-                if appt.get('status'):
-                    context_parts.append(f"  Status: {appt['status']}")
-                if appt.get('notes'):
-                    context_parts.append(f"  Doctor Notes: {appt['notes']}")
-                if appt.get('ai_notes'):
-                    context_parts.append(f"  AI Consultation Summary: {appt['ai_notes'][:300]}...")
-                context_parts.append("")
+                lines.append(f"Additional Notes: {profile['scribe_notes']}")
+            if profile.get("phone"):
+                lines.append(f"Contact: {profile['phone']}")
+            budget.add_section("profile", 0, allowance("profile"), "=== COMPREHENSIVE PATIENT PROFILE ===", lines)
         
         # Current medications with detailed information
-        prescriptions = patient_data.get("prescriptions", [])
-        if prescriptions:
-            context_parts.append("=== CURRENT MEDICATION REGIMEN ===")
-            for i, med in enumerate(prescriptions, 1):
-                if med.get("name"):
-                    context_parts.append(f"Medication #{i}: {med['name']}")
-                    if med.get("dose"):
-                        context_parts.append(f"  Dosage: {med['dose']}")
-                    if med.get("route"):
-                        context_parts.append(f"  Route: {med['route']}")
-                    if med.get("frequency"):
-                        context_parts.append(f"  Frequency: {med['frequency']}")
-                    if med.get("duration"):
-                        context_parts.append(f"  Duration: {med['duration']}")
-                    if med.get("notes"):
-                        context_parts.append(f"  Special Instructions: {med['notes']}")
-                    context_parts.append("")
-        
-        # Recent AI notes with full context
-        ai_notes = patient_data.get("ai_notes", [])
-        if ai_notes:
-            context_parts.append("=== RECENT CONSULTATION SUMMARIES ===")
-            for i, note in enumerate(ai_notes[-3:], 1):  # Show last 3 consultation summaries
-                context_parts.append(f"Consultation Summary #{i}:")
-                if note.get('date'):
-                    context_parts.append(f"  Date: {note['date']}")
-                if note.get('summary'):
-                    context_parts.append(f"  Summary: {note['summary']}")
-                context_parts.append("")
-        
-        # Consultation transcripts for context
-        transcripts = patient_data.get("transcripts", [])
-        if transcripts:
-            context_parts.append("=== RECENT CONSULTATION TRANSCRIPTS ===")
-            for i, transcript in enumerate(transcripts[-3:], 1):  # Show last 3 transcripts
-                context_parts.append(f"Transcript #{i}:")
-                if transcript.get('appointment_date'):
-                    context_parts.append(f"  Appointment Date: {transcript['appointment_date']}")
-                if transcript.get('text'):
-                    # Truncate long transcripts but keep key information
-                    text = transcript['text']
-                    if len(text) > 200:
-                        text = text[:200] + "..."
-                    context_parts.append(f"  Content: {text}")
-                context_parts.append("")
-        
-        # Recommended and available tests
-        recommended_tests = patient_data.get("recommended_tests", [])
-        medical_tests = patient_data.get("medical_tests", [])
-        if recommended_tests or medical_tests:
-            context_parts.append("=== MEDICAL TESTS & RECOMMENDATIONS ===")
-            if recommended_tests:
-                context_parts.append("Recommended Tests:")
-                for test in recommended_tests:
-                    context_parts.append(f"  • {test.get('name', 'Test')} - Status: {test.get('status', 'Pending')}")
-                context_parts.append("")
-            if medical_tests:
-                context_parts.append("Available Tests in System:")
-                for test in medical_tests[:10]:  # Show first 10 available tests
-                    context_parts.append(f"  • {test.get('name', 'Test')}")
-                context_parts.append("")
+        medications = []
+        for i, med in enumerate(patient_data.get("prescriptions", []), 1):
+            if med.get("name"):
+                lines = [f"Medication #{i}: {med['name']}"]
+                if med.get("dose"):
+                    lines.append(f"  Dosage: {med['dose']}")
+                if med.get("route"):
+                    lines.append(f"  Route: {med['route']}")
+                if med.get("frequency"):
+                    lines.append(f"  Frequency: {med['frequency']}")
+                if med.get("duration"):
+                    lines.append(f"  Duration: {med['duration']}")
+                if med.get("notes"):
+                    lines.append(f"  Special Instructions: {med['notes']}")
+                medications.append("\n".join(lines))
+        budget.add_section("medications", 1, allowance("medications"), "=== CURRENT MEDICATION REGIMEN ===", medications)
+        
+        # Recommended tests for this patient
+        budget.add_section(
+            "recommended_tests", 2, allowance("recommended_tests"), "=== RECOMMENDED MEDICAL TESTS ===",
+            [f"  • {test.get('name', 'Test')} - Status: {test.get('status', 'Pending')}"
+             for test in patient_data.get("recommended_tests", [])],
+        )
+        
+        # Recent appointments (newest first, so the oldest are dropped when over budget)
+        appointments = []
+        for i, appt in enumerate(patient_data.get("appointments", []), 1):
+            lines = [f"Appointment #{i}:"]
+            if appt.get('date'):
+                lines.append(f"  Date: {appt['date']}")
+            if appt.get('doctor'):
+                lines.append(f"  Doctor: {appt['doctor']}")
+            if appt.get('department'):
+                lines.append(f"  Department: {appt['department']}")
+            if appt.get('speciality'):
+                lines.append(f"  Specialty: {appt['speciality']}")
+            if appt.get('reason'):
+                lines.append(f"  Reason for Visit: {appt['reason']}")
+            if appt.get('status'):
+                lines.append(f"  Status: {appt['status']}")
+            if appt.get('notes'):
+                lines.append(f"  Doctor Notes: {appt['notes']}")
+            appointments.append("\n".join(lines))
+        budget.add_section("appointments", 3, allowance("appointments"), "=== RECENT MEDICAL APPOINTMENTS ===", appointments)
+        
+        # Consultation summaries (newest first)
+        summaries = []
+        if not include_history:
+            patient_data = {**patient_data, "ai_notes": [], "transcripts": []}
+        for i, note in enumerate(patient_data.get("ai_notes", []), 1):
+            if note.get('summary'):
+                date = f" ({note['date']})" if note.get('date') else ""
+                summaries.append(f"Consultation Summary #{i}{date}:\n{note['summary']}")
+        budget.add_section("ai_notes", 4, allowance("ai_notes"), "=== RECENT CONSULTATION SUMMARIES ===", summaries)
+        
+        # Consultation transcripts (newest first); the bulkiest and least dense section
+        transcripts = []
+        for i, transcript in enumerate(patient_data.get("transcripts", []), 1):
+            if transcript.get('text'):
+                date = f" ({transcript['appointment_date']})" if transcript.get('appointment_date') else ""
+                transcripts.append(f"Transcript #{i}{date}:\n{transcript['text']}")
+        budget.add_section("transcripts", 5, allowance("transcripts"), "=== RECENT CONSULTATION TRANSCRIPTS ===", transcripts)
+        
+        # Available tests in the system
+        budget.add_section(
+            "medical_tests", 6, allowance("medical_tests"), "=== AVAILABLE TESTS IN SYSTEM ===",
+            [f"  • {test.get('name', 'Test')}" for test in patient_data.get("medical_tests", [])[:10]],
+        )
         
         # Data retrieval timestamp
         basic_info = patient_data.get("basic_info", {})
         if basic_info.get("retrieved_at"):
-            context_parts.append(f"Data Retrieved: {basic_info['retrieved_at']}")
+            budget.add_section("retrieved_at", 7, 16, "=== DATA RETRIEVED ===", [basic_info["retrieved_at"]])
         
-        return "\n".join(context_parts) if context_parts else "No specific patient data available for this session."
+        context, report = budget.render()
+        self.last_context_report = report
+        self.context_tokens.append(report["used"])
+        return context.rstrip() if context else "No specific patient data available for this session."
+    
+    def context_stats(self) -> Dict[str, Any]:
+        """Return token usage of recently built contexts and the section report of the last one."""
+        tokens = list(self.context_tokens)
+        return {
+            "budget": settings.chatbot_context_tokens,
+            "max_prompt_tokens": settings.chatbot_max_prompt_tokens,
+            "built": len(tokens),
+            "avg_tokens": round(sum(tokens) / len(tokens), 1) if tokens else 0.0,
+            "max_tokens": max(tokens) if tokens else 0,
+            "last": self.last_context_report,
+        }
     
     def _get_bmi_category(self, bmi: float) -> str:
         """Get BMI category for better context."""
@@ -422,18 +566,24 @@ class PatientDataService:
 class IntelligentChatbotClient:
     """Intelligent chatbot client using Cerebras for personalized health assistance."""
     
-    def __init__(self):
+    priority = PRIORITY_CHATBOT
+    # Estimated size of the instruction text wrapped around the context and question
+    PROMPT_TEMPLATE_TOKENS = 400
+    MIN_QUESTION_TOKENS = 64
+    
+    def __init__(self, patient_data_service: Optional[PatientDataService] = None):
         self.base_url = settings.cerebras_base_url.rstrip("/")
         self.api_key = settings.cerebras_api_key
         self.model = settings.cerebras_model
-        self.patient_data_service = PatientDataService()
+        self.patient_data_service = patient_data_service or PatientDataService()
+        self.memory = ChatMemory(self.summarize_conversation)
         self._headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
             "User-Agent": "AarogyaAI-Chatbot/1.0.0",
         }
     
-    async def _chat(self, messages: List[Dict[str, str]], max_output_tokens: int = 1500) -> str:
+    async def _chat(self, messages: List[Dict[str, str]], max_output_tokens: int = 1500, priority: Optional[int] = None) -> str:
         """Make a chat completion request to Cerebras API."""
         if not self.api_key:
             raise ValueError("Cerebras API key is required")
@@ -447,75 +597,156 @@ class IntelligentChatbotClient:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=120) as client:
-                resp = await client.post(url, headers=self._headers, json=payload)
-                
+            # Queued behind the shared limiter; rate-limited responses are retried there
+            resp = await llm_limiter.post(
+                url, priority=self.priority if priority is None else priority,
+                tokens=estimate_message_tokens(messages, max_output_tokens),
+                headers=self._headers, json=payload,
+            )
+            
+            if resp.status_code == 400:
+                # Get detailed error information for 400 Bad Request
+                try:
+                    error_data = resp.json()
+                    error_detail = error_data.get("error", {}).get("message", "Bad Request")
+                    raise ValueError(f"Cerebras API Bad Request: {error_detail}")
+                except:
+                    raise ValueError("Cerebras API Bad Request: Invalid request format or parameters")
+            elif resp.status_code == 401:
+                raise ValueError("Invalid Cerebras API key")
+            elif resp.status_code == 429:
+                raise ValueError("Rate limit exceeded after retries. Please try again later.")
+            elif resp.status_code == 500:
+                raise ValueError("Cerebras API server error. Please try again later.")
+            
+            resp.raise_for_status()
+            data = resp.json()
+            
+            if "choices" not in data or not data["choices"]:
+                raise ValueError("Invalid response format from Cerebras API")
+            
+            content = data["choices"][0]["message"]["content"]
+            if not content:
+                raise ValueError("Empty response from Cerebras API")
+            
+            return content.strip()
+            
+        except httpx.TimeoutException:
+            raise ValueError("Request timeout. The query may be too complex or the API is slow.")
+        except httpx.RequestError as e:
+            raise ValueError(f"Network error connecting to Cerebras API: {e}")
+        except json.JSONDecodeError:
+            raise ValueError("Invalid JSON response from Cerebras API")
+        except KeyError as e:
+            raise ValueError(f"Unexpected response format from Cerebras API: missing {e}")
+        except Exception as e:
+            raise ValueError(f"Unexpected error with Cerebras API: {e}")
+    
+    async def _chat_stream(self, messages: List[Dict[str, str]], max_output_tokens: int = 1500) -> AsyncIterator[str]:
+        """Stream a chat completion from Cerebras API, yielding content deltas as they arrive."""
+        if not self.api_key:
+            raise ValueError("Cerebras API key is required")
+        
+        url = f"{self.base_url}/chat/completions"
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.35,
+            "max_tokens": max_output_tokens,
+            "stream": True,
+        }
+        
+        try:
+            async with llm_limiter.stream(
+                "POST", url, priority=self.priority, tokens=estimate_message_tokens(messages, max_output_tokens),
+                headers=self._headers, json=payload,
+            ) as resp:
                 if resp.status_code == 400:
-                    # Get detailed error information for 400 Bad Request
-                    try:
-                        error_data = resp.json()
-                        error_detail = error_data.get("error", {}).get("message", "Bad Request")
-                        raise ValueError(f"Cerebras API Bad Request: {error_detail}")
-                    except:
-                        raise ValueError("Cerebras API Bad Request: Invalid request format or parameters")
+                    raise ValueError("Cerebras API Bad Request: Invalid request format or parameters")
                 elif resp.status_code == 401:
                     raise ValueError("Invalid Cerebras API key")
                 elif resp.status_code == 429:
-                    raise ValueError("Rate limit exceeded. Please try again later.")
+                    raise ValueError("Rate limit exceeded after retries. Please try again later.")
                 elif resp.status_code == 500:
                     raise ValueError("Cerebras API server error. Please try again later.")
                 
                 resp.raise_for_status()
-                data = resp.json()
-                
-                if "choices" not in data or not data["choices"]:
-                    raise ValueError("Invalid response format from Cerebras API")
-                
-                content = data["choices"][0]["message"]["content"]
-                if not content:
-                    raise ValueError("Empty response from Cerebras API")
-                
-                return content.strip()
+                async for delta in iter_completion_deltas(resp):
+                    yield delta
                 
         except httpx.TimeoutException:
             raise ValueError("Request timeout. The query may be too complex or the API is slow.")
         except httpx.RequestError as e:
             raise ValueError(f"Network error connecting to Cerebras API: {e}")
         except json.JSONDecodeError:
-            raise ValueError("Invalid JSON response from Cerebras API")
-        except KeyError as e:
-            raise ValueError(f"Unexpected response format from Cerebras API: missing {e}")
+            raise ValueError("Invalid JSON in Cerebras API stream")
+        except ValueError:
+            raise
         except Exception as e:
             raise ValueError(f"Unexpected error with Cerebras API: {e}")
     
-    async def generate_response(self, patient_id: str, user_message: str) -> str:
-        """Generate intelligent response using patient data and Cerebras AI."""
-        if not user_message or not user_message.strip():
-            raise ValueError("User message cannot be empty")
+    async def summarize_conversation(self, summary: str, new_messages: str) -> str:
+        """Fold older chat messages into a patient's running conversation summary."""
+        messages = [
+            {"role": "system", "content": SYSTEM_CHAT_SUMMARY},
+            {"role": "user", "content": (
+                f"SUMMARY SO FAR:\n{summary.strip() or '(none yet)'}\n\n"
+                f"OLDER MESSAGES:\n{new_messages.replace(CHATBOT_DISCLAIMER, '').strip()}"
+            )},
+        ]
+        return await self._chat(
+            messages, max_output_tokens=settings.chat_memory_summary_tokens, priority=PRIORITY_BACKGROUND
+        )
+    
+    async def _memory_messages(self, patient_id: str, user_message: str) -> List[Dict[str, str]]:
+        """Earlier conversation as chat messages: the rolling summary plus the last turns verbatim."""
+        summary, recent = await self.memory.get(patient_id, user_message)
+        messages = []
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation with this patient:\n{summary}"})
+        for message in recent:
+            text = message["message"].replace(CHATBOT_DISCLAIMER, "").strip()
+            messages.append({
+                "role": "user" if message["is_user"] else "assistant",
+                "content": truncate_to_tokens(text, settings.chat_memory_message_tokens),
+            })
+        return messages
+    
+    async def _build_messages(self, patient_id: str, user_message: str) -> List[Dict[str, str]]:
+        """Build the Cerebras chat messages for a patient question."""
+        # Retrieve patient data and the bounded conversation memory
+        patient_context, memory_messages = await asyncio.gather(
+            self.patient_data_service.get_patient_context(patient_id, user_message),
+            self._memory_messages(patient_id, user_message),
+        )
         
-        try:
-            # Retrieve patient data
-            patient_data = await self.patient_data_service.get_patient_data(patient_id)
-            patient_context = self.patient_data_service.format_patient_context(patient_data)
-            
-            # Prepare messages for Cerebras
-            if "Database not available" in patient_context:
-                # Use a simpler prompt when database is not available
-                system_prompt = (
-                    "You are AarogyaAI Assistant, a helpful healthcare companion. "
-                    "Provide general health guidance and always recommend consulting with healthcare providers for medical advice. "
-                    "Be supportive, accurate, and include appropriate medical disclaimers."
-                )
-                user_prompt = f"""USER QUESTION: {user_message.strip()}
+        # Context and memory are budgeted, so only an oversized question could push the prompt past the cap
+        reserved = (
+            estimate_tokens(SYSTEM_CHATBOT) + estimate_tokens(patient_context) + self.PROMPT_TEMPLATE_TOKENS
+            + sum(estimate_tokens(message["content"]) for message in memory_messages)
+        )
+        question = truncate_to_tokens(
+            user_message.strip(), max(self.MIN_QUESTION_TOKENS, settings.chatbot_max_prompt_tokens - reserved)
+        )
+        
+        # Prepare messages for Cerebras
+        if "Database not available" in patient_context:
+            # Use a simpler prompt when database is not available
+            system_prompt = (
+                "You are AarogyaAI Assistant, a helpful healthcare companion. "
+                "Provide general health guidance and always recommend consulting with healthcare providers for medical advice. "
+                "Be supportive, accurate, and include appropriate medical disclaimers."
+            )
+            user_prompt = f"""USER QUESTION: {question}
 
 Please provide helpful health guidance. Since I don't have access to your specific medical history right now, I'll provide general information. Always recommend consulting with your healthcare provider for personalized medical advice."""
-            else:
-                # Use full context when patient data is available
-                system_prompt = SYSTEM_CHATBOT
-                user_prompt = f"""COMPREHENSIVE PATIENT MEDICAL CONTEXT:
+        else:
+            # Use full context when patient data is available
+            system_prompt = SYSTEM_CHATBOT
+            user_prompt = f"""COMPREHENSIVE PATIENT MEDICAL CONTEXT:
 {patient_context}
 
-PATIENT'S QUESTION: {user_message.strip()}
+PATIENT'S QUESTION: {question}
 
 INSTRUCTIONS FOR YOUR RESPONSE:
 1. **Analyze the patient's question** using only documented medical information
@@ -532,65 +763,103 @@ INSTRUCTIONS FOR YOUR RESPONSE:
 
 Please provide a factual, personalized response using only explicitly documented patient data with minimal markdown formatting to give the most helpful and relevant guidance possible."""
 
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-            
-            # Generate response
-            response = await self._chat(messages, max_output_tokens=1500)
-            
-            # Add medical disclaimer
-            disclaimer = "\n\n⚠️ *This information is for general guidance only and should not replace professional medical advice. Please consult with your healthcare provider for personalized medical care.*"
-            
-            return response + disclaimer
-            
-        except Exception as e:
-            # Fallback response if AI fails
-            error_msg = str(e)
-            if "400" in error_msg or "Bad Request" in error_msg:
-                fallback_response = """I apologize, but I'm experiencing some technical difficulties with the AI service right now. 
+        messages = [
+            {"role": "system", "content": system_prompt},
+            *memory_messages,
+            {"role": "user", "content": user_prompt}
+        ]
+        return messages
+    
+    def _fallback_response(self, user_message: str, error_msg: str) -> str:
+        """Build the fallback response shown when the AI service fails."""
+        if "400" in error_msg or "Bad Request" in error_msg:
+            fallback_response = """I apologize, but I'm experiencing some technical difficulties with the AI service right now. 
 
 Let me provide you with general health guidance based on your question:
 
 """
-                # Add basic fallback logic based on the user's question
-                user_question_lower = user_message.lower()
-                if any(word in user_question_lower for word in ["pain", "hurt", "ache", "symptom"]):
-                    fallback_response += """• If you're experiencing pain or symptoms, monitor them closely
+            # Add basic fallback logic based on the user's question
+            user_question_lower = user_message.lower()
+            if any(word in user_question_lower for word in ["pain", "hurt", "ache", "symptom"]):
+                fallback_response += """• If you're experiencing pain or symptoms, monitor them closely
 • Note the severity, duration, and any triggers
 • Contact your healthcare provider if symptoms worsen or persist
 • For severe pain or emergency symptoms, seek immediate medical attention"""
-                elif any(word in user_question_lower for word in ["appointment", "visit", "schedule"]):
-                    fallback_response += """• You can book appointments through your patient dashboard
+            elif any(word in user_question_lower for word in ["appointment", "visit", "schedule"]):
+                fallback_response += """• You can book appointments through your patient dashboard
 • Contact your healthcare provider's office for scheduling
 • Check your upcoming appointments in the appointments section"""
-                elif any(word in user_question_lower for word in ["medication", "medicine", "prescription"]):
-                    fallback_response += """• For medication questions, consult your healthcare provider or pharmacist
+            elif any(word in user_question_lower for word in ["medication", "medicine", "prescription"]):
+                fallback_response += """• For medication questions, consult your healthcare provider or pharmacist
 • Take medications as prescribed and follow dosage instructions
 • Report any side effects to your healthcare provider immediately"""
-                else:
-                    fallback_response += """• For general health questions, consult with your healthcare provider
+            else:
+                fallback_response += """• For general health questions, consult with your healthcare provider
 • Maintain a healthy lifestyle with proper diet and exercise
 • Don't hesitate to seek professional medical advice when needed"""
-                
-                fallback_response += """
+            
+            fallback_response += """
 
 ⚠️ *This is general information only. Please consult with your healthcare provider for personalized medical advice.*"""
-                return fallback_response
-            else:
-                return f"""I apologize, but I'm experiencing some technical difficulties accessing your medical information right now. 
+            return fallback_response
+        else:
+            return f"""I apologize, but I'm experiencing some technical difficulties accessing your medical information right now. 
 
 For immediate health concerns, please contact your healthcare provider directly. For general health questions, I recommend consulting with a medical professional.
 
 Technical issue: {error_msg}
 
 Is there anything else I can help you with?"""
+    
+    async def generate_response(self, patient_id: str, user_message: str) -> str:
+        """Generate intelligent response using patient data and Cerebras AI."""
+        if not user_message or not user_message.strip():
+            raise ValueError("User message cannot be empty")
+        
+        try:
+            messages = await self._build_messages(patient_id, user_message)
+            
+            # Generate response
+            response = await self._chat(messages, max_output_tokens=1500)
+            
+            # Add medical disclaimer
+            return response + CHATBOT_DISCLAIMER
+            
+        except Exception as e:
+            # Fallback response if AI fails
+            return self._fallback_response(user_message, str(e))
+    
+    async def stream_response(self, patient_id: str, user_message: str) -> AsyncIterator[str]:
+        """Stream an intelligent response token by token, ending with the medical disclaimer.
+        
+        If the AI service fails before any text was produced, the fallback response is
+        yielded instead; a failure mid-stream is raised to the caller.
+        """
+        if not user_message or not user_message.strip():
+            raise ValueError("User message cannot be empty")
+        
+        started = False
+        try:
+            messages = await self._build_messages(patient_id, user_message)
+            async for delta in self._chat_stream(messages, max_output_tokens=1500):
+                started = True
+                yield delta
+        except Exception as e:
+            if started:
+                raise
+            yield self._fallback_response(user_message, str(e))
+            return
+        
+        yield CHATBOT_DISCLAIMER
 
 
 # Global instances
-patient_data_service = PatientDataService()
-intelligent_chatbot = IntelligentChatbotClient()
+patient_data_service = PatientDataService(database)
+intelligent_chatbot = IntelligentChatbotClient(patient_data_service)
+chat_memory = intelligent_chatbot.memory
+
+# Coalesces identical questions from the same patient while one is being answered
+chatbot_flight = SingleFlight("chatbot")
 
 
 async def generate_chatbot_response(patient_id: str, user_message: str) -> str:
@@ -608,3 +877,17 @@ async def generate_chatbot_response(patient_id: str, user_message: str) -> str:
         ValueError: If inputs are invalid or API calls fail
     """
     return await intelligent_chatbot.generate_response(patient_id, user_message)
+
+
+def stream_chatbot_response(patient_id: str, user_message: str) -> AsyncIterator[str]:
+    """
+    Stream an intelligent chatbot response as text deltas, ending with the medical disclaimer.
+    
+    Args:
+        patient_id: The patient's unique identifier
+        user_message: The user's question or message
+        
+    Returns:
+        Async iterator of response text chunks
+    """
+    return intelligent_chatbot.stream_response(patient_id, user_message)
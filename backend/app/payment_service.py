@@ -3,24 +3,18 @@ Custom Payment Service for AarogyaAI
 Handles UPI payments with saswatsusmoy@upi integration
 """
 
+import base64
 import json
 import uuid
 import hashlib
 import hmac
 import time
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from dataclasses import dataclass
 import asyncio
 
-try:
-    import asyncpg
-    ASYNCPG_AVAILABLE = True
-except ImportError:
-    ASYNCPG_AVAILABLE = False
-    asyncpg = None
-
-from .config import settings
+from .db import Database, database
 
 
 @dataclass
@@ -45,65 +39,64 @@ class PaymentResponse:
 class PaymentService:
     """Custom payment service for AarogyaAI"""
     
-    def __init__(self):
-        self.database_url = settings.database_url
+    def __init__(self, db: Database = database):
+        self.db = db
         self.merchant_upi_id = "saswatsusmoy@upi"
         self.merchant_name = "AarogyaAI"
         self.base_url = "https://aarogyaai.com"  # Replace with actual domain
         
     async def create_payment(self, request: PaymentRequest) -> PaymentResponse:
         """Create a new payment request"""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
+        if not self.db.is_available:
             return PaymentResponse(success=False, error_message="Database not available")
         
         try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
-                    # Generate transaction ID
-                    transaction_id = f"TXN_{int(time.time())}_{str(uuid.uuid4())[:8].upper()}"
-                    
-                    # Create payment record
-                    payment_id = str(uuid.uuid4())
-                    await conn.execute("""
-                        INSERT INTO "Payment" (
-                            id, "appointmentId", "patientId", "doctorId", 
-                            amount, currency, status, method, "transactionId"
-                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-                    """, payment_id, request.appointment_id, request.patient_id, 
-                        request.doctor_id, request.amount, "INR", "PENDING", 
-                        request.method, transaction_id)
-                    
-                    # Log payment creation
-                    await self._log_payment_action(
-                        conn, payment_id, "created", "PENDING", request.amount
-                    )
-                    
-                    # Generate UPI payment URL (for reference)
-                    upi_url = self._generate_upi_url(request.amount, transaction_id)
-                    
-                    # Use placeholder QR code data
-                    qr_data = "QR_CODE_PLACEHOLDER"
-                    
-                    # Update payment with UPI details
-                    await conn.execute("""
-                        UPDATE "Payment" 
-                        SET "upiId" = $1, "gatewayResponse" = $2
-                        WHERE id = $3
-                    """, request.upi_id or self.merchant_upi_id, json.dumps({"upi_url": upi_url, "qr_code": qr_data}), payment_id)
-                    
-                    # Log UPI payment initiation
-                    await self._log_payment_action(
-                        conn, payment_id, "initiated", "PROCESSING", request.amount,
-                        metadata=json.dumps({"method": "UPI", "upi_url": upi_url, "qr_code": qr_data})
-                    )
+            async with self.db.acquire() as conn:
+                # Generate transaction ID
+                transaction_id = f"TXN_{int(time.time())}_{str(uuid.uuid4())[:8].upper()}"
+                
+                # Create payment record
+                payment_id = str(uuid.uuid4())
+                await conn.execute("""
+                    INSERT INTO "Payment" (
+                        id, "appointmentId", "patientId", "doctorId", 
+                        amount, currency, status, method, "transactionId"
+                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                """, payment_id, request.appointment_id, request.patient_id, 
+                    request.doctor_id, request.amount, "INR", "PENDING", 
+                    request.method, transaction_id)
+                
+                # Log payment creation
+                await self._log_payment_action(
+                    conn, payment_id, "created", "PENDING", request.amount
+                )
+                
+                # Generate UPI payment URL (for reference)
+                upi_url = self._generate_upi_url(request.amount, transaction_id)
+                
+                # Use placeholder QR code data
+                qr_data = "QR_CODE_PLACEHOLDER"
+                
+                # Update payment with UPI details
+                await conn.execute("""
+                    UPDATE "Payment" 
+                    SET "upiId" = $1, "gatewayResponse" = $2
+                    WHERE id = $3
+                """, request.upi_id or self.merchant_upi_id, json.dumps({"upi_url": upi_url, "qr_code": qr_data}), payment_id)
+                
+                # Log UPI payment initiation
+                await self._log_payment_action(
+                    conn, payment_id, "initiated", "PROCESSING", request.amount,
+                    metadata=json.dumps({"method": "UPI", "upi_url": upi_url, "qr_code": qr_data})
+                )
+                
+                return PaymentResponse(
+                    success=True,
+                    transaction_id=transaction_id,
+                    payment_url=upi_url,
+                    qr_code=qr_data
+                )
                     
-                    return PaymentResponse(
-                        success=True,
-                        transaction_id=transaction_id,
-                        payment_url=upi_url,
-                        qr_code=qr_data
-                    )
-                        
         except Exception as e:
             return PaymentResponse(success=False, error_message=f"Payment creation failed: {str(e)}")
     
@@ -124,35 +117,34 @@ class PaymentService:
     
     async def verify_payment(self, transaction_id: str) -> Dict[str, Any]:
         """Verify payment status"""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
+        if not self.db.is_available:
             return {"success": False, "error": "Database not available"}
         
         try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
-                    # Get payment details
-                    payment = await conn.fetchrow("""
-                        SELECT * FROM "Payment" WHERE "transactionId" = $1
-                    """, transaction_id)
+            async with self.db.acquire() as conn:
+                # Get payment details
+                payment = await conn.fetchrow("""
+                    SELECT * FROM "Payment" WHERE "transactionId" = $1
+                """, transaction_id)
+                
+                if not payment:
+                    return {"success": False, "error": "Payment not found"}
+                
+                # Simulate payment verification (in real implementation, check with payment gateway)
+                # For demo purposes, we'll simulate successful payment after 5 seconds
+                payment_age = datetime.now() - payment["createdAt"]
+                
+                if payment_age.total_seconds() > 5 and payment["status"] == "PROCESSING":
+                    # Simulate successful payment
+                    await self._complete_payment(conn, payment["id"], transaction_id)
+                    return {"success": True, "status": "COMPLETED"}
+                elif payment["status"] == "COMPLETED":
+                    return {"success": True, "status": "COMPLETED"}
+                elif payment["status"] == "FAILED":
+                    return {"success": False, "status": "FAILED"}
+                else:
+                    return {"success": True, "status": "PROCESSING"}
                     
-                    if not payment:
-                        return {"success": False, "error": "Payment not found"}
-                    
-                    # Simulate payment verification (in real implementation, check with payment gateway)
-                    # For demo purposes, we'll simulate successful payment after 5 seconds
-                    payment_age = datetime.now() - payment["createdAt"]
-                    
-                    if payment_age.total_seconds() > 5 and payment["status"] == "PROCESSING":
-                        # Simulate successful payment
-                        await self._complete_payment(conn, payment["id"], transaction_id)
-                        return {"success": True, "status": "COMPLETED"}
-                    elif payment["status"] == "COMPLETED":
-                        return {"success": True, "status": "COMPLETED"}
-                    elif payment["status"] == "FAILED":
-                        return {"success": False, "status": "FAILED"}
-                    else:
-                        return {"success": True, "status": "PROCESSING"}
-                        
         except Exception as e:
             return {"success": False, "error": str(e)}
     
@@ -191,151 +183,198 @@ class PaymentService:
     
     async def get_payment_logs(self, doctor_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get payment logs for doctor"""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
-            return []
+        payments, _ = await self.get_payment_logs_page(doctor_id, limit)
+        return payments
+    
+    async def get_payment_logs_page(self, doctor_id: str, limit: int = 50,
+                                    cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get one page of payment logs for doctor, newest first.
+        
+        Pages are addressed by an opaque (createdAt, id) keyset cursor so every
+        page costs the same regardless of how deep the doctor has paged.
+        Returns the payments and the cursor for the next page (None on the last page).
+        """
+        if not self.db.is_available:
+            return [], None
+        
+        # Raises ValueError for a malformed cursor so the caller can reject it
+        after = self._decode_cursor(cursor) if cursor else None
         
         try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
-                    # Get payments for doctor with logs (exclude declined appointments)
-                    payments = await conn.fetch("""
-                        SELECT 
-                            p.*,
-                            u1.username as patient_username,
-                            u2.username as doctor_username,
-                            a."scheduledAt" as appointment_date,
-                            a.reason as appointment_reason,
-                            a.status as appointment_status
-                        FROM "Payment" p
-                        JOIN "User" u1 ON p."patientId" = u1.id
-                        JOIN "User" u2 ON p."doctorId" = u2.id
-                        JOIN "Appointment" a ON p."appointmentId" = a.id
-                        WHERE p."doctorId" = $1 AND a.status != 'DECLINED'
-                        ORDER BY p."createdAt" DESC
-                        LIMIT $2
-                    """, doctor_id, limit)
-                    
-                    # Get logs for each payment and flatten the structure
-                    result = []
-                    for payment in payments:
-                        logs = await conn.fetch("""
-                            SELECT * FROM "PaymentLog" 
-                            WHERE "paymentId" = $1 
-                            ORDER BY "createdAt" ASC
-                        """, payment["id"])
-                        
-                        # Flatten payment data and add logs
-                        payment_dict = dict(payment)
-                        payment_dict["logs"] = [dict(log) for log in logs]
-                        result.append(payment_dict)
-                    
-                    return result
-                    
+            async with self.db.acquire() as conn:
+                # Get payments for doctor (exclude declined appointments); fetch one
+                # extra row to know whether another page exists
+                query = """
+                    SELECT 
+                        p.*,
+                        u1.username as patient_username,
+                        u2.username as doctor_username,
+                        a."scheduledAt" as appointment_date,
+                        a.reason as appointment_reason,
+                        a.status as appointment_status
+                    FROM "Payment" p
+                    JOIN "User" u1 ON p."patientId" = u1.id
+                    JOIN "User" u2 ON p."doctorId" = u2.id
+                    JOIN "Appointment" a ON p."appointmentId" = a.id
+                    WHERE p."doctorId" = $1 AND a.status != 'DECLINED'
+                """
+                if after:
+                    query += """
+                      AND (p."createdAt", p.id) < ($3, $4)
+                    """
+                query += """
+                    ORDER BY p."createdAt" DESC, p.id DESC
+                    LIMIT $2
+                """
+                args = [doctor_id, limit + 1]
+                if after:
+                    args.extend(after)
+                payments = await conn.fetch(query, *args)
+                
+                has_more = len(payments) > limit
+                payments = payments[:limit]
+                
+                # Get logs for all payments on the page in one round trip
+                payment_ids = [payment["id"] for payment in payments]
+                logs_by_payment: Dict[str, List[Dict[str, Any]]] = {pid: [] for pid in payment_ids}
+                if payment_ids:
+                    logs = await conn.fetch("""
+                        SELECT * FROM "PaymentLog" 
+                        WHERE "paymentId" = ANY($1::text[]) 
+                        ORDER BY "paymentId", "createdAt" ASC
+                    """, payment_ids)
+                    for log in logs:
+                        logs_by_payment[log["paymentId"]].append(dict(log))
+                
+                # Flatten payment data and add logs
+                result = []
+                for payment in payments:
+                    payment_dict = dict(payment)
+                    payment_dict["logs"] = logs_by_payment[payment["id"]]
+                    result.append(payment_dict)
+                
+                next_cursor = None
+                if has_more and payments:
+                    last = payments[-1]
+                    next_cursor = self._encode_cursor(last["createdAt"], last["id"])
+                
+                return result, next_cursor
+                
         except Exception as e:
             print(f"Error getting payment logs: {e}")
-            return []
+            return [], None
+    
+    def _encode_cursor(self, created_at: datetime, payment_id: str) -> str:
+        """Encode a (createdAt, id) keyset position as an opaque cursor"""
+        raw = json.dumps({"created_at": created_at.isoformat(), "id": payment_id})
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    def _decode_cursor(self, cursor: str) -> Tuple[datetime, str]:
+        """Decode an opaque cursor back into a (createdAt, id) keyset position"""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            return datetime.fromisoformat(data["created_at"]), str(data["id"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid pagination cursor: {e}")
     
     async def get_payment_statistics(self, doctor_id: str) -> Dict[str, Any]:
         """Get payment statistics for doctor"""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
+        if not self.db.is_available:
             return {}
         
         try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
-                    # Get payment statistics (exclude declined appointments)
-                    stats = await conn.fetchrow("""
-                        SELECT 
-                            COUNT(*) as total_payments,
-                            SUM(CASE WHEN p.status = 'COMPLETED' THEN p.amount ELSE 0 END) as total_amount,
-                            SUM(CASE WHEN p.status = 'COMPLETED' THEN 1 ELSE 0 END) as successful_payments,
-                            SUM(CASE WHEN p.status = 'FAILED' THEN 1 ELSE 0 END) as failed_payments,
-                            AVG(CASE WHEN p.status = 'COMPLETED' THEN p.amount END) as average_amount
-                        FROM "Payment" p
-                        JOIN "Appointment" a ON p."appointmentId" = a.id
-                        WHERE p."doctorId" = $1 AND a.status != 'DECLINED'
-                    """, doctor_id)
-                    
-                    return dict(stats) if stats else {}
-                    
+            async with self.db.acquire() as conn:
+                # Get payment statistics (exclude declined appointments)
+                stats = await conn.fetchrow("""
+                    SELECT 
+                        COUNT(*) as total_payments,
+                        SUM(CASE WHEN p.status = 'COMPLETED' THEN p.amount ELSE 0 END) as total_amount,
+                        SUM(CASE WHEN p.status = 'COMPLETED' THEN 1 ELSE 0 END) as successful_payments,
+                        SUM(CASE WHEN p.status = 'FAILED' THEN 1 ELSE 0 END) as failed_payments,
+                        AVG(CASE WHEN p.status = 'COMPLETED' THEN p.amount END) as average_amount
+                    FROM "Payment" p
+                    JOIN "Appointment" a ON p."appointmentId" = a.id
+                    WHERE p."doctorId" = $1 AND a.status != 'DECLINED'
+                """, doctor_id)
+                
+                return dict(stats) if stats else {}
+                
         except Exception as e:
             print(f"Error getting payment statistics: {e}")
             return {}
     
     async def get_appointment_with_payment(self, appointment_id: str) -> Dict[str, Any]:
         """Get appointment details with payment information"""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
+        if not self.db.is_available:
             return {}
         
         try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
-                    # Get appointment with payment details
-                    appointment = await conn.fetchrow("""
-                        SELECT 
-                            a.*,
-                            p.id as payment_id,
-                            p.amount as payment_amount,
-                            p.status as payment_status,
-                            p.method as payment_method,
-                            p."transactionId" as payment_transaction_id,
-                            p."upiId" as payment_upi_id,
-                            p."paidAt" as payment_paid_at,
-                            p."gatewayResponse" as payment_gateway_response,
-                            u1.username as patient_username,
-                            u2.username as doctor_username
-                        FROM "Appointment" a
-                        LEFT JOIN "Payment" p ON a.id = p."appointmentId"
-                        LEFT JOIN "User" u1 ON a."patientId" = u1.id
-                        LEFT JOIN "User" u2 ON a."doctorId" = u2.id
-                        WHERE a.id = $1
-                    """, appointment_id)
-                    
-                    if not appointment:
-                        return {}
-                    
-                    # Get payment logs if payment exists
-                    payment_logs = []
-                    if appointment["payment_id"]:
-                        logs = await conn.fetch("""
-                            SELECT * FROM "PaymentLog" 
-                            WHERE "paymentId" = $1 
-                            ORDER BY "createdAt" ASC
-                        """, appointment["payment_id"])
-                        payment_logs = [dict(log) for log in logs]
-                    
-                    return {
-                        "appointment": dict(appointment),
-                        "payment_logs": payment_logs
-                    }
-                    
+            async with self.db.acquire() as conn:
+                # Get appointment with payment details
+                appointment = await conn.fetchrow("""
+                    SELECT 
+                        a.*,
+                        p.id as payment_id,
+                        p.amount as payment_amount,
+                        p.status as payment_status,
+                        p.method as payment_method,
+                        p."transactionId" as payment_transaction_id,
+                        p."upiId" as payment_upi_id,
+                        p."paidAt" as payment_paid_at,
+                        p."gatewayResponse" as payment_gateway_response,
+                        u1.username as patient_username,
+                        u2.username as doctor_username
+                    FROM "Appointment" a
+                    LEFT JOIN "Payment" p ON a.id = p."appointmentId"
+                    LEFT JOIN "User" u1 ON a."patientId" = u1.id
+                    LEFT JOIN "User" u2 ON a."doctorId" = u2.id
+                    WHERE a.id = $1
+                """, appointment_id)
+                
+                if not appointment:
+                    return {}
+                
+                # Get payment logs if payment exists
+                payment_logs = []
+                if appointment["payment_id"]:
+                    logs = await conn.fetch("""
+                        SELECT * FROM "PaymentLog" 
+                        WHERE "paymentId" = $1 
+                        ORDER BY "createdAt" ASC
+                    """, appointment["payment_id"])
+                    payment_logs = [dict(log) for log in logs]
+                
+                return {
+                    "appointment": dict(appointment),
+                    "payment_logs": payment_logs
+                }
+                
         except Exception as e:
             print(f"Error getting appointment with payment: {e}")
             return {}
     
     async def complete_payment_immediately(self, transaction_id: str, upi_transaction_id: str = None) -> Dict[str, Any]:
         """Complete payment immediately for POC testing purposes"""
-        if not self.database_url or not ASYNCPG_AVAILABLE:
+        if not self.db.is_available:
             return {"success": False, "error": "Database not available"}
         
         try:
-            async with asyncpg.create_pool(self.database_url) as pool:
-                async with pool.acquire() as conn:
-                    # Get payment details
-                    payment = await conn.fetchrow("""
-                        SELECT * FROM "Payment" WHERE "transactionId" = $1
-                    """, transaction_id)
-                    
-                    if not payment:
-                        return {"success": False, "error": "Payment not found"}
-                    
-                    if payment["status"] == "COMPLETED":
-                        return {"success": True, "status": "COMPLETED", "message": "Payment already completed"}
-                    
-                    # POC: Complete the payment with UPI transaction ID (mock completion)
-                    await self._complete_payment_with_upi_id(conn, payment["id"], transaction_id, upi_transaction_id)
-                    return {"success": True, "status": "COMPLETED", "message": "Payment completed successfully (POC Demo)"}
-                    
+            async with self.db.acquire() as conn:
+                # Get payment details
+                payment = await conn.fetchrow("""
+                    SELECT * FROM "Payment" WHERE "transactionId" = $1
+                """, transaction_id)
+                
+                if not payment:
+                    return {"success": False, "error": "Payment not found"}
+                
+                if payment["status"] == "COMPLETED":
+                    return {"success": True, "status": "COMPLETED", "message": "Payment already completed"}
+                
+                # POC: Complete the payment with UPI transaction ID (mock completion)
+                await self._complete_payment_with_upi_id(conn, payment["id"], transaction_id, upi_transaction_id)
+                return {"success": True, "status": "COMPLETED", "message": "Payment completed successfully (POC Demo)"}
+                
         except Exception as e:
             return {"success": False, "error": str(e)}
     
@@ -0,0 +1,149 @@
+"""
+Token-budgeted prompt assembly.
+
+Sections are filled in priority order, each up to its own allowance; budget a
+section leaves unused is then handed out again in priority order. Items are
+kept whole where possible and truncated at a word boundary otherwise, so the
+same input and budget always yield the same prompt.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from .config import settings
+
+
+TRUNCATION_MARKER = " ...[truncated]"
+
+# Smallest remainder worth filling with a truncated item
+MIN_PARTIAL_TOKENS = 24
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate tokens from characters, calibrated by PROMPT_CHARS_PER_TOKEN."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / settings.prompt_chars_per_token)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most ``max_tokens`` estimated tokens, preferring a word boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = int(max_tokens * settings.prompt_chars_per_token) - len(TRUNCATION_MARKER)
+    if max_chars <= 0:
+        return ""
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+@dataclass
+class _Section:
+    name: str
+    priority: int
+    allowance: int
+    header: str
+    items: List[str]
+    chosen: List[str] = field(default_factory=list)
+    used: int = 0
+    truncated: bool = False
+
+    @property
+    def complete(self) -> bool:
+        return len(self.chosen) == len(self.items) and not self.truncated
+
+
+class PromptBudget:
+    """Collect prompt sections and render them within a token budget."""
+
+    def __init__(self, budget: int):
+        self.budget = max(0, budget)
+        self._sections: List[_Section] = []
+
+    def add_section(self, name: str, priority: int, allowance: int, header: str, items: List[str]) -> None:
+        """Add a section; lower priority values are filled first, items in the given order."""
+        items = [item for item in items if item]
+        if items:
+            self._sections.append(_Section(name, priority, allowance, header, items))
+
+    @staticmethod
+    def _cost(text: str) -> int:
+        return estimate_tokens(text) + 1  # joining newline
+
+    def _fill(self, section: _Section, limit: int, allow_partial: bool) -> int:
+        """Add items to a section within ``limit`` tokens; returns the net tokens spent."""
+        refund = 0
+        if section.truncated:
+            # Re-expand the previously truncated item with the larger limit
+            refund = self._cost(section.chosen.pop())
+            section.truncated = False
+        limit += refund
+        spent = 0
+        if section.used == 0:
+            spent = self._cost(section.header) + 1  # blank line after the section
+            if spent >= limit:
+                return 0
+        while len(section.chosen) < len(section.items):
+            item = section.items[len(section.chosen)]
+            cost = self._cost(item)
+            if spent + cost <= limit:
+                section.chosen.append(item)
+                spent += cost
+                continue
+            room = limit - spent - 1
+            if allow_partial and room >= MIN_PARTIAL_TOKENS:
+                partial = truncate_to_tokens(item, room)
+                section.chosen.append(partial)
+                section.truncated = True
+                spent += self._cost(partial)
+            break
+        if not section.chosen:
+            return 0
+        section.used += spent - refund
+        return spent - refund
+
+    def render(self) -> Tuple[str, Dict[str, Any]]:
+        """Return the assembled text and a report of tokens used per section."""
+        remaining = self.budget
+        by_priority = sorted(self._sections, key=lambda section: section.priority)
+
+        # Pass 1: each section up to its allowance; a section only truncates if nothing else fits
+        for section in by_priority:
+            limit = min(section.allowance, remaining)
+            remaining -= self._fill(section, limit, allow_partial=False)
+            if not section.chosen:
+                remaining -= self._fill(section, limit, allow_partial=True)
+
+        # Pass 2: hand out unused budget in priority order
+        for section in by_priority:
+            if remaining <= 0:
+                break
+            if not section.complete:
+                remaining -= self._fill(section, remaining, allow_partial=True)
+
+        lines: List[str] = []
+        for section in self._sections:
+            if section.chosen:
+                lines.append(section.header)
+                lines.extend(section.chosen)
+                lines.append("")
+        text = "\n".join(lines)
+
+        report = {
+            "budget": self.budget,
+            "used": self.budget - remaining,
+            "sections": {
+                section.name: {
+                    "tokens": section.used,
+                    "items": len(section.chosen),
+                    "total_items": len(section.items),
+                    "truncated": section.truncated,
+                }
+                for section in self._sections
+            },
+        }
+        return text, report
@@ -0,0 +1,263 @@
+"""
+Local per-patient relevance index over consultation transcripts and AI notes.
+
+Documents are split into chunks and stored as hashed term-frequency vectors in
+CSR arrays; questions are scored with BM25 in NumPy, on CPU with no network
+calls. Indexes are updated incrementally (only new or changed documents are
+chunked) and, when a directory is configured, persisted as one ``.npz`` file
+per patient.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .config import settings
+from .transcript_chunking import split_transcript
+
+
+N_FEATURES = 1 << 20
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be been but by can could did do does for from had has have he her his how i if in into "
+    "is it its me my no not of on or our she so than that the their them then there these they this to was we "
+    "were what when where which who why will with would you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords, with a light plural strip."""
+    tokens = []
+    for word in _WORD.findall(text.lower()):
+        if len(word) < 2 or word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def _hash_terms(tokens: List[str]) -> np.ndarray:
+    # crc32 is stable across processes, unlike hash(), so persisted indexes stay valid
+    return np.fromiter((zlib.crc32(token.encode("utf-8")) % N_FEATURES for token in tokens), dtype=np.int64, count=len(tokens))
+
+
+@dataclass
+class IndexDocument:
+    """A retrievable source text (a transcript or an appointment's AI notes)."""
+    key: str
+    kind: str
+    date: Optional[str]
+    text: str
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:16]
+
+
+class _PatientIndex:
+    """Chunks of one patient's documents as a CSR term-frequency matrix."""
+
+    def __init__(self) -> None:
+        self.chunks: List[Dict[str, Any]] = []  # {"doc", "kind", "date", "text"}
+        self.docs: Dict[str, str] = {}          # document key -> content digest
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.data = np.zeros(0, dtype=np.float32)
+        self.lengths = np.zeros(0, dtype=np.float32)
+
+    def clone(self) -> "_PatientIndex":
+        """Copy that can be updated while searches keep reading this one (arrays are never mutated in place)."""
+        index = _PatientIndex()
+        index.chunks, index.docs = list(self.chunks), dict(self.docs)
+        index.indptr, index.indices, index.data, index.lengths = self.indptr, self.indices, self.data, self.lengths
+        return index
+
+    def _drop_docs(self, keys: set) -> None:
+        keep = [i for i, chunk in enumerate(self.chunks) if chunk["doc"] not in keys]
+        if len(keep) == len(self.chunks):
+            return
+        starts, ends = self.indptr[:-1][keep], self.indptr[1:][keep]
+        spans = [np.arange(start, end) for start, end in zip(starts, ends)]
+        positions = np.concatenate(spans) if spans else np.zeros(0, dtype=np.int64)
+        self.indices, self.data = self.indices[positions], self.data[positions]
+        self.indptr = np.concatenate([[0], np.cumsum(ends - starts)]).astype(np.int64)
+        self.lengths = self.lengths[keep]
+        self.chunks = [self.chunks[i] for i in keep]
+        for key in keys:
+            self.docs.pop(key, None)
+
+    def update(self, documents: List[IndexDocument], chunk_chars: int, overlap_chars: int) -> int:
+        """Index new or changed documents. Returns the number of chunks added."""
+        changed = [doc for doc in documents if doc.text and doc.text.strip() and self.docs.get(doc.key) != doc.digest]
+        if not changed:
+            return 0
+        self._drop_docs({doc.key for doc in changed})
+
+        indices: List[np.ndarray] = [self.indices]
+        data: List[np.ndarray] = [self.data]
+        lengths: List[float] = []
+        counts: List[int] = []
+        for doc in changed:
+            for text in split_transcript(doc.text, chunk_chars, overlap_chars):
+                terms, tf = np.unique(_hash_terms(tokenize(text)), return_counts=True)
+                indices.append(terms)
+                data.append(tf.astype(np.float32))
+                lengths.append(float(tf.sum()))
+                counts.append(len(terms))
+                self.chunks.append({"doc": doc.key, "kind": doc.kind, "date": doc.date, "text": text})
+            self.docs[doc.key] = doc.digest
+
+        self.indices = np.concatenate(indices)
+        self.data = np.concatenate(data)
+        self.lengths = np.concatenate([self.lengths, np.asarray(lengths, dtype=np.float32)])
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(counts, dtype=np.int64)])
+        return len(counts)
+
+    def search(self, question: str, top_k: int) -> List[Dict[str, Any]]:
+        """Top-k chunks by BM25; the most recent chunks when nothing in the question matches."""
+        n_chunks = len(self.chunks)
+        if n_chunks == 0 or top_k <= 0:
+            return []
+        query = np.unique(_hash_terms(tokenize(question)))
+        scores = np.zeros(n_chunks, dtype=np.float64)
+        if query.size:
+            matched = np.isin(self.indices, query)
+            if matched.any():
+                rows = np.repeat(np.arange(n_chunks), np.diff(self.indptr))[matched]
+                terms = self.indices[matched]
+                tf = self.data[matched]
+                # Document frequency per matched term (each chunk holds a term at most once)
+                _, inverse, df = np.unique(terms, return_inverse=True, return_counts=True)
+                idf = np.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+                avg_length = max(float(self.lengths.mean()), 1.0)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[rows] / avg_length)
+                np.add.at(scores, rows, idf[inverse] * tf * (BM25_K1 + 1) / (tf + norm))
+
+        # Ties (including all-zero scores) favour newer documents
+        dates = np.array([chunk["date"] or "" for chunk in self.chunks])
+        order = np.lexsort((-np.arange(n_chunks), dates, scores))[::-1]
+        if scores[order[0]] > 0:
+            order = order[scores[order] > 0]
+        return [{**self.chunks[i], "score": round(float(scores[i]), 4)} for i in order[:top_k]]
+
+    def save(self, path: str) -> None:
+        meta = json.dumps({"chunks": self.chunks, "docs": self.docs})
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, indptr=self.indptr, indices=self.indices, data=self.data,
+                                lengths=self.lengths, meta=np.array(meta))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "_PatientIndex":
+        index = cls()
+        with np.load(path, allow_pickle=False) as arrays:
+            meta = json.loads(str(arrays["meta"]))
+            index.indptr, index.indices = arrays["indptr"], arrays["indices"]
+            index.data, index.lengths = arrays["data"], arrays["lengths"]
+        index.chunks, index.docs = meta["chunks"], meta["docs"]
+        return index
+
+
+class RelevanceIndex:
+    """LRU of per-patient indexes, optionally persisted under ``index_dir``."""
+
+    def __init__(self, index_dir: Optional[str] = None, max_patients: Optional[int] = None,
+                 chunk_chars: Optional[int] = None, overlap_chars: Optional[int] = None):
+        self.index_dir = index_dir if index_dir is not None else settings.relevance_index_dir
+        self.max_patients = max_patients if max_patients is not None else settings.relevance_max_patients
+        self.chunk_chars = chunk_chars if chunk_chars is not None else settings.relevance_chunk_chars
+        self.overlap_chars = overlap_chars if overlap_chars is not None else settings.relevance_chunk_overlap_chars
+        self._indexes: "OrderedDict[str, _PatientIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.chunks_indexed = 0
+        self.searches = 0
+        self.disk_loads = 0
+
+    def _path(self, patient_id: str) -> Optional[str]:
+        if not self.index_dir:
+            return None
+        name = hashlib.sha256(patient_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.index_dir, f"{name}.npz")
+
+    def _remember(self, patient_id: str, index: _PatientIndex) -> None:
+        self._indexes[patient_id] = index
+        self._indexes.move_to_end(patient_id)
+        while len(self._indexes) > self.max_patients:
+            evicted, _ = self._indexes.popitem(last=False)
+            self._locks.pop(evicted, None)
+
+    async def _get(self, patient_id: str) -> Optional[_PatientIndex]:
+        index = self._indexes.get(patient_id)
+        if index is not None:
+            self._indexes.move_to_end(patient_id)
+            return index
+        path = self._path(patient_id)
+        if path and os.path.exists(path):
+            try:
+                index = await asyncio.to_thread(_PatientIndex.load, path)
+                self.disk_loads += 1
+                self._remember(patient_id, index)
+                return index
+            except Exception as e:
+                print(f"Error loading relevance index: {e}")
+        return None
+
+    async def has(self, patient_id: str) -> bool:
+        """Whether an index (in memory or on disk) exists for the patient."""
+        return await self._get(patient_id) is not None
+
+    async def update(self, patient_id: str, documents: List[IndexDocument]) -> int:
+        """Add new or changed documents to a patient's index and persist it. Returns chunks added."""
+        lock = self._locks.setdefault(patient_id, asyncio.Lock())
+        async with lock:
+            current = await self._get(patient_id)
+            index = current.clone() if current is not None else _PatientIndex()
+            # Chunking and hashing are CPU-bound; keep them off the event loop
+            added = await asyncio.to_thread(index.update, documents, self.chunk_chars, self.overlap_chars)
+            self._remember(patient_id, index)
+            self.chunks_indexed += added
+            path = self._path(patient_id)
+            if added and path:
+                try:
+                    os.makedirs(self.index_dir, exist_ok=True)
+                    await asyncio.to_thread(index.save, path)
+                except Exception as e:
+                    print(f"Error saving relevance index: {e}")
+            return added
+
+    async def search(self, patient_id: str, question: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the chunks most relevant to the question, best first."""
+        index = await self._get(patient_id)
+        if index is None:
+            return []
+        self.searches += 1
+        return index.search(question, top_k if top_k is not None else settings.relevance_top_k)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index sizes and counters."""
+        return {
+            "patients_in_memory": len(self._indexes),
+            "max_patients": self.max_patients,
+            "chunks_in_memory": sum(len(index.chunks) for index in self._indexes.values()),
+            "chunks_indexed": self.chunks_indexed,
+            "searches": self.searches,
+            "disk_loads": self.disk_loads,
+            "persisted": bool(self.index_dir),
+        }
+
+
+# Global instance
+relevance_index = RelevanceIndex()
@@ -0,0 +1,142 @@
+"""
+Rolling clinical findings for live consultations.
+
+While a session is running, new transcript segments are folded into a draft in
+the background, every ``interval_seconds`` or as soon as ``min_new_segments``
+segments have arrived. Each update sends only the segments added since the last
+one, and segments folded into the findings are dropped, so memory stays bounded
+however long the call runs. When the session stops, only the short tail the
+draft does not cover yet has to be reconciled, so notes are ready shortly after
+the call ends.
+"""
+
+import asyncio
+import logging
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .ai_notes import cerebras_client, generate_notes_from_draft, notes_cache_transcript_key
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RollingNotesDraft:
+    """Background-maintained findings draft for one live transcript."""
+
+    def __init__(self, interval_seconds: Optional[float] = None, min_new_segments: Optional[int] = None):
+        self.interval_seconds = interval_seconds if interval_seconds is not None else settings.rolling_notes_interval_seconds
+        self.min_new_segments = min_new_segments if min_new_segments is not None else settings.rolling_notes_min_segments
+        # Segments not yet dropped; the first ``summarized`` are already folded into the findings
+        self.segments: List[str] = []
+        self.findings = ""
+        self.summarized = 0
+        self.total = 0
+        # Cache address of the whole transcript, kept without its text
+        self._cache_key = notes_cache_transcript_key()
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.updates = 0
+        self.errors = 0
+        self.last_update_ms = 0.0
+        self.finalize_ms = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self.segments) - self.summarized
+
+    def add_segment(self, text: str) -> None:
+        """Record a transcript segment, waking the updater once enough new segments have arrived."""
+        if not text or not text.strip():
+            return
+        self.segments.append(text.strip())
+        self._cache_key.add(text)
+        self.total += 1
+        if self.pending >= self.min_new_segments:
+            self._wake.set()
+
+    def start(self) -> None:
+        """Start the background updater."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._update_loop())
+
+    async def stop(self) -> None:
+        """Stop the background updater, letting an update already in progress finish."""
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _update_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            if self.pending:
+                # Shielded so stopping the loop never discards a paid-for update halfway
+                await asyncio.shield(self.update())
+            # Segments that arrived during the update only wake the loop early if there are enough
+            self._wake.clear()
+            if self.pending >= self.min_new_segments:
+                self._wake.set()
+
+    async def update(self) -> None:
+        """Fold the segments added since the last update into the findings."""
+        async with self._lock:
+            upto = len(self.segments)
+            new_lines = "\n".join(self.segments[self.summarized:upto])
+            if not new_lines:
+                return
+            started = time.perf_counter()
+            try:
+                self.findings = await cerebras_client.update_rolling_findings(self.findings, new_lines)
+                if self.findings.strip():
+                    del self.segments[:upto]
+                    self.summarized = 0
+                else:
+                    # Nothing to reconcile against yet: keep the text for the full-transcript fallback
+                    self.summarized = upto
+                self.updates += 1
+            except Exception as e:
+                # Unsummarized segments stay pending and are retried with the next update or at finalize
+                self.errors += 1
+                logger.warning(f"Rolling notes update failed: {e}")
+            finally:
+                self.last_update_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    async def finalize(self) -> Tuple[str, Dict[str, Any]]:
+        """Stop updating and generate the final notes and prescription from the draft plus the remaining tail."""
+        await self.stop()
+        started = time.perf_counter()
+        async with self._lock:
+            # Without findings nothing has been dropped, so this is the whole transcript
+            tail = "\n".join(self.segments if not self.findings.strip() else self.segments[self.summarized:])
+            try:
+                return await generate_notes_from_draft(self.findings, tail, self._cache_key.hexdigest())
+            finally:
+                self.finalize_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def memory_estimate(self) -> int:
+        """Approximate bytes held by the segments and findings."""
+        return sum(sys.getsizeof(segment) for segment in self.segments) + sys.getsizeof(self.findings)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return draft progress counters."""
+        return {
+            "segments": self.total,
+            "segments_in_memory": len(self.segments),
+            "summarized_segments": self.total - self.pending,
+            "pending_segments": self.pending,
+            "findings_chars": len(self.findings),
+            "updates": self.updates,
+            "errors": self.errors,
+            "last_update_ms": self.last_update_ms,
+            "finalize_ms": self.finalize_ms,
+            "running": self._task is not None,
+        }
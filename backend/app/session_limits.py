@@ -0,0 +1,61 @@
+"""
+Limits for long-lived streaming sessions (STT and Meet transcription).
+
+Managers track each session's last activity, refuse new sessions beyond a
+configured maximum with ``SessionLimitError`` and run an ``IdleReaper`` that
+closes sessions idle for longer than their TTL, so abandoned browser tabs
+cannot pin worker memory.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLimitError(RuntimeError):
+    """Raised when a manager already holds its maximum number of live sessions."""
+
+    def __init__(self, kind: str, limit: int):
+        super().__init__(f"Too many active {kind} sessions (limit {limit}); stop an existing session or retry later")
+        self.kind = kind
+        self.limit = limit
+
+
+class IdleReaper:
+    """Periodically calls ``reap`` (which closes idle sessions and returns how many)."""
+
+    def __init__(self, name: str, reap: Callable[[], Awaitable[int]], interval: float):
+        self.name = name
+        self.reap = reap
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.reaped = 0
+        self.runs = 0
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                reaped = await self.reap()
+            except Exception as e:
+                logger.error(f"Error reaping idle {self.name} sessions: {e}")
+                continue
+            self.runs += 1
+            if reaped:
+                self.reaped += reaped
+                logger.info(f"Closed {reaped} idle {self.name} sessions")
@@ -0,0 +1,355 @@
+"""
+Registry of which worker owns each live STT and Meet session.
+
+Sessions live in the memory of the worker process that created them. When the
+app runs as several workers (or on several nodes), each worker records its
+sessions here so a request that reaches another worker can be forwarded to the
+owner (see ``session_routing``).
+
+Backends (SESSION_REGISTRY_BACKEND):
+- ``memory``: this process only; for a single worker.
+- ``sqlite``: a shared SQLite file; for several workers on one machine and for tests.
+- ``postgres``: the shared ``SessionRegistry`` table; for several nodes.
+
+Every SESSION_REGISTRY_HEARTBEAT seconds each worker re-writes a row for every
+session it holds, which also restores rows lost to a failed registration or a
+purge after missed heartbeats. Rows not refreshed for
+SESSION_REGISTRY_STALE_SECONDS belong to a dead worker and are ignored, then
+purged.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+from .db import Database, database
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = settings.worker_id or f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class SessionOwner:
+    """The worker that holds a session in memory."""
+    worker_id: str
+    worker_url: str
+
+    @property
+    def is_local(self) -> bool:
+        return self.worker_id == WORKER_ID
+
+
+class SessionRegistry:
+    """In-process registry; only knows this worker's sessions."""
+
+    backend = "memory"
+
+    def __init__(self, heartbeat_seconds: Optional[float] = None, stale_seconds: Optional[float] = None):
+        self.worker = SessionOwner(WORKER_ID, settings.worker_url)
+        self.heartbeat_seconds = heartbeat_seconds if heartbeat_seconds is not None else settings.session_registry_heartbeat
+        self.stale_seconds = stale_seconds if stale_seconds is not None else settings.session_registry_stale_seconds
+        self._local: Dict[Tuple[str, str], float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.errors = 0
+        self.lookups = 0
+        self.remote_hits = 0
+        # Updated by SessionRoutingMiddleware
+        self.forwarded = 0
+        self.misdirected = 0
+
+    async def start(self) -> None:
+        """Start refreshing this worker's rows. Called from the FastAPI lifespan hook."""
+        if self._task is None and self.heartbeat_seconds > 0:
+            self._task = asyncio.get_running_loop().create_task(self._heartbeat_loop())
+
+    async def close(self) -> None:
+        """Stop the heartbeat and remove this worker's rows."""
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for kind, session_id in list(self._local):
+            await self.unregister(kind, session_id)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                await self._heartbeat()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error refreshing session registry: {e}")
+
+    async def register(self, kind: str, session_id: str) -> None:
+        """Record that this worker owns a session. Failures are logged, never raised."""
+        self._local[(kind, session_id)] = time.time()
+        try:
+            await self._register(kind, session_id)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error registering {kind} session {session_id}: {e}")
+
+    async def unregister(self, kind: str, session_id: str) -> None:
+        """Forget a session this worker owned."""
+        self._local.pop((kind, session_id), None)
+        try:
+            await self._unregister(kind, session_id)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error unregistering {kind} session {session_id}: {e}")
+
+    async def lookup(self, kind: str, session_id: str) -> Optional[SessionOwner]:
+        """The worker owning a session, or None if no live worker does."""
+        self.lookups += 1
+        if (kind, session_id) in self._local:
+            return self.worker
+        try:
+            owner = await self._lookup(kind, session_id)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error looking up {kind} session {session_id}: {e}")
+            return None
+        if owner is not None and not owner.is_local:
+            self.remote_hits += 1
+        return owner
+
+    # Backend hooks; the in-process registry has nothing beyond ``_local``
+
+    async def _register(self, kind: str, session_id: str) -> None:
+        pass
+
+    async def _unregister(self, kind: str, session_id: str) -> None:
+        pass
+
+    async def _lookup(self, kind: str, session_id: str) -> Optional[SessionOwner]:
+        return None
+
+    async def _heartbeat(self) -> None:
+        pass
+
+    async def _count(self) -> Optional[int]:
+        return len(self._local)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Return this worker's identity, session counts and counters."""
+        try:
+            total = await self._count()
+        except Exception:
+            total = None
+        return {
+            "backend": self.backend,
+            "worker_id": self.worker.worker_id,
+            "worker_url": self.worker.worker_url,
+            "local_sessions": len(self._local),
+            "registered_sessions": total,
+            "lookups": self.lookups,
+            "remote_hits": self.remote_hits,
+            "forwarded": self.forwarded,
+            "misdirected": self.misdirected,
+            "errors": self.errors,
+        }
+
+
+class SQLiteSessionRegistry(SessionRegistry):
+    """Registry in a SQLite file shared by the workers of one machine."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            # WAL lets readers in other workers proceed while one worker writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_registry (
+                    kind TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    worker_id TEXT NOT NULL,
+                    worker_url TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (kind, session_id)
+                )
+            """)
+            self._conn.commit()
+
+    UPSERT_QUERY = (
+        "INSERT OR REPLACE INTO session_registry (kind, session_id, worker_id, worker_url, updated_at) "
+        "VALUES (?, ?, ?, ?, ?)"
+    )
+
+    def _execute(self, query: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            self._conn.commit()
+            return rows
+
+    def _upsert(self, keys: List[Tuple[str, str]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(self.UPSERT_QUERY, [
+                (kind, session_id, self.worker.worker_id, self.worker.worker_url, now)
+                for kind, session_id in keys
+            ])
+            self._conn.commit()
+
+    async def _register(self, kind: str, session_id: str) -> None:
+        await asyncio.to_thread(self._upsert, [(kind, session_id)])
+
+    async def _unregister(self, kind: str, session_id: str) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "DELETE FROM session_registry WHERE kind = ? AND session_id = ? AND worker_id = ?",
+            (kind, session_id, self.worker.worker_id),
+        )
+
+    async def _lookup(self, kind: str, session_id: str) -> Optional[SessionOwner]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT worker_id, worker_url FROM session_registry "
+            "WHERE kind = ? AND session_id = ? AND updated_at > ?",
+            (kind, session_id, time.time() - self.stale_seconds),
+        )
+        return SessionOwner(rows[0][0], rows[0][1]) if rows else None
+
+    async def _heartbeat(self) -> None:
+        await asyncio.to_thread(self._upsert, list(self._local))
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM session_registry WHERE updated_at < ?",
+            (time.time() - self.stale_seconds * 2,),
+        )
+
+    async def _count(self) -> Optional[int]:
+        rows = await asyncio.to_thread(self._execute, "SELECT count(*) FROM session_registry")
+        return rows[0][0]
+
+    async def close(self) -> None:
+        await super().close()
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresSessionRegistry(SessionRegistry):
+    """Registry in the shared Postgres database, visible to every node."""
+
+    backend = "postgres"
+
+    # Mirrors the SessionRegistry Prisma model, for databases the schema has not been pushed to
+    CREATE_QUERY = """
+        CREATE TABLE IF NOT EXISTS "SessionRegistry" (
+            kind TEXT NOT NULL,
+            "sessionId" TEXT NOT NULL,
+            "workerId" TEXT NOT NULL,
+            "workerUrl" TEXT NOT NULL DEFAULT '',
+            "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            "updatedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, "sessionId")
+        )
+    """
+
+    def __init__(self, db: Database = database, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.db = db
+        self._table_ready = False
+
+    async def _ensure_table(self, conn) -> None:
+        if not self._table_ready:
+            await conn.execute(self.CREATE_QUERY)
+            self._table_ready = True
+
+    # One statement for any number of sessions; re-creates rows that were purged or never written
+    UPSERT_QUERY = """
+        INSERT INTO "SessionRegistry" (kind, "sessionId", "workerId", "workerUrl", "updatedAt")
+        SELECT t.kind, t.session_id, $3, $4, CURRENT_TIMESTAMP
+        FROM unnest($1::text[], $2::text[]) AS t(kind, session_id)
+        ON CONFLICT (kind, "sessionId") DO UPDATE
+        SET "workerId" = EXCLUDED."workerId", "workerUrl" = EXCLUDED."workerUrl", "updatedAt" = CURRENT_TIMESTAMP
+    """
+
+    async def _upsert(self, conn, keys: List[Tuple[str, str]]) -> None:
+        await conn.execute(
+            self.UPSERT_QUERY,
+            [kind for kind, _ in keys], [session_id for _, session_id in keys],
+            self.worker.worker_id, self.worker.worker_url,
+        )
+
+    async def _register(self, kind: str, session_id: str) -> None:
+        if not self.db.is_available:
+            return
+        async with self.db.acquire() as conn:
+            await self._ensure_table(conn)
+            await self._upsert(conn, [(kind, session_id)])
+
+    async def _unregister(self, kind: str, session_id: str) -> None:
+        if not self.db.is_available:
+            return
+        async with self.db.acquire() as conn:
+            await self._ensure_table(conn)
+            await conn.execute(
+                'DELETE FROM "SessionRegistry" WHERE kind = $1 AND "sessionId" = $2 AND "workerId" = $3',
+                kind, session_id, self.worker.worker_id,
+            )
+
+    async def _lookup(self, kind: str, session_id: str) -> Optional[SessionOwner]:
+        if not self.db.is_available:
+            return None
+        async with self.db.acquire() as conn:
+            await self._ensure_table(conn)
+            row = await conn.fetchrow("""
+                SELECT "workerId", "workerUrl" FROM "SessionRegistry"
+                WHERE kind = $1 AND "sessionId" = $2
+                  AND "updatedAt" > CURRENT_TIMESTAMP - make_interval(secs => $3)
+            """, kind, session_id, float(self.stale_seconds))
+        return SessionOwner(row["workerId"], row["workerUrl"]) if row else None
+
+    async def _heartbeat(self) -> None:
+        if not self.db.is_available:
+            return
+        async with self.db.acquire() as conn:
+            await self._ensure_table(conn)
+            keys = list(self._local)
+            if keys:
+                await self._upsert(conn, keys)
+            await conn.execute(
+                'DELETE FROM "SessionRegistry" WHERE "updatedAt" < CURRENT_TIMESTAMP - make_interval(secs => $1)',
+                float(self.stale_seconds * 2),
+            )
+
+    async def _count(self) -> Optional[int]:
+        if not self.db.is_available:
+            return None
+        async with self.db.acquire() as conn:
+            await self._ensure_table(conn)
+            return await conn.fetchval('SELECT count(*) FROM "SessionRegistry"')
+
+
+def create_session_registry() -> SessionRegistry:
+    """Build the registry selected by SESSION_REGISTRY_BACKEND."""
+    backend = settings.session_registry_backend
+    if backend == "postgres":
+        return PostgresSessionRegistry()
+    if backend == "sqlite":
+        path = settings.session_registry_path or os.path.join("data", "session_registry.sqlite3")
+        try:
+            return SQLiteSessionRegistry(path)
+        except Exception as e:
+            logger.error(f"Error opening session registry at {path}, using the in-process registry: {e}")
+    return SessionRegistry()
+
+
+# Global instance
+session_registry = create_session_registry()
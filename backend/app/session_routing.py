@@ -0,0 +1,195 @@
+"""
+Route session requests to the worker that owns the session.
+
+``SessionRoutingMiddleware`` recognises the STT and Meet endpoints that act on
+an existing session. When that session is not held by this worker, it looks up
+the owner in the session registry and:
+- forwards the request to the owner's WORKER_URL (HTTP responses, SSE streams
+  and the audio WebSocket are relayed), or
+- when the owner has no URL, answers 421 with an ``X-Session-Worker`` header
+  (WebSockets close with code 4421) so a sticky proxy or the client can retry
+  against the right worker.
+
+Requests that were already forwarded once are never forwarded again.
+"""
+
+import json
+import logging
+import re
+from typing import Callable, List, Optional, Tuple
+
+import websockets
+import websockets.exceptions
+
+from .http_client import http_client
+from .session_registry import SessionOwner, SessionRegistry
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_HEADER = "x-session-forwarded-by"
+OWNER_HEADER = "x-session-worker"
+# Close code for a WebSocket that reached the wrong worker (4000-4999 is application-defined)
+WS_MISDIRECTED = 4421
+
+# (kind, path pattern); a pattern without a session_id group takes the id from the JSON body
+SESSION_ROUTES: List[Tuple[str, re.Pattern]] = [
+    ("stt", re.compile(r"^/stt/session/(?:stop|heartbeat|stop_and_process(?:/stream)?)$")),
+    ("meet", re.compile(r"^/meet/transcription/(?:stop|stop_and_process)$")),
+    ("meet", re.compile(r"^/meet/transcription/(?:draft|status|data|stream)/(?P<session_id>[^/]+)$")),
+    ("meet", re.compile(r"^/meet/audio/(?P<session_id>[^/]+)(?:/ws)?$")),
+    ("meet", re.compile(r"^/meet/transcription/(?P<session_id>(?!start$)[^/]+)$")),
+]
+
+# Request headers passed on to the owning worker
+FORWARD_HEADERS = ("content-type", "accept", "authorization", "user-agent", "last-event-id", "origin")
+
+
+def match_session_route(path: str) -> Optional[Tuple[str, Optional[str]]]:
+    """Return (kind, session_id) for a session endpoint; session_id is None when it is in the body."""
+    for kind, pattern in SESSION_ROUTES:
+        match = pattern.match(path)
+        if match:
+            return kind, match.groupdict().get("session_id")
+    return None
+
+
+class SessionRoutingMiddleware:
+    """ASGI middleware sending session requests to the owning worker."""
+
+    def __init__(self, app, registry: SessionRegistry, is_local: Callable[[str, str], bool]):
+        self.app = app
+        self.registry = registry
+        self.is_local = is_local
+
+    async def __call__(self, scope, receive, send):
+        # CORS preflights carry no session state; any worker can answer them
+        if scope["type"] not in ("http", "websocket") or scope.get("method") == "OPTIONS":
+            return await self.app(scope, receive, send)
+        route = match_session_route(scope["path"])
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        if route is None or FORWARDED_HEADER in headers:
+            return await self.app(scope, receive, send)
+
+        kind, session_id = route
+        body = b""
+        if scope["type"] == "http":
+            # Buffer the body once: it may hold the session id and is replayed to whichever side handles it
+            more = True
+            while more:
+                message = await receive()
+                body += message.get("body", b"")
+                more = message.get("more_body", False)
+            if session_id is None:
+                try:
+                    session_id = str(json.loads(body or b"{}").get("session_id") or "")
+                except (ValueError, AttributeError):
+                    session_id = ""
+
+        owner = None
+        if session_id and not self.is_local(kind, session_id):
+            owner = await self.registry.lookup(kind, session_id)
+        if owner is None or owner.is_local:
+            return await self.app(scope, self._replay(body, receive) if scope["type"] == "http" else receive, send)
+
+        if scope["type"] == "websocket":
+            return await self._relay_websocket(scope, receive, send, owner)
+        if not owner.worker_url:
+            return await self._misdirected(send, owner)
+        await self._forward_http(scope, headers, body, send, owner)
+
+    @staticmethod
+    def _replay(body: bytes, receive):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        return replay
+
+    def _target(self, scope, owner: SessionOwner, websocket: bool = False) -> str:
+        base = owner.worker_url.rstrip("/")
+        if websocket:
+            base = re.sub(r"^http", "ws", base)
+        query = scope.get("query_string", b"").decode("latin-1")
+        return f"{base}{scope['path']}" + (f"?{query}" if query else "")
+
+    async def _misdirected(self, send, owner: SessionOwner) -> None:
+        self.registry.misdirected += 1
+        payload = json.dumps({
+            "detail": "Session is owned by another worker",
+            "worker_id": owner.worker_id,
+        }).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 421,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (OWNER_HEADER.encode("latin-1"), owner.worker_id.encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _forward_http(self, scope, headers: dict, body: bytes, send, owner: SessionOwner) -> None:
+        self.registry.forwarded += 1
+        forward_headers = {name: headers[name] for name in FORWARD_HEADERS if name in headers}
+        forward_headers[FORWARDED_HEADER] = self.registry.worker.worker_id
+        request = http_client.client.build_request(
+            scope["method"], self._target(scope, owner), content=body, headers=forward_headers,
+            # Long polls and SSE streams outlive the default read timeout
+            timeout=None,
+        )
+        try:
+            response = await http_client.client.send(request, stream=True)
+        except Exception as e:
+            logger.error(f"Error forwarding session request to {owner.worker_id}: {e}")
+            return await self._misdirected(send, owner)
+        try:
+            response_headers = [
+                (name.encode("latin-1"), value.encode("latin-1"))
+                for name, value in response.headers.items()
+                if name.lower() not in ("content-length", "transfer-encoding", "connection", "content-encoding")
+            ]
+            response_headers.append((OWNER_HEADER.encode("latin-1"), owner.worker_id.encode("latin-1")))
+            await send({"type": "http.response.start", "status": response.status_code, "headers": response_headers})
+            # Relay chunk by chunk so SSE events reach the client as the owner emits them
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    async def _relay_websocket(self, scope, receive, send, owner: SessionOwner) -> None:
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        await send({"type": "websocket.accept"})
+        if not owner.worker_url:
+            self.registry.misdirected += 1
+            await send({"type": "websocket.close", "code": WS_MISDIRECTED, "reason": owner.worker_id})
+            return
+        self.registry.forwarded += 1
+        try:
+            # Audio only flows client -> owner, so relaying incoming frames is enough
+            async with websockets.connect(
+                self._target(scope, owner, websocket=True),
+                additional_headers={FORWARDED_HEADER: self.registry.worker.worker_id},
+            ) as upstream:
+                while True:
+                    message = await receive()
+                    if message["type"] == "websocket.disconnect":
+                        break
+                    data = message.get("bytes")
+                    if data is None:
+                        data = message.get("text")
+                    if data is not None:
+                        await upstream.send(data)
+        except websockets.exceptions.ConnectionClosed as e:
+            # 1005/1006 only describe a missing close frame and cannot be sent on
+            code = e.rcvd.code if e.rcvd and e.rcvd.code not in (1005, 1006) else 1011
+            await send({"type": "websocket.close", "code": code})
+        except Exception as e:
+            logger.error(f"Error relaying audio WebSocket to {owner.worker_id}: {e}")
+            await send({"type": "websocket.close", "code": WS_MISDIRECTED, "reason": owner.worker_id})
@@ -0,0 +1,60 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+Concurrent callers with the same key await one shared task instead of repeating
+the work. Each caller awaits the task through ``asyncio.shield``, so a client
+disconnecting cancels only its own wait, never the shared work.
+"""
+
+import asyncio
+import hashlib
+import re
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+def fingerprint(*parts: str) -> str:
+    """Stable key for a request from its whitespace-normalized parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(re.sub(r"\s+", " ", part).strip().encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Run at most one task per key; duplicates join the running task."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.joined = 0
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the outcome so a failure nobody awaited is not logged as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """Await the in-flight task for ``key``, starting it with ``factory`` if there is none."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.leaders += 1
+        else:
+            self.joined += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return in-flight and coalescing counters."""
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "joined": self.joined,
+        }
@@ -0,0 +1,22 @@
+"""
+Server-Sent Events helpers for streaming endpoints.
+"""
+
+import json
+from typing import Any, Optional
+
+# Headers that stop proxies (e.g. nginx) from buffering the event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data: Any, event_id: Optional[Any] = None) -> str:
+    """Format one SSE event with a JSON payload, optionally with an id a reconnecting client resumes from."""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Comment line that keeps idle connections from being closed by proxies
+SSE_KEEPALIVE = ": keepalive\n\n"
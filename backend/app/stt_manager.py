@@ -1,6 +1,10 @@
 import asyncio
+import logging
+import threading
+import time
 import uuid
-from typing import Dict, Optional
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
 
 from livekit.agents import AgentSession
 from livekit.plugins import cartesia
@@ -11,24 +15,69 @@ except Exception:  # pragma: no cover
     silero = None  # fallback if plugin not installed
 
 from .config import settings
+from .session_limits import IdleReaper, SessionLimitError
+from .session_registry import session_registry
+
+logger = logging.getLogger(__name__)
+
+# Rough resident sizes: the Silero VAD ONNX session (~13 MB measured, loaded once per process)
+# and the per-session AgentSession/STT state on top of it
+VAD_MEMORY_ESTIMATE = 13 * 1024 * 1024
+STT_SESSION_MEMORY_ESTIMATE = 3 * 1024 * 1024
+
+_shared_vad = None
+# Warm-up and session starts load from worker threads; only one of them may load the model
+_shared_vad_lock = threading.Lock()
+
+
+def get_shared_vad():
+    """The process-wide Silero VAD, loaded on first use.
+
+    Every ``VAD.stream()`` keeps its own model state over the shared ONNX session,
+    so one instance serves all sessions.
+    """
+    global _shared_vad
+    if _shared_vad is None and silero is not None:
+        with _shared_vad_lock:
+            if _shared_vad is None:
+                _shared_vad = silero.VAD.load()
+    return _shared_vad
+
+
+def create_stt(http_session=None) -> cartesia.STT:
+    """Cartesia STT configured from settings; pass an aiohttp session when used outside an agent job."""
+    return cartesia.STT(
+        api_key=settings.cartesia_api_key,
+        model=settings.stt_model,
+        language=settings.stt_language,
+        http_session=http_session,
+    )
 
 
 class STTSessionWrapper:
     def __init__(self) -> None:
         self.session: Optional[AgentSession] = None
         self._task: Optional[asyncio.Task] = None
+        self.created_at = time.time()
+        self.last_activity = time.monotonic()
+
+    def touch(self) -> None:
+        self.last_activity = time.monotonic()
+
+    @property
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_activity
 
     async def start(self) -> None:
         if self.session is not None:
             return
-        vad_component = silero.VAD.load() if silero else None
+        # Off the event loop: the first load (or one still running in warm_up) takes a while
+        vad = await asyncio.to_thread(get_shared_vad)
+        if self.session is not None:
+            return
         self.session = AgentSession(
-            stt=cartesia.STT(
-                api_key=settings.cartesia_api_key,
-                model=settings.stt_model,
-                language=settings.stt_language,
-            ),
-            vad=vad_component,
+            stt=create_stt(),
+            vad=vad,
         )
         async def _runner() -> None:
             await self.session.start()
@@ -47,24 +96,151 @@ class STTSessionWrapper:
                 self._task.cancel()
                 self._task = None
 
+    def info(self) -> Dict[str, Any]:
+        return {
+            "age_seconds": round(time.time() - self.created_at, 1),
+            "idle_seconds": round(self.idle_seconds, 1),
+            "memory_estimate_bytes": STT_SESSION_MEMORY_ESTIMATE,
+        }
+
 
 class STTManager:
-    def __init__(self) -> None:
+    def __init__(self, max_sessions: Optional[int] = None, idle_ttl: Optional[float] = None,
+                 pool_size: Optional[int] = None) -> None:
         self._sessions: Dict[str, STTSessionWrapper] = {}
+        self.max_sessions = max_sessions if max_sessions is not None else settings.stt_max_sessions
+        self.idle_ttl = idle_ttl if idle_ttl is not None else settings.stt_session_idle_ttl
+        self.reaper = IdleReaper("STT", self.reap_idle, settings.session_reap_interval)
+        self.rejected = 0
+        # Pre-started sessions handed out by start_session and refilled in the background
+        self.pool_size = pool_size if pool_size is not None else settings.stt_pool_size
+        self._pool: Deque[STTSessionWrapper] = deque()
+        self._refill = asyncio.Event()
+        self._refill_task: Optional[asyncio.Task] = None
+        self.pool_hits = 0
+        self.pool_misses = 0
+        self._start_ms: Deque[float] = deque(maxlen=200)
+
+    async def warm_up(self) -> None:
+        """Load the shared VAD off the event loop and start filling the session pool."""
+        if silero is not None:
+            await asyncio.to_thread(get_shared_vad)
+        if self.pool_size > 0 and self._refill_task is None:
+            self._refill_task = asyncio.get_running_loop().create_task(self._refill_loop())
+            self._refill.set()
+
+    async def _refill_loop(self) -> None:
+        while True:
+            await self._refill.wait()
+            self._refill.clear()
+            # Pooled sessions use memory too, so they count against the session limit
+            while len(self._pool) < self.pool_size and len(self._pool) + len(self._sessions) < self.max_sessions:
+                wrapper = STTSessionWrapper()
+                try:
+                    await wrapper.start()
+                except Exception as e:
+                    logger.error(f"Failed to pre-start STT session: {e}")
+                    break
+                self._pool.append(wrapper)
 
     async def start_session(self) -> str:
+        if len(self._sessions) >= self.max_sessions:
+            self.rejected += 1
+            raise SessionLimitError("STT", self.max_sessions)
+        started = time.perf_counter()
         session_id = str(uuid.uuid4())
-        wrapper = STTSessionWrapper()
-        self._sessions[session_id] = wrapper
-        await wrapper.start()
+        if self._pool:
+            wrapper = self._pool.popleft()
+            wrapper.created_at = time.time()
+            wrapper.touch()
+            self._sessions[session_id] = wrapper
+            self.pool_hits += 1
+        else:
+            wrapper = STTSessionWrapper()
+            # Registered before the first await so concurrent starts count against the limit
+            self._sessions[session_id] = wrapper
+            try:
+                await wrapper.start()
+            except Exception:
+                self._sessions.pop(session_id, None)
+                raise
+            if self._refill_task is not None:
+                self.pool_misses += 1
+        self._refill.set()
+        self._start_ms.append((time.perf_counter() - started) * 1000)
+        await session_registry.register("stt", session_id)
         return session_id
 
     async def stop_session(self, session_id: str) -> bool:
         wrapper = self._sessions.pop(session_id, None)
         if not wrapper:
             return False
+        await session_registry.unregister("stt", session_id)
         await wrapper.stop()
         return True
 
+    def has_session(self, session_id: str) -> bool:
+        """Whether this worker holds the session."""
+        return session_id in self._sessions
+
+    def touch(self, session_id: str) -> bool:
+        """Record client activity for a session. Returns False if it does not exist."""
+        wrapper = self._sessions.get(session_id)
+        if not wrapper:
+            return False
+        wrapper.touch()
+        return True
+
+    async def reap_idle(self) -> int:
+        """Stop sessions idle longer than the TTL."""
+        idle = [
+            session_id for session_id, wrapper in self._sessions.items()
+            if wrapper.idle_seconds > self.idle_ttl
+        ]
+        for session_id in idle:
+            await self.stop_session(session_id)
+        return len(idle)
+
+    async def stop_all(self) -> None:
+        if self._refill_task is not None:
+            task, self._refill_task = self._refill_task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        while self._pool:
+            await self._pool.popleft().stop()
+        for session_id in list(self._sessions.keys()):
+            await self.stop_session(session_id)
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        return [{"session_id": session_id, **wrapper.info()} for session_id, wrapper in self._sessions.items()]
+
+    def stats(self) -> Dict[str, Any]:
+        sessions = self.list_sessions()
+        start_ms = sorted(self._start_ms)
+        shared_vad_bytes = VAD_MEMORY_ESTIMATE if _shared_vad is not None else 0
+        return {
+            "active": len(sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "rejected": self.rejected,
+            "reaped": self.reaper.reaped,
+            "pool_size": self.pool_size,
+            "pooled": len(self._pool),
+            "pool_hits": self.pool_hits,
+            "pool_misses": self.pool_misses,
+            "start_ms_avg": round(sum(start_ms) / len(start_ms), 2) if start_ms else 0.0,
+            "start_ms_p95": round(start_ms[min(len(start_ms) - 1, int(len(start_ms) * 0.95))], 2) if start_ms else 0.0,
+            "shared_vad_loaded": _shared_vad is not None,
+            "memory_estimate_bytes": (
+                sum(session["memory_estimate_bytes"] for session in sessions)
+                + len(self._pool) * STT_SESSION_MEMORY_ESTIMATE
+                + shared_vad_bytes
+            ),
+            "sessions": sessions,
+        }
+
 
 stt_manager = STTManager()
@@ -0,0 +1,86 @@
+"""
+Split long consultation transcripts into overlapping chunks on speaker/time boundaries.
+"""
+
+import re
+from typing import List
+
+# A new turn starts with a speaker label ("Doctor:", "Patient 2:") or a timestamp ("[00:12:34]", "12:05 -")
+_TURN_START = re.compile(r"^\s*(\[?\d{1,2}:\d{2}(:\d{2})?\]?|[A-Z][\w .'-]{0,30}:)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _split_turns(transcript: str) -> List[str]:
+    """Group transcript lines into turns, starting a new turn at each speaker label or timestamp."""
+    turns: List[str] = []
+    current: List[str] = []
+    for line in transcript.splitlines():
+        if not line.strip():
+            continue
+        if current and _TURN_START.match(line):
+            turns.append("\n".join(current))
+            current = []
+        current.append(line.rstrip())
+    if current:
+        turns.append("\n".join(current))
+    return turns
+
+
+def _split_oversized(turn: str, max_chars: int) -> List[str]:
+    """Break a turn longer than max_chars at sentence ends, hard-splitting as a last resort."""
+    pieces: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_END.split(turn):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_transcript(transcript: str, max_chars: int, overlap_chars: int = 0) -> List[str]:
+    """
+    Split a transcript into chunks of at most ``max_chars`` characters.
+
+    Chunks end on turn boundaries where possible, and each chunk after the first
+    repeats trailing turns of the previous chunk (up to ``overlap_chars``) so that
+    findings spanning a boundary are not lost.
+    """
+    if max_chars <= 0:
+        raise ValueError("max_chars must be positive")
+    overlap_chars = max(0, min(overlap_chars, max_chars // 2))
+
+    turns: List[str] = []
+    for turn in _split_turns(transcript):
+        turns.extend(_split_oversized(turn, max_chars) if len(turn) > max_chars else [turn])
+
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for turn in turns:
+        if current and size + len(turn) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            # Carry trailing turns into the next chunk as overlap
+            overlap: List[str] = []
+            overlap_size = 0
+            for previous in reversed(current):
+                if overlap_size + len(previous) + 1 > overlap_chars or overlap_size + len(previous) + len(turn) + 2 > max_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += len(previous) + 1
+            current = overlap
+            size = overlap_size
+        current.append(turn)
+        size += len(turn) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
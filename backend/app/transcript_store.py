@@ -0,0 +1,254 @@
+"""
+Bounded transcript storage for live Meet sessions.
+
+Only the most recent ``memory_segments`` segments are kept in memory. When the
+session belongs to an appointment, every segment is also written behind to
+``AppointmentTranscription`` in batches, one multi-row INSERT per flush, so
+older segments live in the database rather than in the worker. A segment that
+has left the in-memory window stays buffered until it has been written.
+
+Segments carry a per-session sequence number starting at 1, so readers can ask
+for only what is newer than the last ``seq`` they saw and wait for it to arrive.
+"""
+
+import asyncio
+import logging
+import sys
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Any, Deque, Dict, List, Optional
+
+from .config import settings
+from .db import Database, database
+
+logger = logging.getLogger(__name__)
+
+# Dict, timestamp and id overhead per stored segment, beyond its text
+SEGMENT_OVERHEAD_BYTES = 300
+
+
+class TranscriptStore:
+    """Recent transcript segments of one session, spilling to the database in batches."""
+
+    # unnest() turns the column arrays into rows, so a whole batch is one statement;
+    # the EXISTS guard skips rows for unknown appointments instead of failing the batch
+    INSERT_QUERY = """
+        INSERT INTO "AppointmentTranscription" (id, "appointmentId", text, "createdAt")
+        SELECT t.id, $1, t.text, t.created_at
+        FROM unnest($2::text[], $3::text[], $4::timestamp[]) AS t(id, text, created_at)
+        WHERE EXISTS (SELECT 1 FROM "Appointment" WHERE id = $1)
+        ON CONFLICT (id) DO NOTHING
+    """
+
+    def __init__(self, appointment_id: Optional[str] = None, db: Database = database,
+                 memory_segments: Optional[int] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_pending: Optional[int] = None):
+        self.appointment_id = appointment_id
+        self.db = db
+        self.started_at = datetime.now()
+        self.memory_segments = memory_segments if memory_segments is not None else settings.meet_transcript_memory_segments
+        self.batch_size = batch_size if batch_size is not None else settings.meet_transcript_batch_size
+        self.flush_interval = flush_interval if flush_interval is not None else settings.meet_transcript_flush_interval
+        self.max_pending = max_pending if max_pending is not None else settings.meet_transcript_max_pending
+        self.segments: Deque[Dict[str, Any]] = deque(maxlen=self.memory_segments)
+        # Segments not yet written, and the batch currently being written
+        self._pending: List[Dict[str, Any]] = []
+        self._in_flight: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # After a failed flush, full batches wait for the periodic flusher instead of retrying per segment
+        self._retry_at = 0.0
+        # Replaced on every change; waiters hold the instance that was current when they started
+        self._changed = asyncio.Event()
+        self.closed = False
+        self.total = 0
+        self.persisted = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.dropped = 0
+
+    @property
+    def persistent(self) -> bool:
+        return bool(self.appointment_id) and self.db.is_configured
+
+    def start(self) -> None:
+        """Start the periodic flusher (only needed when segments are persisted)."""
+        if self.persistent and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Stop the flusher, write everything still buffered and release waiting readers."""
+        self.closed = True
+        self.notify()
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        if self._pending:
+            logger.error(f"Lost {len(self._pending)} transcript segments for appointment {self.appointment_id}: database unavailable")
+            self.dropped += len(self._pending)
+            self._pending = []
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _schedule_flush(self) -> None:
+        if time.monotonic() < self._retry_at:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    def notify(self) -> None:
+        """Wake readers waiting for changes."""
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def append(self, text: str) -> Dict[str, Any]:
+        """Store a segment and return it."""
+        self.total += 1
+        segment = {"seq": self.total, "text": text, "timestamp": time.time()}
+        self.segments.append(segment)
+        self.notify()
+        if self.persistent:
+            if len(self._pending) >= self.max_pending:
+                # Database down for a long time: bound memory by giving up the oldest segment
+                self._pending.pop(0)
+                self.dropped += 1
+            self._pending.append({"id": str(uuid.uuid4()), "text": text, "created_at": datetime.now()})
+            if len(self._pending) >= self.batch_size and self._task is not None:
+                self._schedule_flush()
+        return segment
+
+    async def flush(self) -> int:
+        """Write buffered segments in one INSERT. Returns the number of rows written."""
+        async with self._flush_lock:
+            if not self._pending or not self.db.is_available:
+                return 0
+            batch, self._pending = self._pending, []
+            self._in_flight = batch
+            try:
+                async with self.db.acquire() as conn:
+                    status = await conn.execute(
+                        self.INSERT_QUERY,
+                        self.appointment_id,
+                        [row["id"] for row in batch],
+                        [row["text"] for row in batch],
+                        [row["created_at"] for row in batch],
+                    )
+                    written = int(status.split()[-1]) if status else len(batch)
+                    # Nothing written is either a retried batch or an unknown appointment
+                    missing = written == 0 and not await conn.fetchval(
+                        'SELECT 1 FROM "Appointment" WHERE id = $1', self.appointment_id
+                    )
+                self.flushes += 1
+                if missing:
+                    # Nothing this session records can be stored; stop buffering it
+                    logger.warning(f"Appointment {self.appointment_id} not found; Meet transcript will not be persisted")
+                    self.appointment_id = None
+                    self.dropped += len(batch)
+                    return 0
+                self.persisted += written
+                return written
+            except asyncio.CancelledError:
+                # Cancelled mid-write (e.g. by close()): keep the batch for the final flush;
+                # ON CONFLICT makes rewriting rows that did commit harmless
+                self._pending = batch + self._pending
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing Meet transcript: {e}")
+                self.flush_errors += 1
+                self._retry_at = time.monotonic() + self.flush_interval
+                self._pending = batch + self._pending
+                overflow = len(self._pending) - self.max_pending
+                if overflow > 0:
+                    self._pending = self._pending[overflow:]
+                    self.dropped += overflow
+                return 0
+            finally:
+                self._in_flight = []
+
+    @property
+    def last_seq(self) -> int:
+        return self.total
+
+    def recent(self, since: int = 0) -> List[Dict[str, Any]]:
+        """In-memory segments with ``seq`` greater than ``since``, oldest first."""
+        if since >= self.total:
+            return []
+        # Sequence numbers are contiguous: the newest (total - since) segments are the answer,
+        # read from the right end so the cost is proportional to what is returned
+        count = min(len(self.segments), self.total - since)
+        return list(islice(reversed(self.segments), count))[::-1]
+
+    def missed(self, since: int) -> int:
+        """How many segments after ``since`` already left the in-memory window."""
+        first_seq = self.total - len(self.segments) + 1
+        return max(0, first_seq - 1 - since)
+
+    async def wait(self, since: int, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for a segment newer than ``since`` or any other change.
+
+        Returns False on timeout.
+        """
+        if since < self.total or self.closed:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def text(self) -> str:
+        """The session transcript: the written rows when segments are persisted, else the in-memory window."""
+        if self.persistent and self.db.is_available:
+            await self.flush()
+            try:
+                async with self.db.acquire() as conn:
+                    rows = await conn.fetch("""
+                        SELECT text FROM "AppointmentTranscription"
+                        WHERE "appointmentId" = $1 AND "createdAt" >= $2
+                        ORDER BY "createdAt"
+                    """, self.appointment_id, self.started_at)
+                if rows:
+                    # Segments still buffered after a failed flush come last
+                    return "\n".join([row["text"] for row in rows] + [row["text"] for row in self._pending])
+            except Exception as e:
+                logger.error(f"Error reading Meet transcript for appointment {self.appointment_id}: {e}")
+        return "\n".join(segment["text"] for segment in self.segments)
+
+    def memory_estimate(self) -> int:
+        """Approximate bytes held by in-memory and buffered segments."""
+        rows = list(self.segments) + self._pending + self._in_flight
+        return sum(sys.getsizeof(row["text"]) + SEGMENT_OVERHEAD_BYTES for row in rows)
+
+    def clear(self) -> None:
+        """Forget the in-memory segments; buffered writes still go to the database."""
+        self.segments.clear()
+        self.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return memory window and write-behind counters."""
+        return {
+            "total_segments": self.total,
+            "last_seq": self.total,
+            "segments_in_memory": len(self.segments),
+            "memory_segments": self.memory_segments,
+            "persistent": self.persistent,
+            "pending": len(self._pending) + len(self._in_flight),
+            "persisted": self.persisted,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "dropped": self.dropped,
+        }
@@ -1,5 +1,6 @@
 import { NextRequest, NextResponse } from "next/server";
 import { prisma } from "@/lib/prisma";
+import { invalidatePatientContext } from "@/lib/contextCache";
 
 export async function GET(req: NextRequest) {
   const id = req.nextUrl.searchParams.get("id");
@@ -109,6 +110,9 @@ export async function PUT(req: NextRequest) {
     data.scheduledAt = body.scheduledAt ? new Date(body.scheduledAt) : undefined;
   }
   const updated = await prisma.appointment.update({ where: { id: body.id }, data });
+  if ("notes" in data || "aiNotes" in data || "prescription" in data || "recommendedTests" in data) {
+    await invalidatePatientContext({ patientId: updated.patientId });
+  }
   return NextResponse.json(updated);
 }
 
@@ -1,5 +1,6 @@
 import { NextRequest, NextResponse } from "next/server";
 import { prisma } from "@/lib/prisma";
+import { invalidatePatientContext } from "@/lib/contextCache";
 
 // Append a transcription line to a specific appointment
 export async function POST(req: NextRequest) {
@@ -15,6 +16,7 @@ export async function POST(req: NextRequest) {
   await prisma.appointmentTranscription.create({
     data: { appointmentId, text },
   });
+  await invalidatePatientContext({ patientId: appointment.patientId });
   return NextResponse.json({ ok: true });
 }
 
@@ -2,7 +2,7 @@
 
 import React, { useMemo, useState, useEffect, useRef } from "react";
 
-export default function SpeechToText({ onStart, onFinal, onPartial, onStop, onMeetTranscription }:{ onStart?: () => void; onFinal: (text: string) => void; onPartial?: (text: string) => void; onStop?: () => void; onMeetTranscription?: (text: string) => void }) {
+export default function SpeechToText({ appointmentId, onStart, onFinal, onPartial, onStop, onMeetTranscription }:{ appointmentId?: string | null; onStart?: () => void; onFinal: (text: string) => void; onPartial?: (text: string) => void; onStop?: () => void; onMeetTranscription?: (text: string) => void }) {
   const [listening, setListening] = useState(false);
   const [recognizer, setRecognizer] = useState<SpeechRecognition | null>(null as any);
   const [error, setError] = useState<string | null>(null);
@@ -10,8 +10,8 @@ export default function SpeechToText({ onStart, onFinal, onPartial, onStop, onMe
   const [showVideoSection, setShowVideoSection] = useState(false);
   const [meetTranscriptionActive, setMeetTranscriptionActive] = useState(false);
   const [meetSessionId, setMeetSessionId] = useState<string | null>(null);
-  const [meetTranscriptions, setMeetTranscriptions] = useState<{ text: string; timestamp: number }[]>([]);
-  const lastTranscriptionCountRef = useRef(0);
+  const [meetTranscriptions, setMeetTranscriptions] = useState<{ seq: number; text: string; timestamp: number }[]>([]);
+  const lastSeqRef = useRef(0);
   const [audioCapturing, setAudioCapturing] = useState(false);
   const mediaRecorderRef = useRef<MediaRecorder | null>(null);
   const audioStreamRef = useRef<MediaStream | null>(null);
@@ -24,67 +24,89 @@ export default function SpeechToText({ onStart, onFinal, onPartial, onStop, onMe
     return !!(w.SpeechRecognition || w.webkitSpeechRecognition);
   }, []);
 
-  // Fetch Meet transcription data periodically when active
+  // Long-poll Meet transcription data while active: one request in flight, which the
+  // backend holds until a segment newer than the cursor arrives
   useEffect(() => {
-    let interval: NodeJS.Timeout | null = null;
+    if (!meetTranscriptionActive || !meetSessionId) {
+      // Reset cursor when stopping
+      lastSeqRef.current = 0;
+      return;
+    }
     
-    if (meetTranscriptionActive && meetSessionId) {
-      const fetchTranscriptions = async () => {
+    let cancelled = false;
+    const controller = new AbortController();
+    const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+    
+    const pollTranscriptions = async () => {
+      while (!cancelled) {
         try {
-          console.log(`[Meet Transcription] Fetching data for session: ${meetSessionId}`);
-          const response = await fetch(`${BACKEND_BASE}/meet/transcription/data/${meetSessionId}`);
+          console.log(`[Meet Transcription] Waiting for data for session: ${meetSessionId} since seq ${lastSeqRef.current}`);
+          // Only segments newer than the last one seen are returned
+          const response = await fetch(
+            `${BACKEND_BASE}/meet/transcription/data/${meetSessionId}?since=${lastSeqRef.current}&wait=20`,
+            { signal: controller.signal }
+          );
+          if (cancelled) return;
           if (response.ok) {
             const data = await response.json();
-            console.log(`[Meet Transcription] Received ${data.transcriptions?.length || 0} transcriptions, last count: ${lastTranscriptionCountRef.current}`);
+            const newTranscriptions = data.transcriptions || [];
+            console.log(`[Meet Transcription] Received ${newTranscriptions.length} new transcriptions, next seq: ${data.next_seq}`);
             
-            if (data.transcriptions && data.transcriptions.length > 0) {
-              setMeetTranscriptions(data.transcriptions);
+            if (newTranscriptions.length > 0) {
+              setMeetTranscriptions((prev) => [...prev, ...newTranscriptions].slice(-50));
               
-              // Send only new transcriptions to parent component
-              if (data.transcriptions.length > lastTranscriptionCountRef.current) {
-                const newTranscriptions = data.transcriptions.slice(lastTranscriptionCountRef.current);
-                console.log(`[Meet Transcription] Sending ${newTranscriptions.length} new transcriptions to parent`);
-                console.log(`[Meet Transcription] New transcriptions:`, newTranscriptions);
-                
-                newTranscriptions.forEach((transcription: any) => {
-                  if (onMeetTranscription) {
-                    console.log(`[Meet Transcription] Calling onMeetTranscription with:`, transcription.text);
-                    onMeetTranscription(transcription.text);
-                  } else {
-                    console.warn(`[Meet Transcription] onMeetTranscription callback not available!`);
-                  }
-                });
-                
-                lastTranscriptionCountRef.current = data.transcriptions.length;
-              } else {
-                console.log(`[Meet Transcription] No new transcriptions (current: ${data.transcriptions.length}, last: ${lastTranscriptionCountRef.current})`);
-              }
+              newTranscriptions.forEach((transcription: any) => {
+                if (onMeetTranscription) {
+                  console.log(`[Meet Transcription] Calling onMeetTranscription with:`, transcription.text);
+                  onMeetTranscription(transcription.text);
+                } else {
+                  console.warn(`[Meet Transcription] onMeetTranscription callback not available!`);
+                }
+              });
+            }
+            if (typeof data.next_seq === "number") {
+              lastSeqRef.current = data.next_seq;
             }
+            if (data.is_running === false) return;
+          } else if (response.status === 404) {
+            console.error("[Meet Transcription] Session not found; stopping polling");
+            return;
           } else {
             console.error(`[Meet Transcription] API error: ${response.status}`);
+            await sleep(2000);
           }
         } catch (err) {
+          if (cancelled) return;
           console.error("[Meet Transcription] Failed to fetch:", err);
+          await sleep(2000);
         }
-      };
-      
-      // Fetch immediately
-      fetchTranscriptions();
-      
-      // Then fetch every 2 seconds
-      interval = setInterval(fetchTranscriptions, 2000);
-    } else {
-      // Reset counter when stopping
-      lastTranscriptionCountRef.current = 0;
-    }
+      }
+    };
+    
+    pollTranscriptions();
     
     return () => {
-      if (interval) {
-        clearInterval(interval);
-      }
+      cancelled = true;
+      controller.abort();
     };
   }, [meetTranscriptionActive, meetSessionId, onMeetTranscription, BACKEND_BASE]);
 
+  // Keep the backend STT session alive while listening; idle sessions are closed by the server
+  useEffect(() => {
+    if (!listening || !sessionId) return;
+    const heartbeat = setInterval(() => {
+      fetch(`${BACKEND_BASE}/stt/session/heartbeat`, {
+        method: "POST",
+        headers: { 
+          "Content-Type": "application/json",
+          "User-Agent": "AarogyaAI-Frontend/1.0.0"
+        },
+        body: JSON.stringify({ session_id: sessionId }),
+      }).catch(() => {});
+    }, 60000);
+    return () => clearInterval(heartbeat);
+  }, [listening, sessionId, BACKEND_BASE]);
+
   const startAudioCapture = async (sessionId: string) => {
     try {
       console.log("[Audio Capture] Starting browser speech recognition with session:", sessionId);
@@ -208,7 +230,8 @@ export default function SpeechToText({ onStart, onFinal, onPartial, onStop, onMe
           },
           body: JSON.stringify({ 
             meet_url: "https://meet.google.com/gjv-yrwa-oop",
-            appointment_id: "current-appointment"
+            // The backend stores the Meet transcript under this appointment
+            appointment_id: appointmentId || undefined
           }),
         });
         
@@ -344,6 +344,7 @@ export default function DoctorPatientProfile() {
       </div>
 
       <SpeechToText
+        appointmentId={appointmentId}
         onStart={() => { setSessionBuffer(""); setPartial(""); }}
         onFinal={(text) => setSessionBuffer((prev) => (prev ? prev + " " : "") + text)}
         onPartial={(txt) => setPartial(txt)}
@@ -356,14 +357,13 @@ export default function DoctorPatientProfile() {
           setSessionBuffer("");
           setPartial("");
         }}
-        onMeetTranscription={async (text) => {
+        onMeetTranscription={(text) => {
           // Handle Meet transcriptions - add them directly to transcripts
           console.log("[Doctor Page] ===== Received Meet transcription =====");
           console.log("[Doctor Page] Text:", text);
           console.log("[Doctor Page] Current transcripts count:", transcripts.length);
           
-          await persistSessionTranscript(text);
-          
+          // Meet segments are persisted by the backend session, not here
           setTranscripts((prev) => {
             const updated = [...prev, { text }];
             console.log("[Doctor Page] Updated transcripts count:", updated.length);
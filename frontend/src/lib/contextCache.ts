@@ -0,0 +1,16 @@
+import { BACKEND_BASE } from "./constants";
+
+// Tell the backend to drop its cached chatbot context for a patient after
+// notes, prescriptions or transcripts change. Best-effort: the backend also
+// detects changes through its version stamp, so failures are ignored.
+export async function invalidatePatientContext(target: { patientId?: string; appointmentId?: string }) {
+  try {
+    await fetch(`${BACKEND_BASE}/ai/chatbot/context/invalidate`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ patient_id: target.patientId, appointment_id: target.appointmentId }),
+    });
+  } catch {
+    // Backend unreachable; the version stamp check will pick up the change
+  }
+}